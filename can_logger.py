@@ -1,11 +1,15 @@
 import argparse
 import struct
+import time
 from datetime import datetime as dt
 from typing import Union, Tuple, Dict
 
 from can import Bus, Message, SizedRotatingLogger
 
+from db.liveness import LivenessTracker
+from db.live import LivePublisher
 from db.db_service import DbService
+from db.models import ddl_models
 
 ########################################################################################################################
 # Configuration Parameters
@@ -15,6 +19,9 @@ interface = "pcan"  # Type of CAN Analyzer Device
 channel = "PCAN_USBBUS1"  # Channel of CAN Analyzer Device
 bitrate = 500000  # Bitrate of device
 file_size = 100000000  # Maximum size of a log file´in bytes
+rollup_interval = 10  # [s] Interval in which the logged messages are aggregated into the rollup tables
+publish_live = True  # Publish decoded messages to the dashboard directly, see db/live.py
+liveness_interval = 1  # [s] Interval in which inactive modules are detected and stored, see db/liveness.py
 
 bus = Bus(channel=channel, interface=interface, bitrate=bitrate)    # Bus instance
 ########################################################################################################################
@@ -41,6 +48,10 @@ class DatabaseLogger:
     def __init__(self):
         self.data_structs: Dict[Union[int, Tuple[int, ...]], Union[struct.Struct, Tuple, None]] = {}
         self.db = DbService()
+        self.live = LivePublisher() if publish_live else None
+        self.last_rollup: float = time.monotonic()
+        self.liveness = LivenessTracker(record_events=True)
+        self.last_liveness_check: float = time.monotonic()
 
         with open("type_lookup.txt", encoding="utf-8") as f:
             structs = f.readlines()
@@ -53,10 +64,28 @@ class DatabaseLogger:
     def on_message_received(self, msg: Message) -> None:
         key = msg.arbitration_id
         data_unpacked: Tuple = self.data_structs[key].unpack(msg.data)
+        if self.live is not None:
+            self.live.publish(key, data_unpacked, msg.timestamp)  # Before the insert, which takes much longer
         self.db.add_entry(key, data_unpacked, msg.timestamp)
+        self.liveness.seen(ddl_models[key].__tablename__, msg.timestamp)
+
+        # Outages are only detected while messages arrive. Their start is the last message of the module anyway
+        if time.monotonic() - self.last_liveness_check > liveness_interval:
+            self.liveness.check(time.time())
+            self.db.add_liveness_events(self.liveness.pop_events())
+            self.last_liveness_check = time.monotonic()
+
+        if time.monotonic() - self.last_rollup > rollup_interval:
+            self.db.update_rollups()
+            self.last_rollup = time.monotonic()
 
     def stop(self) -> None:
-        pass
+        self.db.update_rollups()
+        # The modules are not tracked anymore, their outages start at their last message
+        self.liveness.check(float("inf"))
+        self.db.add_liveness_events(self.liveness.pop_events())
+        if self.live is not None:
+            self.live.close()
 
 
 if __name__ == "__main__":
@@ -2,8 +2,10 @@ import dash_bootstrap_components as dbc
 
 from dash import Dash, dcc, html, Output, Input, page_container
 
+from frontend import downloads
 from frontend.styles import CONTENT_STYLE
 from frontend.sidebar import sidebar
+from frontend.sessions import SESSION_ID, new_session_id
 
 
 def layout() -> dbc.Container:
@@ -12,6 +14,8 @@ def layout() -> dbc.Container:
     content = html.Div(page_container, style=CONTENT_STYLE)
     return html.Div(
         [dcc.Location(id="url"), sidebar(), content,
+         # Identifies the browser tab, see frontend/sessions.py. A stored id takes precedence over the new one
+         dcc.Store(id=SESSION_ID, storage_type="session", data=new_session_id()),
          ])
 
 
@@ -22,7 +26,8 @@ def main():
                      dbc.themes.LUX, dbc.icons.BOOTSTRAP], use_pages=True, pages_folder="frontend", update_title=None)
 
     # set the global layout
-    app.layout: dbc.Container = layout()
+    app.layout = layout  # Called on every page load, so each session gets its own id
+    downloads.register(app.server)  # Exports of the Analyzer
 
     # runt
     app.run(debug=True, port=8080)
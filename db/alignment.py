@@ -0,0 +1,72 @@
+"""Align time series that are sampled independently (e.g. the four MPPTs) and combine them into a derived signal"""
+import numpy as np
+
+from pandas import DataFrame
+from typing import Callable, List, Sequence, Tuple
+
+Stream = Tuple[DataFrame, str]  # DataFrame with a 'timestamp' column and the name of its value column
+
+
+def nearest_indices(timestamps: np.ndarray, targets: np.ndarray, tolerance: float) -> np.ndarray:
+    """ Returns the index of the nearest timestamp for every target timestamp, or -1 if no timestamp lies within the
+        tolerance. Runs in O((n + m) log n) without Python loops.
+
+        Inputs:
+            timestamps (np.ndarray): Sorted timestamps (ascending or descending) to search in
+            targets (np.ndarray): Timestamps to search for, in any order
+            tolerance (float): Maximum distance between a target and its nearest timestamp (exclusive)
+
+        Returns:
+            np.ndarray: Indices into timestamps, -1 where no timestamp is close enough"""
+    n = len(timestamps)
+    if n == 0:
+        return np.full(len(targets), -1, dtype=np.int64)
+
+    descending = n > 1 and timestamps[0] > timestamps[-1]
+    ascending = timestamps[::-1] if descending else timestamps
+
+    # The nearest timestamp is either the first one at or after the target, or the one before it
+    right = np.clip(np.searchsorted(ascending, targets), 0, n - 1)
+    left = np.clip(right - 1, 0, n - 1)
+    nearest = np.where(np.abs(ascending[left] - targets) <= np.abs(ascending[right] - targets), left, right)
+
+    indices = (n - 1 - nearest) if descending else nearest
+    return np.where(np.abs(ascending[nearest] - targets) < tolerance, indices, -1)
+
+
+def align_streams(streams: Sequence[Stream], tolerance: float) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """ Sample all streams at the timestamps of the first stream, using the nearest entry of each stream
+
+        Inputs:
+            streams (Sequence[Stream]): The streams, the first one defines the timestamps of the result
+            tolerance (float): Maximum time offset between a timestamp and the entry of a stream [s]
+
+        Returns:
+            np.ndarray: The timestamps of the first stream
+            List[np.ndarray]: The values of each stream at these timestamps, NaN where no entry is close enough"""
+    timestamps = streams[0][0]['timestamp'].to_numpy(dtype=np.float64)
+
+    aligned = []
+    for df, col in streams:
+        indices = nearest_indices(df['timestamp'].to_numpy(dtype=np.float64), timestamps, tolerance)
+        values = df[col].to_numpy(dtype=np.float64)
+        aligned.append(np.where(indices >= 0, values[indices], np.nan))
+
+    return timestamps, aligned
+
+
+def combine_streams(streams: Sequence[Stream], tolerance: float, name: str,
+                    combine: Callable[[List[np.ndarray]], np.ndarray] = sum) -> DataFrame:
+    """ Compute a derived signal from several streams in one vectorized pass, e.g. the total power of the MPPTs
+
+        Inputs:
+            streams (Sequence[Stream]): The streams, the first one defines the timestamps of the result
+            tolerance (float): Maximum time offset between a timestamp and the entry of a stream [s]
+            name (str): Name of the value column of the result
+            combine (Callable): Combines the aligned values of all streams (default: sum)
+
+        Returns:
+            DataFrame: 'timestamp' and the derived value, in the order of the first stream. The value is NaN where a
+                stream has no entry close enough"""
+    timestamps, aligned = align_streams(streams, tolerance)
+    return DataFrame({'timestamp': timestamps, name: combine(aligned)})
@@ -0,0 +1,128 @@
+"""
+Archive of old raw data in compressed Parquet files, one per topic and (UTC) day: archive/<topic>/<YYYY-MM-DD>.parquet
+Archived entries are removed from the DB, the queries of DbService read them back transparently. The file of a day is
+written before its entries are deleted, so the queries drop entries that are in both (e.g. after a failed delete). The
+rollups (db/rollups.py) stay in the DB, so long ranges are still answered by the DB alone.
+"""
+import datetime
+import os
+
+import pandas as pd
+
+from pandas import DataFrame
+from sqlalchemy import Connection, delete, func, select
+from sqlalchemy.orm import declarative_base
+from typing import Iterator, List, Optional
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+ARCHIVE_DIR = "archive"  # Relative to the working directory, like db/.env
+ARCHIVE_AFTER: Optional[datetime.timedelta] = None  # Default age of the entries archived by 'db_utils.py -a'. Opt-in,
+                                                    # e.g. datetime.timedelta(days=7)
+COMPRESSION = "zstd"
+
+_DAY = 24 * 3600  # [s]
+
+
+def available() -> bool:
+    """ Parquet files need pyarrow, which is an optional dependency"""
+    try:
+        import pyarrow
+    except ImportError:
+        return False
+    return True
+
+
+def _require_pyarrow() -> None:
+    if not available():
+        raise ImportError("The archive needs additional modules: pip install pyarrow")
+
+
+def _day_of(timestamp: float) -> datetime.date:
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc).date()
+
+
+def _start_of(day: datetime.date) -> float:
+    return datetime.datetime(day.year, day.month, day.day, tzinfo=datetime.timezone.utc).timestamp()
+
+
+def archive_path(table_name: str, day: datetime.date) -> str:
+    return os.path.join(ARCHIVE_DIR, table_name, day.isoformat() + ".parquet")
+
+
+def archived_days(table_name: str, start_ts: float, end_ts: float) -> List[datetime.date]:
+    """ Returns the days between two timestamps that have an archive file"""
+    days = []
+    day, last_day = _day_of(start_ts), _day_of(end_ts)
+
+    while day <= last_day:
+        if os.path.exists(archive_path(table_name, day)):
+            days.append(day)
+        day += datetime.timedelta(days=1)
+
+    return days
+
+
+def archive_topic(conn: Connection, orm_model: declarative_base, before_ts: float) -> int:
+    """ Move the entries of a topic into the archive, one file per day. Only whole days before before_ts are moved.
+        Entries that are added to an archived day later on (e.g. by decoding a logfile) are merged into its file.
+
+        Inputs:
+            conn (Connection): Connection with an open transaction
+            orm_model (declarative_base): The ORM model of the topic
+            before_ts (float): Entries of days that end before this timestamp are archived
+
+        Returns:
+            int: Number of archived entries"""
+    _require_pyarrow()
+    cutoff = _start_of(_day_of(before_ts))
+    moved = 0
+
+    while True:
+        oldest = conn.execute(select(func.min(orm_model.timestamp))).scalar()
+        if oldest is None or oldest >= cutoff:
+            return moved
+
+        day = _day_of(oldest)
+        in_day = (orm_model.timestamp >= _start_of(day), orm_model.timestamp < _start_of(day) + _DAY)
+        df = pd.read_sql_query(sql=select(orm_model).where(*in_day), con=conn)
+
+        path = archive_path(orm_model.__tablename__, day)
+        if os.path.exists(path):
+            # A previous run may have been interrupted before deleting the entries, so they can be archived already.
+            # Entries are identified by id and timestamp, since SQLite tables of older versions reuse ids
+            df = (pd.concat([pd.read_parquet(path), df], ignore_index=True)
+                  .drop_duplicates(["id", "timestamp"], keep="last"))
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.sort_values("timestamp").to_parquet(path, compression=COMPRESSION, index=False)
+
+        moved += conn.execute(delete(orm_model).where(*in_day)).rowcount
+
+
+def iter_archive(orm_model: declarative_base, start_ts: float, end_ts: float) -> Iterator[DataFrame]:
+    """ Same as 'read_archive', but yields the entries day by day"""
+    days = archived_days(orm_model.__tablename__, start_ts, end_ts)
+    if days:
+        _require_pyarrow()
+
+    in_range = [("timestamp", ">=", start_ts), ("timestamp", "<=", end_ts)]
+    for day in days:
+        yield pd.read_parquet(archive_path(orm_model.__tablename__, day), filters=in_range)
+
+
+def read_archive(orm_model: declarative_base, start_ts: float, end_ts: float) -> Optional[DataFrame]:
+    """ Read the archived entries of a topic between two timestamps
+
+        Inputs:
+            orm_model (declarative_base): The ORM model of the topic
+            start_ts (float): Start of the range as unix timestamp
+            end_ts (float): Inclusive end of the range as unix timestamp
+
+        Returns:
+            DataFrame: The archived entries ordered by timestamp (oldest first), None if no day of the range is
+                archived"""
+    days = list(iter_archive(orm_model, start_ts, end_ts))
+    return pd.concat(days, ignore_index=True) if days else None
@@ -0,0 +1,80 @@
+"""asyncio access to the DB, used to run the queries of a dashboard refresh concurrently instead of one after another"""
+import asyncio
+
+from pandas import DataFrame
+from typing import Callable, Dict, Hashable, Optional
+
+from db import profiling
+from db.backends import POOL_SIZE
+from db.db_service import DbService
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+MAX_CONCURRENT_QUERIES = POOL_SIZE  # Queries of one refresh that run at the same time. Must not exceed the pool size
+
+Load = Callable[[DbService], Optional[DataFrame]]  # Function loading a DataFrame, e.g. 'load_speed_data' of load_data
+
+
+class AsyncDbService:
+    """ asyncio front end of DbService. Every call runs on a worker thread with its own DbService, i.e. its own session
+        and pooled connection, so several calls run concurrently in the DB.
+
+        The queries themselves stay synchronous: the load functions in db/load_data.py and pd.read_sql_query only work
+        with synchronous connections, and the DB drivers release the GIL while waiting for results anyway.
+
+            async with AsyncDbService() as db:
+                speed, soc = await asyncio.gather(db.run(load_speed_data, start, end, n_points),
+                                                  db.run(load_bms_soc_data, start, end, n_points))
+    """
+    def __init__(self, max_concurrent_queries: int = MAX_CONCURRENT_QUERIES, use_cache: bool = True):
+        self.use_cache = use_cache
+        self._semaphore = asyncio.Semaphore(max_concurrent_queries)
+
+    async def __aenter__(self) -> "AsyncDbService":
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+    def _run_sync(self, load: Callable, *args):
+        with DbService(use_cache=self.use_cache) as db_serv:
+            return load(db_serv, *args)
+
+    async def run(self, load: Callable, *args):
+        """ Run a function taking a DbService as first argument on a worker thread
+
+            Inputs:
+                load (Callable): The function, e.g. a load function of db/load_data.py or 'DbService.query_latest'
+                *args: Further arguments of the function
+
+            Returns:
+                The result of the function"""
+        async with self._semaphore:
+            return await asyncio.to_thread(self._run_sync, load, *args)
+
+    async def load_many(self, loads: Dict[Hashable, Load]) -> Dict[Hashable, Optional[DataFrame]]:
+        """ Run several loads concurrently. Takes as long as the slowest load, not as the sum of all loads.
+
+            Inputs:
+                loads (Dict[Hashable, Load]): Load functions by name
+
+            Returns:
+                Dict[Hashable, DataFrame]: The loaded DataFrames, by the same names"""
+        results = await asyncio.gather(*[self.run(load) for load in loads.values()])
+        return dict(zip(loads.keys(), results))
+
+
+def load_many(loads: Dict[Hashable, Load]) -> Dict[Hashable, Optional[DataFrame]]:
+    """ Synchronous entry point of 'AsyncDbService.load_many' for code without an event loop, e.g. dash callbacks"""
+    async def run() -> Dict[Hashable, Optional[DataFrame]]:
+        async with AsyncDbService() as db:
+            return await db.load_many(loads)
+
+    # The worker threads don't see the calling page on their stack
+    token = profiling.set_page(profiling.caller_page())
+    try:
+        return asyncio.run(run())
+    finally:
+        profiling.reset_page(token)
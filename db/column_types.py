@@ -0,0 +1,39 @@
+"""Column types of the generated models in db/models.py. The names are referenced by 'pysql_t' in utils/type_lookup.py"""
+from sqlalchemy import BigInteger, Float, Integer, SmallInteger, TypeDecorator
+from sqlalchemy.dialects import mysql
+
+########################################################################################################################
+# Data Fields
+########################################################################################################################
+
+# Integers are stored in the smallest column that holds the range of the CAN data type. MariaDB offers 1-byte and
+# unsigned integers, other backends fall back to the next larger standard type.
+_MYSQL = ("mysql", "mariadb")
+
+Float32 = Float()
+UInt8 = SmallInteger().with_variant(mysql.TINYINT(unsigned=True), *_MYSQL)
+Int8 = SmallInteger().with_variant(mysql.TINYINT(), *_MYSQL)
+UInt16 = Integer().with_variant(mysql.SMALLINT(unsigned=True), *_MYSQL)
+Int16 = SmallInteger()
+UInt32 = BigInteger().with_variant(mysql.INTEGER(unsigned=True), *_MYSQL)
+Int32 = Integer()
+
+
+########################################################################################################################
+# Timestamps
+########################################################################################################################
+
+class TimestampMicros(TypeDecorator):
+    """ Unix timestamp that is stored as integer microseconds, but read and written as float seconds like the default
+        'Double' timestamp column. Comparisons with floats (e.g. 'Model.timestamp >= 1693760165.2') are converted
+        automatically. Raw SQL on the column has to account for the 'scale' by itself."""
+    impl = BigInteger
+    cache_ok = True
+
+    scale: int = 1_000_000  # Stored units per second
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else round(value * self.scale)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else value / self.scale
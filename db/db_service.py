@@ -1,29 +1,110 @@
-"""Read environment variables and construct the connection string for MySQL DB"""
+"""Read environment variables and construct the connection string for the DB"""
 import datetime
+import functools
 import os
+import threading
+import time
+import numpy as np
 import pandas as pd
 
 # import all DDL classes
 from db.models import *
+from db.downsampling import bucket_frame, bucket_statement, data_columns, lttb_indices
+from db.query_cache import QueryCache, query_cache, LIVE_TTL, RANGE_TTL, RANGE_SETTLE_TIME
+from db.interval_cache import IntervalCache, interval_cache, align, quantize_width
+from db.backends import create_backend_engine
+from db.fetch import CHUNK_SIZE, Arrays, column_dtypes, fetch_arrays, iter_arrays, read_frame
+from db import archive, liveness, profiling, rollups, table_versions
 
 from dotenv import dotenv_values
 
-from sqlalchemy import create_engine, Engine, text, and_
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy import Engine, text, and_, or_, literal, null, select, union_all
+from sqlalchemy.orm import Session, configure_mappers
 from pandas import DataFrame
+from typing import Dict, Iterator, List, Optional
 
 import tkinter as tk
 from tkinter import filedialog
 
+LTTB_OVERSAMPLING = 4  # Buckets fetched per output point in the 'lttb' mode of 'query_downsampled'
+
+########################################################################################################################
+# Engines
+########################################################################################################################
+
+_engines: Dict[str, Engine] = {}  # Process-wide engines, keyed by connection string
+_engines_lock = threading.Lock()
+
+
+def get_engine(conn_string: str) -> Engine:
+    """ Return the process-wide engine for a connection string. The engine and its connection pool are only created
+        on the first call, which is also the only time the tables are created. See db/backends.py for the backends.
+
+        Inputs:
+            conn_string (str): SQLAlchemy connection string of the DB
+
+        Returns:
+            Engine: The shared engine"""
+    with _engines_lock:
+        engine = _engines.get(conn_string)
+
+        if engine is None:
+            engine = create_backend_engine(conn_string)
+            profiling.instrument(engine)
+            Base.metadata.create_all(bind=engine)
+            _engines[conn_string] = engine
+
+        return engine
+
+
+@functools.lru_cache
+def read_env(path: str) -> dict:
+    """ Read an env file once per process """
+    return dotenv_values(path)
+
+
+def _in_archive(ids, timestamps, archived_keys: pd.MultiIndex) -> np.ndarray:
+    """ Returns which entries are archived already, i.e. still in the DB since deleting them after archiving failed.
+        Entries are identified by id and timestamp, since ids of SQLite tables created by older versions are reused
+        after a table was emptied """
+    return pd.MultiIndex.from_arrays([np.asarray(ids), np.asarray(timestamps)]).isin(archived_keys)
+
+
+def _archive_keys(archived: DataFrame) -> pd.MultiIndex:
+    return pd.MultiIndex.from_arrays([archived["id"].to_numpy(), archived["timestamp"].to_numpy()])
+
 
 class DbService:
-    """ Class to handle all DB related operations """
-    def __init__(self, out_of_folder:bool=False):
-        self.engine: Engine = create_engine(self.conn_string(out_of_folder=out_of_folder))
+    """ Class to handle all DB related operations. All instances of a process share the same engine, so creating a
+        DbService is cheap. Use it as a context manager to return its connection to the pool afterwards:
+
+            with DbService() as db_serv:
+                db_serv.query_latest(...)
+    """
+    def __init__(self, out_of_folder:bool=False, use_cache:bool=True):
+        self.engine: Engine = get_engine(self.conn_string(out_of_folder=out_of_folder))
         self.session: Session = self.create_session()
 
+        # Query results are shared with the other instances of the process for a short time, see db/query_cache.py
+        self.cache: Optional[QueryCache] = query_cache if use_cache else None
+        # Buckets of downsampled queries, kept per loaded time interval, see db/interval_cache.py
+        self.interval_cache: Optional[IntervalCache] = interval_cache if use_cache else None
+        self.pending_tables: set = set()  # Tables with added entries that are not committed yet
+        self.pending_past_tables: set = set()  # Pending tables with entries that lie in the past, see
+                                               # db/table_versions.py
+        self.unrolled: Dict[declarative_base, float] = {}  # Models with entries that are not rolled up yet, mapped to
+                                                           # the oldest timestamp of these entries
+
+    def __enter__(self) -> "DbService":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
     def conn_string(self, out_of_folder:bool=False) -> str:
-        """ Read the environment variables and construct the connection string for MySQL DB"""
+        """ Read the environment variables and construct the connection string for the DB. If DB_URL is set, it is
+            used as is (e.g. 'sqlite:///logs/ace.db'), otherwise the MySQL DB given by DB_USER, DB_PASSWORD, DB_HOST
+            and DB_NAME is used."""
         # Special case for Strategy when running on a different folder
         if out_of_folder:
             root = tk.Tk()
@@ -46,7 +127,10 @@ class DbService:
 
         # Normal case
         else:
-            env = dotenv_values("db/.env")
+            env = read_env("db/.env")
+
+        if env.get("DB_URL"):
+            return env["DB_URL"]
 
         return "mysql+pymysql://%s:%s@%s/%s" % (
             env["DB_USER"],
@@ -56,20 +140,30 @@ class DbService:
         )
 
     def create_session(self) -> Session:
-        """ Create a session to the DB"""
-        Base.metadata.create_all(bind=self.engine)
+        """ Create a session to the DB. The tables are already created together with the engine"""
+        return Session(bind=self.engine)
 
-        Session = sessionmaker(bind=self.engine)
-        return Session()
+    def close(self) -> None:
+        """ Close the session and return its connection to the pool"""
+        self.session.close()
 
     def refresh(self) -> None:
         """ Refresh the DB by dropping all tables and creating them again"""
-        Base.metadata.reflect(bind=self.engine)
+        # Reflection also drops tables of topics that were removed from the tree. DuckDB does not support reflection.
+        if self.engine.dialect.name != "duckdb":
+            Base.metadata.reflect(bind=self.engine)
         Base.metadata.drop_all(bind=self.engine)
 
         Base.metadata.create_all(bind=self.engine)
 
         self.session.commit()
+        self._clear_caches()
+
+    def create_indexes(self) -> None:
+        """ Create the indexes of the models on tables that were created before the index was added to the model"""
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=self.engine, checkfirst=True)
 
     def add_entry(self, can_id: int, unpacked_data: tuple, timestamp: float, commit_session: bool = True) -> None:
         """ Add an entry to the DB
@@ -84,15 +178,141 @@ class DbService:
         entry: model = model(unpacked_data, timestamp)
 
         self.session.add(entry)
+        self.pending_tables.add(model.__tablename__)
+        if timestamp < time.time() - RANGE_SETTLE_TIME:
+            self.pending_past_tables.add(model.__tablename__)
+        self.unrolled[model] = min(self.unrolled.get(model, timestamp), timestamp)
 
         # commit can also be done manually by calling the function "commit_session()", see below
         if commit_session:
-            self.session.commit()
+            self.commit_session()
 
     def commit_session(self):
         """ Commit the session to the DB"""
+        # Other processes may have cached results of past ranges of these tables, see db/table_versions.py
+        if self.pending_past_tables:
+            table_versions.bump(self.session.connection(), self.pending_past_tables)
         self.session.commit()
 
+        # Cached results of the changed tables are outdated now
+        self._invalidate(self.pending_tables)
+        self.pending_tables.clear()
+        self.pending_past_tables.clear()
+
+    def update_rollups(self, all_models: bool = False) -> None:
+        """ Aggregate the committed entries into the rollup tables (see db/rollups.py). Call this periodically while
+            logging, not after every entry.
+
+            Inputs:
+                all_models (bool): Update the rollups of all models, not only of those with entries added by this
+                    instance (e.g. to build the rollups of an existing DB)"""
+        models = list(ddl_models.values()) if all_models else list(self.unrolled)
+
+        settled_until = time.time() - RANGE_SETTLE_TIME
+        with self.engine.begin() as conn:
+            for model in models:
+                rollups.update_rollups(conn, model)
+
+            # Rollups of past ranges changed, see db/table_versions.py
+            table_versions.bump(conn, [model.__tablename__ for model, since_ts in self.unrolled.items()
+                                       if since_ts < settled_until])
+
+        self.unrolled.clear()
+        self._invalidate([model.__tablename__ for model in models])
+
+    def add_liveness_events(self, events: List[liveness.Event]) -> None:
+        """ Store transitions of the liveness of the modules (see db/liveness.py)
+
+            Inputs:
+                events (List[Event]): The transitions, e.g. from 'LivenessTracker.pop_events'"""
+        if not events:
+            return
+
+        with self.engine.begin() as conn:
+            liveness.write_events(conn, events)
+        self._invalidate([liveness.events_table.name])
+
+    def query_liveness_events(self, start_time: datetime.datetime, end_time: datetime.datetime) -> DataFrame:
+        """ Query the transitions of the liveness of the modules within a time range, plus the state of each module at
+            its start. Pass the result to 'liveness.outages' or 'liveness.uptime_report' for reports
+
+            Inputs:
+                start_time (datetime): Start of the range
+                end_time (datetime): End of the range
+
+            Returns:
+                DataFrame: The transitions, oldest first"""
+        with self.engine.connect() as conn:
+            return liveness.read_events(conn, start_time.timestamp(), end_time.timestamp())
+
+    def apply_retention(self, retention: datetime.timedelta) -> int:
+        """ Delete raw entries of all models that are older than the retention time and already rolled up. Queries of
+            such ranges are answered from the rollups.
+
+            Inputs:
+                retention (datetime.timedelta): Minimum age of deleted entries
+
+            Returns:
+                int: Number of deleted entries"""
+        with self.engine.begin() as conn:
+            deleted = sum(rollups.apply_retention(conn, model, retention) for model in ddl_models.values())
+
+        self._clear_caches()
+        return deleted
+
+    def move_to_archive(self, older_than: datetime.timedelta) -> int:
+        """ Move the entries of all models that are older than the given age into the Parquet archive (see
+            db/archive.py). The rollups are updated first, so they still cover the archived entries.
+
+            Inputs:
+                older_than (datetime.timedelta): Minimum age of archived entries
+
+            Returns:
+                int: Number of archived entries"""
+        self.update_rollups(all_models=True)
+
+        before_ts = time.time() - older_than.total_seconds()
+        with self.engine.begin() as conn:
+            moved = 0
+            for model in ddl_models.values():
+                moved += archive.archive_topic(conn, model, before_ts)
+                rollups.mark_pruned(conn, model, before_ts)  # Archived entries are not in the raw table anymore
+
+        self._clear_caches()
+        return moved
+
+    def _invalidate(self, table_names) -> None:
+        """ Remove the cached results of tables with changed entries"""
+        for table_name in table_names:
+            if self.cache is not None:
+                self.cache.invalidate(table_name)
+            if self.interval_cache is not None:
+                self.interval_cache.invalidate(table_name)
+
+    def _clear_caches(self) -> None:
+        if self.cache is not None:
+            self.cache.clear()
+        if self.interval_cache is not None:
+            self.interval_cache.clear()
+
+    def _sync_caches(self) -> None:
+        """ Remove the cached results of tables that other processes changed in the past, see db/table_versions.py"""
+        if self.cache is not None or self.interval_cache is not None:
+            table_versions.watcher.sync(self.engine, lambda table_name: self._invalidate([table_name]))
+
+    def _cached(self, key: tuple, ttl: float, load):
+        """ Returns the cached result of a query, or runs the query by calling 'load' and caches its result. The first
+            element of the key is a tuple of the queried table names"""
+        if self.cache is None:
+            return load()
+        self._sync_caches()
+        return self.cache.get_or_load(key, ttl, load)
+
+    @staticmethod
+    def _range_ttl(end_time: datetime.datetime) -> float:
+        """ Ranges in the past do not change anymore and can be cached longer than ranges that reach up to now"""
+        return RANGE_TTL if end_time.timestamp() < time.time() - RANGE_SETTLE_TIME else LIVE_TTL
+
     def query_latest(self, orm_model: declarative_base, num_entries: int) -> DataFrame:
         """ Query the latest entries from the DB
 
@@ -102,13 +322,14 @@ class DbService:
 
             Returns:
                 DataFrame: The queried entries"""
-        
-        with self.engine.connect() as conn:
-            return pd.read_sql_query(
-                sql=self.session.query(orm_model).order_by(
-                    orm_model.timestamp.desc()).limit(num_entries).statement,
-                con=conn,
-            )
+        def load() -> DataFrame:
+            with self.engine.connect() as conn:
+                return read_frame(conn,
+                                  self.session.query(orm_model).order_by(
+                                      orm_model.timestamp.desc()).limit(num_entries).statement,
+                                  column_dtypes(orm_model))
+
+        return self._cached(((orm_model.__tablename__,), "latest_n", num_entries), LIVE_TTL, load)
 
     def latest(self, orm_model: declarative_base):
         """ Query the latest entry from the DB
@@ -118,16 +339,122 @@ class DbService:
 
             Returns:
                 DataFrame: The queried entry"""
-        with self.engine.connect() as conn:
-            return self.session.query(orm_model).order_by(
-                orm_model.timestamp.desc()).first()
+        def load():
+            entry = self.session.query(orm_model).order_by(orm_model.timestamp.desc()).first()
+            if entry is not None:
+                self.session.expunge(entry)  # The entry may be shared with other sessions through the cache
+            return entry
+
+        return self._cached(((orm_model.__tablename__,), "latest"), LIVE_TTL, load)
           
+    def latest_many(self, orm_models: List[declarative_base]) -> Dict[declarative_base, Optional[declarative_base]]:
+        """ Query the latest entry of several models in a single round trip
+
+            Inputs:
+                orm_models (List[declarative_base]): The ORM models to be queried
+
+            Returns:
+                Dict: The latest entry of each model, keyed by model. None if the table is empty"""
+        latest_entries = {orm_model: None for orm_model in orm_models}
+        if not orm_models:
+            return latest_entries
+
+        # The tables have different columns, pad each select with NULL to the union of all columns
+        col_names = list(dict.fromkeys(c.name for orm_model in orm_models for c in orm_model.__table__.columns))
+
+        selects = []
+        for model_idx, orm_model in enumerate(orm_models):
+            newest = (select(*orm_model.__table__.columns)
+                      .order_by(orm_model.timestamp.desc(), orm_model.id.desc()).limit(1).subquery())
+            selects.append(select(literal(model_idx).label("model_idx"),
+                                  *[newest.c[name] if name in newest.c else null().label(name) for name in col_names]))
+
+        def load() -> list:
+            with self.engine.connect() as conn:
+                return conn.execute(union_all(*selects)).all()
+
+        rows = self._cached((tuple(orm_model.__tablename__ for orm_model in orm_models), "latest_many"), LIVE_TTL,
+                            load)
+
+        # Rebuild (transient) ORM objects, as returned by 'latest'
+        configure_mappers()
+        for row in rows:
+            orm_model = orm_models[row.model_idx]
+            entry = orm_model.__mapper__.class_manager.new_instance()
+            for column in orm_model.__table__.columns:
+                setattr(entry, column.name, row._mapping[column.name])
+            latest_entries[orm_model] = entry
+
+        return latest_entries
+
+    def query_latest_many(self, orm_models: List[declarative_base], num_entries: int) -> Arrays:
+        """ Query the latest entries of several models in a single round trip, into one NumPy array per column (see
+            db/fetch.py). The result is shared through the cache, don't modify the arrays.
+
+            Inputs:
+                orm_models (List[declarative_base]): The ORM models to be queried
+                num_entries (int): The number of entries per model
+
+            Returns:
+                Arrays: The columns of all models, padded with NaN where a model lacks a column. The column
+                    'model_idx' holds the index of the model of each entry in orm_models"""
+        col_names = list(dict.fromkeys(c.name for orm_model in orm_models for c in orm_model.__table__.columns))
+        dtypes = {"model_idx": "int64", "id": "int64", "timestamp": "float64"}  # Data columns may be NULL: float64
+
+        selects = []
+        for model_idx, orm_model in enumerate(orm_models):
+            newest = (select(*orm_model.__table__.columns)
+                      .order_by(orm_model.timestamp.desc(), orm_model.id.desc()).limit(num_entries).subquery())
+            selects.append(select(literal(model_idx).label("model_idx"),
+                                  *[newest.c[name] if name in newest.c else null().label(name) for name in col_names]))
+
+        def load() -> Arrays:
+            if not selects:
+                return {name: np.empty(0, dtype=dtypes.get(name, "float64")) for name in ["model_idx"] + col_names}
+            with self.engine.connect() as conn:
+                return fetch_arrays(conn, union_all(*selects), dtypes)
+
+        return self._cached((tuple(orm_model.__tablename__ for orm_model in orm_models), "latest_many_n", num_entries),
+                            LIVE_TTL, load)
+
+    def query_since(self, orm_model: declarative_base, last_timestamp: float, last_id: Optional[int] = None,
+                    limit: Optional[int] = None) -> DataFrame:
+        """ Query the entries that were added after a cursor, e.g. the newest entry of the previous query
+
+            Inputs:
+                orm_model (declarative_base): The ORM model to be queried
+                last_timestamp (float): Timestamp of the cursor
+                last_id (int): Id of the cursor. If given, entries with the same timestamp but a larger id are included
+                limit (int): Maximum number of entries, counted from the cursor. Unlimited if None
+
+            Returns:
+                DataFrame: The queried entries, newest first"""
+        if last_id is None:
+            newer = orm_model.timestamp > last_timestamp
+        else:
+            newer = or_(orm_model.timestamp > last_timestamp,
+                        and_(orm_model.timestamp == last_timestamp, orm_model.id > last_id))
+
+        # Walk the (timestamp, id) index upwards from the cursor, so a limit keeps the entries right after the cursor
+        statement = (self.session.query(orm_model).filter(newer)
+                     .order_by(orm_model.timestamp.asc(), orm_model.id.asc()).limit(limit).statement)
+
+        def load() -> DataFrame:
+            with self.engine.connect() as conn:
+                return read_frame(conn, statement, column_dtypes(orm_model))[::-1].reset_index(drop=True)
+
+        return self._cached(((orm_model.__tablename__,), "since", last_timestamp, last_id, limit), LIVE_TTL, load)
+
     def query_latest_from_time(self, orm_model: declarative_base, start_time: datetime.datetime):
-        with self.engine.connect() as conn:
-            return pd.read_sql_query(sql=self.session.query(orm_model)
-                                     .filter(and_(orm_model.timestamp >= start_time.timestamp()))
-                                     .order_by(orm_model.timestamp.desc()).statement,
-                                     con=conn)
+        def load() -> DataFrame:
+            with self.engine.connect() as conn:
+                return read_frame(conn,
+                                  self.session.query(orm_model)
+                                  .filter(and_(orm_model.timestamp >= start_time.timestamp()))
+                                  .order_by(orm_model.timestamp.desc()).statement,
+                                  column_dtypes(orm_model))
+
+        return self._cached(((orm_model.__tablename__,), "from_time", start_time.timestamp()), LIVE_TTL, load)
 
     def query(self, orm_model: declarative_base, start_time: datetime.datetime, end_time: datetime.datetime, loading_interval: int):
         """ Query the entries from the DB between two timestamps
@@ -140,11 +467,203 @@ class DbService:
 
             Returns:
                 DataFrame: The queried entries"""
-        
+        def load() -> DataFrame:
+            with self.engine.connect() as conn:
+                df = read_frame(conn,
+                                self.session.query(orm_model)
+                                .filter(and_(orm_model.timestamp >= start_time.timestamp(),
+                                             orm_model.timestamp <= end_time.timestamp(),
+                                             orm_model.id % loading_interval == 0))
+                                .order_by(orm_model.timestamp.desc()).statement,
+                                column_dtypes(orm_model))
+
+            # Older entries may have been moved into the archive
+            archived = archive.read_archive(orm_model, start_time.timestamp(), end_time.timestamp())
+            if archived is None or archived.empty:
+                return df
+
+            # An entry is in both if deleting it after archiving failed
+            df = df[~_in_archive(df["id"], df["timestamp"], _archive_keys(archived))]
+            archived = archived[archived["id"] % loading_interval == 0]
+            return (pd.concat([df, archived], ignore_index=True)
+                    .sort_values("timestamp", ascending=False, ignore_index=True))
+
+        return self._cached(((orm_model.__tablename__,), "range", start_time.timestamp(), end_time.timestamp(),
+                             loading_interval), self._range_ttl(end_time), load)
+
+    def query_arrays(self, orm_model: declarative_base, start_time: datetime.datetime,
+                     end_time: datetime.datetime) -> Arrays:
+        """ Query all entries from the DB between two timestamps into one NumPy array per column, without building a
+            DataFrame (see db/fetch.py). Use this for large ranges that are processed numerically. The result is not
+            cached.
+
+            Inputs:
+                orm_model (declarative_base): The ORM model to be queried
+                start_time (datetime.datetime): The start timestamp
+                end_time (datetime.datetime): The end timestamp
+
+            Returns:
+                Arrays: The queried columns by name, ordered by timestamp (oldest first)"""
+        dtypes = column_dtypes(orm_model)
+
         with self.engine.connect() as conn:
-            return pd.read_sql_query(sql=self.session.query(orm_model)
-                                     .filter(and_(orm_model.timestamp >= start_time.timestamp(),
-                                                  orm_model.timestamp <= end_time.timestamp(),
-                                                  orm_model.id % loading_interval == 0))
-                                     .order_by(orm_model.timestamp.desc()).statement,
-                                     con=conn)
+            arrays = fetch_arrays(conn,
+                                  select(orm_model.__table__)
+                                  .where(orm_model.timestamp >= start_time.timestamp(),
+                                         orm_model.timestamp <= end_time.timestamp())
+                                  .order_by(orm_model.timestamp),
+                                  dtypes)
+
+        # Older entries may have been moved into the archive
+        archived = archive.read_archive(orm_model, start_time.timestamp(), end_time.timestamp())
+        if archived is not None and not archived.empty:
+            in_db = ~_in_archive(arrays["id"], arrays["timestamp"], _archive_keys(archived))  # Failed deletes
+            arrays = {name: np.concatenate([archived[name].to_numpy(dtype=values.dtype), values[in_db]])
+                      for name, values in arrays.items()}
+
+        return arrays
+
+    def query_chunks(self, orm_model: declarative_base, start_time: datetime.datetime, end_time: datetime.datetime,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[DataFrame]:
+        """ Query all entries from the DB between two timestamps in chunks, e.g. for statistics or exports of long
+            ranges. The entries are streamed from a server side cursor, so the memory used does not depend on the length
+            of the range. The result is not cached.
+
+            Inputs:
+                orm_model (declarative_base): The ORM model to be queried
+                start_time (datetime.datetime): The start timestamp
+                end_time (datetime.datetime): The end timestamp
+                chunk_size (int): Maximum number of entries per chunk
+
+            Returns:
+                Iterator[DataFrame]: The queried entries, chunk by chunk ordered by timestamp (oldest first)"""
+        start_ts, end_ts = start_time.timestamp(), end_time.timestamp()
+
+        # Older entries may have been moved into the archive
+        archived_keys = None
+        for archived in archive.iter_archive(orm_model, start_ts, end_ts):
+            keys = _archive_keys(archived)
+            archived_keys = keys if archived_keys is None else archived_keys.append(keys)
+            for i in range(0, len(archived.index), chunk_size):
+                yield archived.iloc[i:i + chunk_size].reset_index(drop=True)
+
+        # A separate connection, since the session may be used while the chunks are processed
+        with self.engine.connect() as conn:
+            for arrays in iter_arrays(conn,
+                                      select(orm_model.__table__)
+                                      .where(orm_model.timestamp >= start_ts, orm_model.timestamp <= end_ts)
+                                      .order_by(orm_model.timestamp),
+                                      column_dtypes(orm_model), chunk_size):
+                chunk = DataFrame(arrays, copy=False)
+                if archived_keys is not None:
+                    chunk = chunk[~_in_archive(arrays["id"], arrays["timestamp"], archived_keys)].reset_index(drop=True)
+                if not chunk.empty:
+                    yield chunk
+
+    def query_downsampled(self, orm_model: declarative_base, start_time: datetime.datetime,
+                          end_time: datetime.datetime, n_points: int, mode: str = "bucket") -> DataFrame:
+        """ Query the entries from the DB between two timestamps, reduced to at most n_points rows. The range is split
+            into n_points time buckets, which are aggregated by the DB. Each returned row holds the last entry of its
+            bucket, the number of entries ('count') and the minimum, maximum and mean of every data column (e.g.
+            'speed_min', 'speed_max', 'speed_mean'), so spikes are preserved.
+
+            Inputs:
+                orm_model (declarative_base): The ORM model to be queried
+                start_time (datetime.datetime): The start timestamp
+                end_time (datetime.datetime): The end timestamp
+                n_points (int): The maximum number of returned rows. The range is extended to whole buckets, which may
+                    add one row
+                mode (str): 'bucket' returns all buckets. 'lttb' fetches finer buckets and selects the n_points buckets
+                    that preserve the shape of the first data column best (Largest-Triangle-Three-Buckets)
+
+            Returns:
+                DataFrame: The queried entries, newest first"""
+        if mode not in ("bucket", "lttb"):
+            raise ValueError("Unknown downsampling mode '%s', expected 'bucket' or 'lttb'" % mode)
+
+        # The bucket width is rounded up to one of the widths of db/interval_cache.py and the buckets start at
+        # multiples of it, so buckets of overlapping ranges are the same and only the missing ones are loaded
+        n_buckets = max(n_points, 1) * (LTTB_OVERSAMPLING if mode == "lttb" else 1)
+        start_ts, end_ts = start_time.timestamp(), end_time.timestamp()
+        bucket_width = quantize_width(max(end_ts - start_ts, 1e-6) / n_buckets)
+
+        def load(interval_start: float, interval_end: float) -> DataFrame:
+            with self.engine.connect() as conn:
+                return self._read_buckets(conn, orm_model, interval_start, np.nextafter(interval_end, -np.inf),
+                                          bucket_width)
+
+        self._sync_caches()
+        if self.interval_cache is None:
+            df = load(*align(start_ts, end_ts, bucket_width))
+        else:
+            df = self.interval_cache.get_or_load(orm_model.__tablename__, bucket_width, start_ts, end_ts, load,
+                                                 settled_until=time.time() - RANGE_SETTLE_TIME)
+
+        if mode == "lttb" and len(df.index) > n_points:
+            y_col = data_columns(orm_model)[0].name + "_mean"
+            df = df.iloc[lttb_indices(df["timestamp"].values, df[y_col].values, n_points)].reset_index(drop=True)
+
+        return df
+
+    @staticmethod
+    def _read_buckets(conn, orm_model: declarative_base, start_ts: float, end_ts: float,
+                      bucket_width: float) -> DataFrame:
+        """ Read the buckets of a range from the coarsest rollup that is fine enough for the bucket width. The part of
+            the range that is not rolled up yet (i.e. the newest data) is read from the raw table."""
+        dtypes = column_dtypes(orm_model)
+        rollup = rollups.pick_rollup(orm_model, bucket_width)
+        covered_until = None if rollup is None else rollups.last_bucket(conn, rollup)
+
+        # Entries before the oldest rollup bucket (e.g. archived before the rollups were built) are not rolled up
+        covered_from = None if covered_until is None else rollups.first_bucket(conn, rollup)
+        uncovered = covered_from is not None and start_ts < covered_from and (
+            conn.execute(select(orm_model.id).where(orm_model.timestamp >= start_ts,
+                                                    orm_model.timestamp < covered_from).limit(1)).first() is not None
+            or archive.archived_days(orm_model.__tablename__, start_ts, covered_from))
+
+        if covered_until is None or covered_until <= start_ts or uncovered:
+            archived = archive.read_archive(orm_model, start_ts, end_ts)
+            if archived is None or archived.empty:
+                return read_frame(conn, bucket_statement(orm_model, start_ts, end_ts, bucket_width), dtypes)
+
+            # The raw table only holds a part of the range, the buckets are built after fetching both parts. Ranges
+            # that need raw entries are short, since longer ones are read from the rollups.
+            df = read_frame(conn, select(orm_model).where(orm_model.timestamp >= start_ts,
+                                                          orm_model.timestamp <= end_ts), dtypes)
+            df = (pd.concat([archived, df], ignore_index=True).drop_duplicates(["id", "timestamp"], keep="last")
+                  if not df.empty else archived)
+            return bucket_frame(df, [c.name for c in data_columns(orm_model)], start_ts, bucket_width)
+
+        # Buckets start at a bucket of the rollup, which may add up to one rollup resolution before the range
+        resolution = rollup.info["resolution"]
+        origin_ts = start_ts - start_ts % resolution
+
+        # The newest rollup bucket may be incomplete, it is read from the raw table instead
+        rolled_up_until = min(end_ts, covered_until - resolution)
+        rolled_up = read_frame(conn,
+                               rollups.rollup_bucket_statement(rollup, origin_ts, rolled_up_until, bucket_width,
+                                                               with_bucket=True),
+                               dtypes)
+        if end_ts < covered_until:
+            return rolled_up.drop(columns="bucket")
+
+        raw = read_frame(conn,
+                         bucket_statement(orm_model, covered_until, end_ts, bucket_width, origin_ts=origin_ts,
+                                          with_bucket=True),
+                         dtypes)
+        if rolled_up.empty or raw.empty:
+            return (raw if rolled_up.empty else rolled_up).drop(columns="bucket")
+
+        # A bucket may be split between the rollup and the raw part. Merge its rows, the raw row holds the last entry
+        if raw["bucket"].iloc[-1] == rolled_up["bucket"].iloc[0]:
+            first, last, row = rolled_up.iloc[0], raw.iloc[-1], raw.index[-1]
+            count = int(first["count"]) + int(last["count"])
+            for name in [c.name for c in data_columns(orm_model)]:
+                raw.loc[row, name + "_min"] = min(float(first[name + "_min"]), float(last[name + "_min"]))
+                raw.loc[row, name + "_max"] = max(float(first[name + "_max"]), float(last[name + "_max"]))
+                raw.loc[row, name + "_mean"] = (float(first[name + "_mean"]) * int(first["count"]) +
+                                                float(last[name + "_mean"]) * int(last["count"])) / count
+            raw.loc[row, "count"] = count
+            rolled_up = rolled_up.iloc[1:]
+
+        return pd.concat([raw, rolled_up], ignore_index=True).drop(columns="bucket")
@@ -0,0 +1,177 @@
+"""Reduce time series to a bounded number of points, either in SQL (time buckets) or after fetching (buckets, LTTB)"""
+import numpy as np
+import pandas as pd
+
+from pandas import DataFrame
+from sqlalchemy import Double, Select, func, select, type_coerce
+from sqlalchemy.orm import declarative_base
+from typing import List, Optional, Tuple
+
+from db.column_types import TimestampMicros
+
+AGGREGATES = ("min", "max", "mean")  # Suffixes of the aggregated columns, e.g. 'speed_min'
+
+
+def data_columns(orm_model: declarative_base) -> List:
+    """ Returns the columns of a model that hold CAN data, i.e. all except 'id' and 'timestamp'"""
+    return [c for c in orm_model.__table__.columns if c.name not in ("id", "timestamp")]
+
+
+def raw_timestamp(orm_model: declarative_base) -> Tuple[any, float]:
+    """ Returns the timestamp column as stored in the DB together with the number of stored units per second. Use this
+        for arithmetic in SQL, since bound values of such expressions are not converted by the column type."""
+    column_type = orm_model.__table__.c.timestamp.type
+
+    if isinstance(column_type, TimestampMicros):
+        return type_coerce(orm_model.timestamp, Double()), column_type.scale
+
+    return orm_model.timestamp, 1
+
+
+def bucket_statement(orm_model: declarative_base, start_ts: float, end_ts: Optional[float], bucket_width: float,
+                     origin_ts: Optional[float] = None, with_bucket: bool = False) -> Select:
+    """ Builds a query that groups the rows between two timestamps into buckets of equal duration. Each bucket is
+        returned as one row containing the last entry of the bucket, the number of entries ('count') and the minimum,
+        maximum and mean of every data column ('<column>_min', '<column>_max', '<column>_mean').
+
+        Inputs:
+            orm_model (declarative_base): The ORM model to be queried
+            start_ts (float): Start of the queried range as unix timestamp
+            end_ts (float): Inclusive end of the queried range as unix timestamp. Open end if None
+            bucket_width (float): Duration of a bucket in seconds
+            origin_ts (float): Start of the first bucket as unix timestamp. Same as start_ts if None
+            with_bucket (bool): Also return the index of the bucket, counted from origin_ts ('bucket')
+
+        Returns:
+            Select: The query, ordered by timestamp (newest first)"""
+    fields = data_columns(orm_model)
+    timestamp, scale = raw_timestamp(orm_model)
+    origin_ts = start_ts if origin_ts is None else origin_ts
+
+    bucket = func.floor((timestamp - origin_ts * scale) / (bucket_width * scale)).label("bucket")
+
+    aggregates = [func.count().label("count"),
+                  func.max(orm_model.id).label("last_id")]  # ids increase with insertion, i.e. with time per topic
+    for field in fields:
+        aggregates += [func.min(field).label(field.name + "_min"),
+                       func.max(field).label(field.name + "_max"),
+                       func.avg(field).label(field.name + "_mean")]
+
+    in_range = [orm_model.timestamp >= start_ts]
+    if end_ts is not None:
+        in_range.append(orm_model.timestamp <= end_ts)
+
+    buckets = (select(bucket, *aggregates)
+               .where(*in_range)
+               .group_by(bucket)
+               .subquery())
+
+    # Join the last entry of each bucket to get its timestamp and values
+    return (select(orm_model.id, orm_model.timestamp, *fields,
+                   *[c for c in buckets.c if c.name not in ("bucket", "last_id")],
+                   *([buckets.c.bucket] if with_bucket else []))
+            .join_from(buckets, orm_model, orm_model.id == buckets.c.last_id)
+            .order_by(orm_model.timestamp.desc()))
+
+
+def bucket_frame(df: DataFrame, fields: List[str], start_ts: float, bucket_width: float,
+                 origin_ts: Optional[float] = None) -> DataFrame:
+    """ Same as 'bucket_statement', but groups rows that were already fetched (e.g. from the archive)
+
+        Inputs:
+            df (DataFrame): Rows of the model, including 'id' and 'timestamp'
+            fields (List[str]): Names of the data columns
+            start_ts (float): Start of the range as unix timestamp
+            bucket_width (float): Duration of a bucket in seconds
+            origin_ts (float): Start of the first bucket as unix timestamp. Same as start_ts if None
+
+        Returns:
+            DataFrame: One row per bucket, ordered by timestamp (newest first)"""
+    origin_ts = start_ts if origin_ts is None else origin_ts
+    groups = df.groupby(np.floor((df["timestamp"] - origin_ts) / bucket_width).rename("bucket"))
+
+    aggregates = groups[fields].agg(["min", "max", "mean"])
+    aggregates.columns = [field + "_" + aggregate for field, aggregate in aggregates.columns]
+
+    buckets = df.loc[groups["id"].idxmax(), ["id", "timestamp"] + fields].set_index(aggregates.index)
+    buckets["count"] = groups.size()
+
+    return (pd.concat([buckets, aggregates], axis=1)
+            .sort_values("timestamp", ascending=False)
+            .reset_index(drop=True))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """ Largest-Triangle-Three-Buckets: selects the n_out points that preserve the visual shape of a series best.
+
+        Inputs:
+            x (np.ndarray): Sorted x values (ascending or descending)
+            y (np.ndarray): y values
+            n_out (int): Number of points to select
+
+        Returns:
+            np.ndarray: Indices of the selected points, in the order of x"""
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1][:max(n_out, 0)], dtype=np.int64)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+
+    # The first and last point are always kept, the others are split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # Average of the next bucket, or the last point for the last bucket
+        next_start, next_end = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        x_next, y_next = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+
+        # Select the point spanning the largest triangle with the previously selected point and the next average
+        x_prev, y_prev = x[selected[i]], y[selected[i]]
+        areas = np.abs((x_prev - x_next) * (y[start:end] - y_prev) - (x_prev - x[start:end]) * (y_next - y_prev))
+        selected[i + 1] = start + np.argmax(areas)
+
+    return selected
+
+
+def minmax_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """ Min/max decimation: splits the range of x into n_out / 2 buckets of equal duration and selects the minimum and
+        maximum of each bucket, so spikes are never lost. Fully vectorized, faster than 'lttb_indices'.
+
+        Inputs:
+            x (np.ndarray): Sorted x values (ascending or descending)
+            y (np.ndarray): y values
+            n_out (int): Maximum number of points to select
+
+        Returns:
+            np.ndarray: Indices of the selected points, in the order of x"""
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    descending = x[0] > x[-1]
+    if descending:
+        x, y = x[::-1], y[::-1]
+
+    # First index of each non-empty bucket
+    n_buckets = max((n_out - 2) // 2, 1)  # The first and last point are always kept
+    edges = np.searchsorted(x, np.linspace(x[0], x[-1], n_buckets + 1)[1:-1])
+    starts = np.unique(np.concatenate(([0], edges)))
+    buckets = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+
+    # Sorting by bucket and value puts the minimum (maximum) of each bucket at its start. NaNs are never selected
+    is_nan = np.isnan(y)
+    minimums = np.lexsort((np.where(is_nan, np.inf, y), buckets))[starts]
+    maximums = np.lexsort((np.where(is_nan, np.inf, -y), buckets))[starts]
+
+    selected = np.unique(np.concatenate(([0, n - 1], minimums, maximums)))
+    return (n - 1 - selected)[::-1] if descending else selected
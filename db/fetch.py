@@ -0,0 +1,95 @@
+"""
+Fetch query results directly into typed NumPy arrays, one per column. Compared to pd.read_sql_query, no intermediate
+DataFrame of Python objects is built and no dtypes are inferred: the types are known from the models ('__field_types__',
+generated from 'np_t' in utils/type_lookup.py), so small integers stay small.
+"""
+import numpy as np
+
+from pandas import DataFrame
+from sqlalchemy import Connection, Executable
+from sqlalchemy.orm import declarative_base
+from typing import Dict, Iterator
+
+from db.downsampling import AGGREGATES
+from db.profiling import profiler
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+CHUNK_SIZE = 10000  # Rows fetched from the cursor at once. Each chunk is converted into arrays before the next one
+
+Arrays = Dict[str, np.ndarray]
+
+
+def column_dtypes(orm_model: declarative_base) -> Dict[str, str]:
+    """ Returns the NumPy types of all columns that queries of a model return, including the aggregates of
+        downsampled queries (see db/downsampling.py)"""
+    field_types: Dict[str, str] = getattr(orm_model, "__field_types__", {})
+
+    dtypes = {"id": "int64", "timestamp": "float64", "count": "int64"}
+    for field, dtype in field_types.items():
+        dtypes[field] = dtype
+        dtypes.update({field + "_" + aggregate: "float64" for aggregate in AGGREGATES})
+
+    return dtypes
+
+
+def _to_array(values: tuple, dtype: str) -> np.ndarray:
+    # NULL values (e.g. from outer joins) don't fit into integer arrays, non-numeric values are kept as objects
+    for candidate in (dtype, "float64", object):
+        try:
+            return np.array(values, dtype=candidate)
+        except (TypeError, ValueError, OverflowError):
+            continue
+
+
+def _chunks(result, dtypes: Dict[str, str], chunk_size: int) -> Iterator[Arrays]:
+    names = list(result.keys())
+
+    while rows := result.fetchmany(chunk_size):
+        profiler.add_rows(len(rows))
+        yield {name: _to_array(values, dtypes.get(name, "float64")) for name, values in zip(names, zip(*rows))}
+
+
+def fetch_arrays(conn: Connection, statement: Executable, dtypes: Dict[str, str],
+                 chunk_size: int = CHUNK_SIZE) -> Arrays:
+    """ Run a query and collect the result into one array per column
+
+        Inputs:
+            conn (Connection): The connection to run the query on
+            statement (Executable): The query
+            dtypes (Dict[str, str]): NumPy types by column name, e.g. from 'column_types'. Columns without a type are
+                stored as float64 if possible, as objects otherwise
+            chunk_size (int): Number of rows fetched from the cursor at once
+
+        Returns:
+            Arrays: The columns of the result by name"""
+    result = conn.execute(statement)
+    chunks = list(_chunks(result, dtypes, chunk_size))
+
+    if not chunks:
+        return {name: np.empty(0, dtype=dtypes.get(name, "float64")) for name in result.keys()}
+    if len(chunks) == 1:
+        return chunks[0]
+
+    # Chunks of a column may differ in type if some of them contain NULL values
+    return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
+
+def iter_arrays(conn: Connection, statement: Executable, dtypes: Dict[str, str],
+                chunk_size: int = CHUNK_SIZE) -> Iterator[Arrays]:
+    """ Same as 'fetch_arrays', but yields the result in chunks of chunk_size rows. The rows are streamed from a
+        server side cursor, so only one chunk is held in memory at a time. The connection is busy until the iteration
+        is finished."""
+    result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(statement)
+    try:
+        yield from _chunks(result, dtypes, chunk_size)
+    finally:
+        result.close()
+
+
+def read_frame(conn: Connection, statement: Executable, dtypes: Dict[str, str],
+               chunk_size: int = CHUNK_SIZE) -> DataFrame:
+    """ Drop-in replacement of pd.read_sql_query that builds the DataFrame from typed arrays (see 'fetch_arrays')"""
+    return DataFrame(fetch_arrays(conn, statement, dtypes, chunk_size), copy=False)
@@ -0,0 +1,204 @@
+"""
+Cache of the buckets of downsampled queries (see 'DbService.query_downsampled'), kept per topic and bucket width as a
+set of loaded time intervals. A query only loads the parts of its range that are not cached yet, e.g. stepping through
+a day in 30 minute windows loads every bucket once, and going back to a window loads nothing at all.
+
+Bucket widths are rounded up to the values of BUCKET_WIDTHS and buckets start at multiples of their width, so buckets
+loaded by different queries fit together.
+"""
+import math
+import threading
+import time
+
+import pandas as pd
+
+from collections import OrderedDict
+from pandas import DataFrame
+from typing import Callable, List, Optional, Tuple
+
+from db.query_cache import RANGE_TTL
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+# [s] Possible bucket widths. Widths of one minute and more are multiples of all rollup resolutions (see db/rollups.py)
+BUCKET_WIDTHS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 30,
+                 60, 120, 300, 600, 900, 1800, 3600, 7200, 14400, 21600, 43200, 86400)
+MAX_BYTES = 128 * 2 ** 20  # Memory cap of the cache. Least recently used topics and widths are evicted first
+TTL = RANGE_TTL  # [s] Lifetime of the buckets of a topic and width. Catches entries that are added to past ranges
+
+Interval = Tuple[float, float]  # [start, end) as unix timestamps
+Load = Callable[[float, float], DataFrame]  # Loads the buckets of an interval [start, end)
+
+
+def quantize_width(bucket_width: float) -> float:
+    """ Returns the smallest width of BUCKET_WIDTHS that is at least the given width (or a multiple of days)"""
+    for width in BUCKET_WIDTHS:
+        if width >= bucket_width:
+            return width
+    return math.ceil(bucket_width / BUCKET_WIDTHS[-1]) * BUCKET_WIDTHS[-1]
+
+
+def align(start_ts: float, end_ts: float, bucket_width: float) -> Interval:
+    """ Returns the interval of the whole buckets covering the range from start_ts to end_ts (inclusive)"""
+    return math.floor(start_ts / bucket_width) * bucket_width, (math.floor(end_ts / bucket_width) + 1) * bucket_width
+
+
+def gaps(intervals: List[Interval], start: float, end: float) -> List[Interval]:
+    """ Returns the parts of [start, end) that are not covered by the sorted, disjoint intervals"""
+    missing = []
+    for interval_start, interval_end in intervals:
+        if interval_end <= start:
+            continue
+        if interval_start >= end:
+            break
+        if interval_start > start:
+            missing.append((start, interval_start))
+        start = max(start, interval_end)
+
+    if start < end:
+        missing.append((start, end))
+    return missing
+
+
+def _in(df: DataFrame, start: float, end: float) -> DataFrame:
+    # The timestamp of a bucket (its last entry) lies within the bucket
+    return df[(df["timestamp"] >= start) & (df["timestamp"] < end)]
+
+
+class _Entry:
+    """ Loaded buckets of a topic and width"""
+
+    def __init__(self):
+        self.intervals: List[Interval] = []
+        self.buckets: List[DataFrame] = []  # Not sorted, combined on read
+        self.empty: Optional[DataFrame] = None  # No rows, but the columns of the buckets
+        self.size: int = 0  # [bytes]
+        self.expiry: float = time.monotonic() + TTL
+
+    def add(self, df: DataFrame, start: float, end: float) -> int:
+        # Add the buckets of an interval, except the parts that were added meanwhile. Returns the added bytes
+        if self.empty is None:
+            self.empty = df.iloc[0:0]
+
+        added = 0
+        for gap_start, gap_end in gaps(self.intervals, start, end):
+            buckets = _in(df, gap_start, gap_end)
+            if not buckets.empty:
+                self.buckets.append(buckets)
+                added += int(buckets.memory_usage(index=True, deep=True).sum())
+            self.intervals.append((gap_start, gap_end))
+
+        # Merge adjacent intervals
+        merged: List[Interval] = []
+        for interval in sorted(self.intervals):
+            if merged and interval[0] <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], interval[1]))
+            else:
+                merged.append(interval)
+        self.intervals = merged
+
+        self.size += added
+        return added
+
+    def read(self, start: float, end: float) -> List[DataFrame]:
+        return [buckets for buckets in (_in(df, start, end) for df in self.buckets) if not buckets.empty]
+
+
+class IntervalCache:
+    """ LRU cache of loaded intervals per topic and bucket width, with a memory cap. Thread safe; two threads that
+        load the same gap at the same time both query the DB, but the buckets are only stored once."""
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size: int = 0  # [bytes]
+        self.hits: int = 0  # Queries that didn't load anything
+        self.misses: int = 0
+
+        self._entries: OrderedDict = OrderedDict()  # (table name, width) -> _Entry, least recently used first
+        self._lock = threading.Lock()
+
+    def get_or_load(self, table_name: str, bucket_width: float, start_ts: float, end_ts: float, load: Load,
+                    settled_until: float) -> DataFrame:
+        """ Returns the buckets covering a range, loading only the intervals that are not cached
+
+            Inputs:
+                table_name (str): Name of the queried table
+                bucket_width (float): Width of the buckets, one of BUCKET_WIDTHS (see 'quantize_width')
+                start_ts (float): Start of the range as unix timestamp
+                end_ts (float): Inclusive end of the range as unix timestamp
+                load (Load): Loads the buckets of an interval, which starts and ends at multiples of the width
+                settled_until (float): Buckets after this timestamp may still change and are not cached
+
+            Returns:
+                DataFrame: The buckets, ordered by timestamp (newest first)"""
+        key = (table_name, bucket_width)
+        start, end = align(start_ts, end_ts, bucket_width)
+        settled = math.floor(settled_until / bucket_width) * bucket_width
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expiry < time.monotonic():
+                self._remove(key)
+                entry = None
+            missing = gaps(entry.intervals if entry is not None else [], start, end)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+            if missing:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        # The DB is queried without holding the lock
+        loaded = [(gap_start, gap_end, load(gap_start, gap_end)) for gap_start, gap_end in missing]
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry()
+
+            unsettled = []
+            for gap_start, gap_end, df in loaded:
+                if gap_start < settled:
+                    self.size += entry.add(df, gap_start, min(gap_end, settled))
+                if gap_end > settled:
+                    unsettled.append(_in(df, max(gap_start, settled), gap_end))
+
+            parts = entry.read(start, end) + [df for df in unsettled if not df.empty]
+            empty = entry.empty if entry.empty is not None else (loaded[0][2].iloc[0:0] if loaded else DataFrame())
+            self._evict(keep=key)
+
+        if not parts:
+            return empty.copy()
+        return (pd.concat(parts, ignore_index=True)
+                .sort_values("timestamp", ascending=False, kind="stable")
+                .reset_index(drop=True))
+
+    def invalidate(self, table_name: str) -> None:
+        """ Remove all buckets of a table"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == table_name]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _evict(self, keep: Tuple) -> None:
+        while self.size > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            if oldest == keep and len(self._entries) == 1:
+                self._remove(oldest)  # The buckets of a single query don't fit, they are not cached
+                return
+            self._remove(oldest if oldest != keep else list(self._entries)[1])
+
+    def _remove(self, key: Tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+
+interval_cache = IntervalCache()
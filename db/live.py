@@ -0,0 +1,143 @@
+"""
+Live channel from the logger to the dashboard that bypasses the DB. The logger publishes every decoded frame as UDP
+datagram on the local host, the dashboard receives them on a background thread and keeps the latest values of each
+topic in memory. The frames of the heartbeats also feed the liveness of the modules (see db/liveness.py). The DB is still
+written as before and used for everything but the live values.
+
+UDP is used since publishing never blocks the logger: frames are dropped if the dashboard is not running or too slow.
+"""
+import json
+import socket
+import threading
+
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from db.liveness import LivenessTracker
+from db.models import ddl_models
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+LIVE_HOST = "127.0.0.1"  # The logger and the dashboard run on the same machine
+LIVE_PORT = 50505
+LIVE_BUFFER = 1000  # Latest frames kept per topic by the dashboard
+RECEIVE_BUFFER_SIZE = 1 << 20  # [bytes] Frames received while the dashboard is busy are buffered by the OS
+MAX_DATAGRAM_SIZE = 65507
+
+Frame = Tuple[float, Dict[str, float]]  # (timestamp, values by field)
+
+
+class LivePublisher:
+    """ Publishes decoded frames, used by can_logger.py"""
+
+    def __init__(self, host: str = LIVE_HOST, port: int = LIVE_PORT):
+        self.address = (host, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def publish(self, can_id: int, unpacked_data: tuple, timestamp: float) -> None:
+        """ Publish a decoded frame
+
+            Inputs:
+                can_id (int): The CAN ID of the message
+                unpacked_data (tuple): The unpacked data of the message, in the order of the fields of its model
+                timestamp (float): The timestamp of the message"""
+        model = ddl_models.get(can_id)
+        if model is None:
+            return
+
+        frame = {"topic": model.__tablename__,
+                 "timestamp": timestamp,
+                 "values": dict(zip(model.__field_types__, unpacked_data))}
+        try:
+            self.socket.sendto(json.dumps(frame).encode(), self.address)
+        except OSError:
+            pass  # Nobody is listening or the receive buffer is full, the frame is in the DB anyway
+
+    def close(self) -> None:
+        self.socket.close()
+
+
+class LiveStore:
+    """ Latest frames of each topic, received by 'LiveSubscriber'. Thread safe."""
+
+    def __init__(self, buffer_size: int = LIVE_BUFFER):
+        self.buffer_size = buffer_size
+        self.frames: Dict[str, Deque[Frame]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, topic: str, timestamp: float, values: Dict[str, float]) -> None:
+        with self._lock:
+            if topic not in self.frames:
+                self.frames[topic] = deque(maxlen=self.buffer_size)
+            self.frames[topic].append((timestamp, values))
+
+    def topics(self) -> List[str]:
+        with self._lock:
+            return sorted(self.frames)
+
+    def latest(self, topic: str) -> Optional[Frame]:
+        """ Returns the latest frame of a topic, None if no frame was received"""
+        with self._lock:
+            frames = self.frames.get(topic)
+            return frames[-1] if frames else None
+
+    def since(self, topic: str, timestamp: float) -> List[Frame]:
+        """ Returns the frames of a topic newer than a timestamp, oldest first"""
+        with self._lock:
+            frames = list(self.frames.get(topic, ()))
+
+        first = len(frames)
+        while first > 0 and frames[first - 1][0] > timestamp:
+            first -= 1
+        return frames[first:]
+
+
+class LiveSubscriber:
+    """ Receives the frames of the logger on a background thread and adds them to a LiveStore and a LivenessTracker"""
+
+    def __init__(self, store: LiveStore, tracker: Optional[LivenessTracker] = None, host: str = LIVE_HOST,
+                 port: int = LIVE_PORT):
+        self.store = store
+        self.tracker = tracker
+        self.address = (host, port)
+        self.started = False
+        self.receiving = False  # Whether the port could be bound
+        self._start_lock = threading.Lock()
+
+    def start(self) -> None:
+        """ Start receiving, if not done yet. Only one process of the machine can receive the frames"""
+        with self._start_lock:
+            if self.started:
+                return
+            self.started = True
+
+            receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER_SIZE)
+            try:
+                receiver.bind(self.address)
+            except OSError as e:
+                print("Err: Couldn't receive live frames on port %d: %s" % (self.address[1], e))
+                receiver.close()
+                return
+
+            self.receiving = True
+            threading.Thread(target=self._run, args=(receiver,), name="live-subscriber", daemon=True).start()
+
+    def _run(self, receiver: socket.socket) -> None:
+        while True:
+            data = receiver.recv(MAX_DATAGRAM_SIZE)
+            try:
+                frame = json.loads(data)
+                self.store.add(frame["topic"], frame["timestamp"], frame["values"])
+                if self.tracker is not None:
+                    self.tracker.seen(frame["topic"], frame["timestamp"])
+            except (ValueError, KeyError, TypeError):
+                print("Err: Received invalid live frame")
+
+
+store = LiveStore()
+liveness = LivenessTracker()
+subscriber = LiveSubscriber(store, liveness)
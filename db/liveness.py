@@ -0,0 +1,240 @@
+"""
+Liveness of the modules of the car, tracked in memory from the stream of received messages. Every heartbeat updates the
+last seen time and the message rate of its module, a module that stays silent for longer than MAX_IDLE_TIME is flagged
+as inactive from the time it was last seen. These transitions are the outages of the module.
+
+The logger tracks all messages it receives and stores the transitions in the table 'liveness_events', which is the
+source of the uptime and outage reports ('outages', 'uptime_report'). The dashboard tracks the live messages of the
+logger (see db/live.py), so its module table doesn't query the DB.
+"""
+import threading
+
+import numpy as np
+
+from collections import deque
+from pandas import DataFrame
+from sqlalchemy import Boolean, Column, Connection, Double, Index, Integer, String, Table, select
+from typing import Deque, Dict, List, Optional, Tuple
+
+from db.models import *
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+MAX_IDLE_TIME = 2.0  # [s] Time allowed until a module is flagged as inactive
+RATE_WINDOW = 10.0  # [s] Time window of the message rate
+MAX_OUTAGES = 100  # Latest outages kept in memory per module, all of them are stored in the DB by the logger
+
+# Tracked modules and their heartbeats. Append / update here.
+MODULES = {
+    "vcu": VcuHeartbeat,
+    "icu": IcuHeartbeat,
+    "mppt0": MpptStatus0,
+    "mppt1": MpptStatus1,
+    "mppt2": MpptStatus2,
+    "mppt3": MpptStatus3,
+    "bms": BmsHeartbeat,
+    "stwheel": StwheelHeartbeat,
+    "tele": TeleSolarHeartbeat,
+    "sensors": DsensorsHeartbeat,
+    "logger": LoggerHeartbeat,
+}
+
+Interval = Tuple[float, Optional[float]]  # (start, end) as unix timestamps, the end of an ongoing outage is None
+Event = Tuple[str, float, bool]  # (module, timestamp, active)
+
+# Transitions of the modules, written by the logger. Created together with the tables of the models
+events_table = Table(
+    "liveness_events", Base.metadata,
+    Column("id", Integer(), primary_key=True),
+    Column("module", String(32)),
+    Column("timestamp", Double()),  # Time of the first message after an outage, or of the last message before it
+    Column("active", Boolean()),
+    Index("ix_liveness_events_timestamp", "timestamp"),
+)
+
+
+class ModuleState:
+    """ Liveness of one module"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.active: bool = False
+        self.last_seen: Optional[float] = None
+        self.since: Optional[float] = None  # Time of the latest transition
+        self.outages: Deque[Interval] = deque(maxlen=MAX_OUTAGES)
+        self._arrivals: Deque[float] = deque()  # Timestamps of the messages within the rate window
+
+    def rate(self) -> float:
+        """ Returns the message rate in Hz over the rate window before the last message"""
+        return len(self._arrivals) / RATE_WINDOW
+
+
+class LivenessTracker:
+    """ Tracks the liveness of the modules of MODULES. Thread safe.
+
+        Inputs:
+            max_idle_time (float): Time allowed until a module is flagged as inactive
+            record_events (bool): Keep the transitions until they are taken with 'pop_events', e.g. to store them"""
+
+    def __init__(self, max_idle_time: float = MAX_IDLE_TIME, record_events: bool = False):
+        self.max_idle_time = max_idle_time
+        self.record_events = record_events
+        self.modules: Dict[str, ModuleState] = {name: ModuleState(name) for name in MODULES}
+
+        self._by_table: Dict[str, ModuleState] = {model.__tablename__: self.modules[name]
+                                                  for name, model in MODULES.items()}
+        self._events: List[Event] = []
+        self._lock = threading.Lock()
+
+    def seen(self, table_name: str, timestamp: float) -> None:
+        """ Register a received message. Messages of other tables than the heartbeats are ignored
+
+            Inputs:
+                table_name (str): Name of the table of the message
+                timestamp (float): The timestamp of the message"""
+        state = self._by_table.get(table_name)
+        if state is None:
+            return
+
+        with self._lock:
+            if state.last_seen is not None and timestamp <= state.last_seen:
+                return  # Already seen, e.g. the latest entry of a table that is polled
+
+            if not state.active:
+                if state.outages and state.outages[-1][1] is None:
+                    state.outages[-1] = (state.outages[-1][0], timestamp)
+                self._transition(state, timestamp, True)
+            state.last_seen = timestamp
+
+            state._arrivals.append(timestamp)
+            while state._arrivals[0] <= timestamp - RATE_WINDOW:
+                state._arrivals.popleft()
+
+    def check(self, now: float) -> None:
+        """ Flag the modules as inactive that haven't sent a message for longer than the idle time"""
+        with self._lock:
+            for state in self.modules.values():
+                if state.active and now - state.last_seen > self.max_idle_time:
+                    state.outages.append((state.last_seen, None))
+                    state._arrivals.clear()
+                    self._transition(state, state.last_seen, False)
+
+    def is_active(self, name: str, now: float) -> bool:
+        """ Returns whether a module sent a message within the idle time"""
+        state = self.modules[name]
+        return state.active and now - state.last_seen <= self.max_idle_time
+
+    def pop_events(self) -> List[Event]:
+        """ Returns the transitions since the previous call, oldest first"""
+        with self._lock:
+            events, self._events = self._events, []
+            return events
+
+    def _transition(self, state: ModuleState, timestamp: float, active: bool) -> None:
+        state.active = active
+        state.since = timestamp
+        if self.record_events:
+            self._events.append((state.name, timestamp, active))
+
+
+def write_events(conn: Connection, events: List[Event]) -> None:
+    """ Store transitions in the table 'liveness_events'
+
+        Inputs:
+            conn (Connection): Connection with an open transaction
+            events (List[Event]): The transitions, e.g. from 'LivenessTracker.pop_events'"""
+    if events:
+        conn.execute(events_table.insert(), [{"module": module, "timestamp": timestamp, "active": active}
+                                             for module, timestamp, active in events])
+
+
+def read_events(conn: Connection, start_ts: float, end_ts: float) -> DataFrame:
+    """ Read the transitions within a range, plus the latest transition of each module before it (the state at the
+        start of the range)
+
+        Returns:
+            DataFrame: Columns module, timestamp and active, ordered by timestamp (oldest first)"""
+    in_range = conn.execute(
+        select(events_table.c.module, events_table.c.timestamp, events_table.c.active)
+        .where(events_table.c.timestamp >= start_ts, events_table.c.timestamp <= end_ts)
+        .order_by(events_table.c.timestamp.asc(), events_table.c.id.asc())).all()
+
+    before = []
+    for module in MODULES:
+        row = conn.execute(
+            select(events_table.c.module, events_table.c.timestamp, events_table.c.active)
+            .where(events_table.c.module == module, events_table.c.timestamp < start_ts)
+            .order_by(events_table.c.timestamp.desc(), events_table.c.id.desc()).limit(1)).first()
+        if row is not None:
+            before.append(row)
+
+    df = DataFrame(before + in_range, columns=["module", "timestamp", "active"])
+    df["active"] = df["active"].astype(bool)
+    return df.sort_values("timestamp", kind="stable").reset_index(drop=True)
+
+
+def outages(events: DataFrame, start_ts: float, end_ts: float) -> DataFrame:
+    """ Returns the outages of the modules within a range, clipped to the range. Modules without transitions before
+        the range count as inactive until their first transition.
+
+        Inputs:
+            events (DataFrame): Transitions as returned by 'read_events'
+            start_ts (float): Start of the range as unix timestamp
+            end_ts (float): End of the range as unix timestamp
+
+        Returns:
+            DataFrame: Columns module, start, end and duration [s], ordered by start"""
+    rows = []
+    for module in MODULES:
+        module_events = events[events["module"] == module]
+        timestamps = np.clip(module_events["timestamp"].to_numpy(dtype=float), start_ts, end_ts)
+        active = module_events["active"].to_numpy(dtype=bool)
+
+        # Boundaries of the periods: the start of the range, each transition and the end of the range
+        bounds = np.concatenate(([start_ts], timestamps, [end_ts]))
+        states = np.concatenate(([False], active))  # State of each period
+
+        # Merge consecutive periods of the same state, e.g. a repeated 'active' event after the logger crashed
+        down_start = None
+        for state, period_start, period_end in zip(states, bounds[:-1], bounds[1:]):
+            if period_end <= period_start:
+                continue  # E.g. the module was active for a single message
+            if not state and down_start is None:
+                down_start = period_start
+            elif state and down_start is not None:
+                if period_start > down_start:
+                    rows.append((module, down_start, period_start))
+                down_start = None
+        if down_start is not None and end_ts > down_start:
+            rows.append((module, down_start, end_ts))
+
+    df = DataFrame(rows, columns=["module", "start", "end"])
+    df["duration"] = df["end"] - df["start"]
+    return df.sort_values("start", kind="stable").reset_index(drop=True)
+
+
+def uptime_report(events: DataFrame, start_ts: float, end_ts: float) -> DataFrame:
+    """ Returns the uptime of each module within a range
+
+        Inputs:
+            events (DataFrame): Transitions as returned by 'read_events'
+            start_ts (float): Start of the range as unix timestamp
+            end_ts (float): End of the range as unix timestamp
+
+        Returns:
+            DataFrame: Columns module, uptime (fraction of the range), outages (count), downtime [s] and
+                longest_outage [s], one row per module of MODULES"""
+    down = outages(events, start_ts, end_ts)
+    per_module = down.groupby("module")["duration"].agg(["count", "sum", "max"])
+    per_module = per_module.reindex(list(MODULES), fill_value=0)
+
+    report = DataFrame({
+        "module": list(MODULES),
+        "uptime": 1 - per_module["sum"].to_numpy(dtype=float) / max(end_ts - start_ts, 1e-9),
+        "outages": per_module["count"].to_numpy(dtype=int),
+        "downtime": per_module["sum"].to_numpy(dtype=float),
+        "longest_outage": per_module["max"].to_numpy(dtype=float),
+    })
+    return report
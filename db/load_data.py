@@ -2,13 +2,34 @@ import datetime
 
 from db.models import *
 from db.db_service import DbService
+from db.downsampling import AGGREGATES
 from pandas import DataFrame
+import numpy as np
 import pandas as pd
-from typing import Tuple, Union
+import warnings
+from typing import Iterator, Optional, Tuple, Union
+
+Cursor = Tuple[float, int]  # (timestamp, id) of the newest entry that was already loaded
+
+
+def query_new(db_serv: DbService, orm_model: any, n_entries: int, cursor: Optional[Cursor],
+              limit: Optional[int] = None) -> DataFrame:
+    """query the latest n_entries on the first call (no cursor), afterwards all entries that are newer than the cursor
+    (at most limit entries right after the cursor, if given)"""
+    if cursor is None:
+        return db_serv.query_latest(orm_model, n_entries)
+    return db_serv.query_since(orm_model, *cursor, limit=limit)
+
+def stream(db_serv: DbService, orm_model: any, preprocess, start_time: datetime.datetime,
+           end_time: datetime.datetime) -> Iterator[DataFrame]:
+    """query all entries of a time range chunk by chunk (oldest first) and preprocess each chunk"""
+    for chunk in db_serv.query_chunks(orm_model, start_time, end_time):
+        yield preprocess(chunk)
 
 ### Errors #############################################################################################################
-def append_error_data(db_serv: DbService, orm_model: any, n_entries: int) -> DataFrame:
-    return preprocess_generic(db_serv.query_latest(orm_model, n_entries))
+def append_error_data(db_serv: DbService, orm_model: any, n_entries: int, cursor: Optional[Cursor] = None,
+                      limit: Optional[int] = None) -> DataFrame:
+    return preprocess_generic(query_new(db_serv, orm_model, n_entries, cursor, limit))
 
 
 
@@ -16,125 +37,238 @@ def append_error_data(db_serv: DbService, orm_model: any, n_entries: int) -> Dat
 def refresh_motorPow() -> Union[DataFrame, None]:
     return None
 
-def append_speed_data(db_serv: DbService, n_entries: int) -> Union[DataFrame, None]:
+def append_speed_data(db_serv: DbService, n_entries: int, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
     return preprocess_speed(
-        db_serv.query_latest(IcuHeartbeat, n_entries)
+        query_new(db_serv, IcuHeartbeat, n_entries, cursor)
     )
 
-def load_speed_data(db_serv: DbService, start_time : datetime.datetime, end_time : datetime.datetime, loading_interval: int):
-    return preprocess_speed(db_serv.query(IcuHeartbeat,start_time,end_time, loading_interval))
+def load_speed_data(db_serv: DbService, start_time : datetime.datetime, end_time : datetime.datetime, n_points: int):
+    return preprocess_speed(db_serv.query_downsampled(IcuHeartbeat, start_time, end_time, n_points))
+
+def stream_speed_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, IcuHeartbeat, preprocess_speed, start_time, end_time)
 
-def append_driverResponse(db_serv: DbService, n_entries: int) -> Union[DataFrame, None]:
-    return preprocess_driverResponse(db_serv.query_latest(StwheelHeartbeat,n_entries))
+def append_driverResponse(db_serv: DbService, n_entries: int, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
+    return preprocess_driverResponse(query_new(db_serv, StwheelHeartbeat, n_entries, cursor))
 
 ### MPPTs ##############################################################################################################
 
 def refresh_mpptPow() -> Union[DataFrame, None]:
     return None
 
-def load_mppt_status_data_latest(db_serv: DbService) -> Union[Tuple[DataFrame, DataFrame, DataFrame, DataFrame], None]:
-    return (
-        preprocess_generic(db_serv.latest(MpptStatus0)),
-        preprocess_generic(db_serv.latest(MpptStatus1)),
-        preprocess_generic(db_serv.latest(MpptStatus2)),
-        preprocess_generic(db_serv.latest(MpptStatus3))
-    )
+def load_mppt_status_data_latest(db_serv: DbService) -> Tuple[Union[MpptStatus0, None], Union[MpptStatus1, None],
+                                                                Union[MpptStatus2, None], Union[MpptStatus3, None]]:
+    latest = db_serv.latest_many([MpptStatus0, MpptStatus1, MpptStatus2, MpptStatus3])
+    return latest[MpptStatus0], latest[MpptStatus1], latest[MpptStatus2], latest[MpptStatus3]
+
+def append_mppt_status0_data(db_serv: DbService, n_entries, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
+    return preprocess_generic(query_new(db_serv, MpptStatus0, n_entries, cursor))
+
+def append_mppt_status1_data(db_serv: DbService, n_entries, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
+    return preprocess_generic(query_new(db_serv, MpptStatus1, n_entries, cursor))
+
+def append_mppt_status2_data(db_serv: DbService, n_entries, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
+    return preprocess_generic(query_new(db_serv, MpptStatus2, n_entries, cursor))
+
+def append_mppt_status3_data(db_serv: DbService, n_entries, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
+    return preprocess_generic(query_new(db_serv, MpptStatus3, n_entries, cursor))
+
+def load_mppt_status0_data(db_serv: DbService, start_time : datetime.datetime, end_time : datetime.datetime, n_points: int) -> Union[DataFrame, None]:
+    return preprocess_generic(db_serv.query_downsampled(MpptStatus0, start_time, end_time, n_points))
 
-def append_mppt_status0_data(db_serv: DbService, n_entries) -> Union[DataFrame, None]:
-    return preprocess_generic(db_serv.query_latest(MpptStatus0, n_entries))
+def stream_mppt_status0_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, MpptStatus0, preprocess_generic, start_time, end_time)
 
-def append_mppt_status1_data(db_serv: DbService, n_entries) -> Union[DataFrame, None]:
-    return preprocess_generic(db_serv.query_latest(MpptStatus1, n_entries))
+def load_mppt_status1_data(db_serv: DbService, start_time : datetime.datetime, end_time : datetime.datetime, n_points: int) -> Union[DataFrame, None]:
+    return preprocess_generic(db_serv.query_downsampled(MpptStatus1, start_time, end_time, n_points))
 
-def append_mppt_status2_data(db_serv: DbService, n_entries) -> Union[DataFrame, None]:
-    return preprocess_generic(db_serv.query_latest(MpptStatus2, n_entries))
+def stream_mppt_status1_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, MpptStatus1, preprocess_generic, start_time, end_time)
 
-def append_mppt_status3_data(db_serv: DbService, n_entries) -> Union[DataFrame, None]:
-    return preprocess_generic(db_serv.query_latest(MpptStatus3, n_entries))
+def load_mppt_status2_data(db_serv: DbService, start_time : datetime.datetime, end_time : datetime.datetime, n_points: int) -> Union[DataFrame, None]:
+    return preprocess_generic(db_serv.query_downsampled(MpptStatus2, start_time, end_time, n_points))
 
-def load_mppt_status0_data(db_serv: DbService, start_time : datetime.datetime, end_time : datetime.datetime, loading_interval: int) -> Union[DataFrame, None]:
-    return preprocess_generic(db_serv.query(MpptStatus0, start_time,end_time, loading_interval))
+def stream_mppt_status2_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, MpptStatus2, preprocess_generic, start_time, end_time)
 
-def load_mppt_status1_data(db_serv: DbService, start_time : datetime.datetime, end_time : datetime.datetime, loading_interval: int) -> Union[DataFrame, None]:
-    return preprocess_generic(db_serv.query(MpptStatus1, start_time,end_time, loading_interval))
+def load_mppt_status3_data(db_serv: DbService, start_time : datetime.datetime, end_time : datetime.datetime, n_points: int) -> Union[DataFrame, None]:
+    return preprocess_generic(db_serv.query_downsampled(MpptStatus3, start_time, end_time, n_points))
 
-def load_mppt_status2_data(db_serv: DbService, start_time : datetime.datetime, end_time : datetime.datetime, loading_interval: int) -> Union[DataFrame, None]:
-    return preprocess_generic(db_serv.query(MpptStatus2, start_time,end_time, loading_interval))
+def stream_mppt_status3_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, MpptStatus3, preprocess_generic, start_time, end_time)
 
-def load_mppt_status3_data(db_serv: DbService, start_time : datetime.datetime, end_time : datetime.datetime, loading_interval: int) -> Union[DataFrame, None]:
-    return preprocess_generic(db_serv.query(MpptStatus3, start_time,end_time, loading_interval))
+def append_mppt_power0_data(db_serv: DbService, n_entries, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
+    return preprocess_mppt_power(query_new(db_serv, MpptPowerMeas0, n_entries, cursor))
 
-def append_mppt_power0_data(db_serv: DbService, n_entries) -> Union[DataFrame, None]:
-    return preprocess_mppt_power(db_serv.query_latest(MpptPowerMeas0, n_entries))
+def load_mppt_power0_data(db_serv: DbService,  start_time : datetime.datetime, end_time : datetime.datetime, n_points: int) -> Union[DataFrame, None]:
+    return preprocess_mppt_power(db_serv.query_downsampled(MpptPowerMeas0, start_time, end_time, n_points))
 
-def load_mppt_power0_data(db_serv: DbService,  start_time : datetime.datetime, end_time : datetime.datetime, loading_interval: int) -> Union[DataFrame, None]:
-    return preprocess_mppt_power(db_serv.query(MpptPowerMeas0, start_time,end_time, loading_interval))
+def stream_mppt_power0_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, MpptPowerMeas0, preprocess_mppt_power, start_time, end_time)
 
-def append_mppt_power1_data(db_serv: DbService, n_entries) -> Union[DataFrame, None]:
-    return preprocess_mppt_power(db_serv.query_latest(MpptPowerMeas1, n_entries))
+def append_mppt_power1_data(db_serv: DbService, n_entries, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
+    return preprocess_mppt_power(query_new(db_serv, MpptPowerMeas1, n_entries, cursor))
 
-def load_mppt_power1_data(db_serv: DbService,  start_time : datetime.datetime, end_time : datetime.datetime, loading_interval: int) -> Union[DataFrame, None]:
-    return preprocess_mppt_power(db_serv.query(MpptPowerMeas1, start_time,end_time, loading_interval))
+def load_mppt_power1_data(db_serv: DbService,  start_time : datetime.datetime, end_time : datetime.datetime, n_points: int) -> Union[DataFrame, None]:
+    return preprocess_mppt_power(db_serv.query_downsampled(MpptPowerMeas1, start_time, end_time, n_points))
 
-def append_mppt_power2_data(db_serv: DbService, n_entries) -> Union[DataFrame, None]:
-    return preprocess_mppt_power(db_serv.query_latest(MpptPowerMeas2, n_entries))
+def stream_mppt_power1_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, MpptPowerMeas1, preprocess_mppt_power, start_time, end_time)
 
-def load_mppt_power2_data(db_serv: DbService,  start_time : datetime.datetime, end_time : datetime.datetime, loading_interval: int) -> Union[DataFrame, None]:
-    return preprocess_mppt_power(db_serv.query(MpptPowerMeas2, start_time,end_time, loading_interval))
+def append_mppt_power2_data(db_serv: DbService, n_entries, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
+    return preprocess_mppt_power(query_new(db_serv, MpptPowerMeas2, n_entries, cursor))
 
-def append_mppt_power3_data(db_serv: DbService, n_entries) -> Union[DataFrame, None]:
-    return preprocess_mppt_power(db_serv.query_latest(MpptPowerMeas3, n_entries))
+def load_mppt_power2_data(db_serv: DbService,  start_time : datetime.datetime, end_time : datetime.datetime, n_points: int) -> Union[DataFrame, None]:
+    return preprocess_mppt_power(db_serv.query_downsampled(MpptPowerMeas2, start_time, end_time, n_points))
 
-def load_mppt_power3_data(db_serv: DbService,  start_time : datetime.datetime, end_time : datetime.datetime, loading_interval: int) -> Union[DataFrame, None]:
-    return preprocess_mppt_power(db_serv.query(MpptPowerMeas3, start_time,end_time, loading_interval))
+def stream_mppt_power2_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, MpptPowerMeas2, preprocess_mppt_power, start_time, end_time)
+
+def append_mppt_power3_data(db_serv: DbService, n_entries, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
+    return preprocess_mppt_power(query_new(db_serv, MpptPowerMeas3, n_entries, cursor))
+
+def load_mppt_power3_data(db_serv: DbService,  start_time : datetime.datetime, end_time : datetime.datetime, n_points: int) -> Union[DataFrame, None]:
+    return preprocess_mppt_power(db_serv.query_downsampled(MpptPowerMeas3, start_time, end_time, n_points))
+
+def stream_mppt_power3_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, MpptPowerMeas3, preprocess_mppt_power, start_time, end_time)
 
 
 
 ### BMS ################################################################################################################
-def append_bms_pack_data(db_serv: DbService, n_entries) -> Union[DataFrame, None]:
+def append_bms_pack_data(db_serv: DbService, n_entries, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
     return preprocess_bms_pack_data(
-        db_serv.query_latest(BmsPackVoltageCurrent, n_entries),
+        query_new(db_serv, BmsPackVoltageCurrent, n_entries, cursor),
     )
 
-def load_bms_pack_data(db_serv: DbService, start_time :datetime.datetime, end_time: datetime.datetime, loading_interval: int) -> Union[DataFrame, None]:
+def load_bms_pack_data(db_serv: DbService, start_time :datetime.datetime, end_time: datetime.datetime, n_points: int) -> Union[DataFrame, None]:
     return preprocess_bms_pack_data(
-        db_serv.query(BmsPackVoltageCurrent, start_time, end_time, loading_interval),
+        db_serv.query_downsampled(BmsPackVoltageCurrent, start_time, end_time, n_points),
     )
 
-def append_bms_cell_voltage_data(db_serv: DbService, n_entries) -> Union[DataFrame, None]:
+def stream_bms_pack_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, BmsPackVoltageCurrent, preprocess_bms_pack_data, start_time, end_time)
+
+def append_bms_cell_voltage_data(db_serv: DbService, n_entries, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
     return preprocess_generic(
-        db_serv.query_latest((BmsMinMaxCellVoltage), n_entries)
+        query_new(db_serv, BmsMinMaxCellVoltage, n_entries, cursor)
     )
 
-def load_bms_cell_voltage_data(db_serv: DbService, start_time :datetime.datetime, end_time: datetime.datetime, loading_interval: int) -> Union[DataFrame, None]:
+def load_bms_cell_voltage_data(db_serv: DbService, start_time :datetime.datetime, end_time: datetime.datetime, n_points: int) -> Union[DataFrame, None]:
     return preprocess_generic(
-        db_serv.query(BmsMinMaxCellVoltage, start_time, end_time, loading_interval),
+        db_serv.query_downsampled(BmsMinMaxCellVoltage, start_time, end_time, n_points),
     )
 
-def append_bms_cell_temp_data(db_serv: DbService, n_entries) -> Union[DataFrame, None]:
+def stream_bms_cell_voltage_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, BmsMinMaxCellVoltage, preprocess_generic, start_time, end_time)
+
+def append_bms_cell_temp_data(db_serv: DbService, n_entries, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
     return preprocess_bms_cell_temp(
-        db_serv.query_latest(BmsMinMaxCellTemp, n_entries)
+        query_new(db_serv, BmsMinMaxCellTemp, n_entries, cursor)
     )
 
-def load_bms_cell_temp_data(db_serv: DbService, start_time :datetime.datetime, end_time: datetime.datetime, loading_interval: int) -> Union[DataFrame, None]:
+def load_bms_cell_temp_data(db_serv: DbService, start_time :datetime.datetime, end_time: datetime.datetime, n_points: int) -> Union[DataFrame, None]:
     return preprocess_bms_cell_temp(
-        db_serv.query(BmsMinMaxCellTemp, start_time, end_time, loading_interval),
+        db_serv.query_downsampled(BmsMinMaxCellTemp, start_time, end_time, n_points),
     )
 
-def append_bms_soc_data(db_serv: DbService, n_entries) -> Union[DataFrame, None]:
+def stream_bms_cell_temp_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, BmsMinMaxCellTemp, preprocess_bms_cell_temp, start_time, end_time)
+
+def append_bms_soc_data(db_serv: DbService, n_entries, cursor: Optional[Cursor] = None) -> Union[DataFrame, None]:
     return preprocess_bms_soc_data(
-        db_serv.query_latest(BmsPackSoc, n_entries),
+        query_new(db_serv, BmsPackSoc, n_entries, cursor),
     )
 
-def load_bms_soc_data(db_serv: DbService, start_time :datetime.datetime, end_time: datetime.datetime, loading_interval: int) -> Union[DataFrame, None]:
+def load_bms_soc_data(db_serv: DbService, start_time :datetime.datetime, end_time: datetime.datetime, n_points: int) -> Union[DataFrame, None]:
     return preprocess_bms_soc_data(
-        db_serv.query(BmsPackSoc, start_time, end_time, loading_interval),
+        db_serv.query_downsampled(BmsPackSoc, start_time, end_time, n_points),
     )
 
+def stream_bms_soc_data(db_serv: DbService, start_time: datetime.datetime, end_time: datetime.datetime) -> Iterator[DataFrame]:
+    return stream(db_serv, BmsPackSoc, preprocess_bms_soc_data, start_time, end_time)
+
+
+# Cell voltage topics of the pack, ordered by CMU, and their valid cells (cell_7_volt is always -32768)
+BMS_CELL_TOPICS = [
+    (orm_model, cells)
+    for cmu_cells1, cmu_cells2 in ((BmsCmu1Cells1, BmsCmu1Cells2), (BmsCmu2Cells1, BmsCmu2Cells2),
+                                   (BmsCmu3Cells1, BmsCmu3Cells2), (BmsCmu4Cells1, BmsCmu4Cells2),
+                                   (BmsCmu5Cells1, BmsCmu5Cells2))
+    for orm_model, cells in ((cmu_cells1, ["cell_0_volt", "cell_1_volt", "cell_2_volt", "cell_3_volt"]),
+                             (cmu_cells2, ["cell_4_volt", "cell_5_volt", "cell_6_volt"]))
+]
+BMS_CELL_LABELS = ["CMU %d %s" % (cmu, cell) for cmu in range(1, 6)
+                   for cell in ["cell_0", "cell_1", "cell_2", "cell_3", "cell_4", "cell_5", "cell_6"]]
+
+CellMatrix = Tuple[np.ndarray, np.ndarray]  # (timestamps, cell voltages [V] with one row per timestamp)
+
+def load_bms_cell_matrix(db_serv: DbService, n_entries: int) -> CellMatrix:
+    """query the latest n_entries of all cell voltage topics in one round trip and combine them into a matrix (time x
+    cell, columns as in BMS_CELL_LABELS). Each row holds the latest voltage of every cell at a time at which a topic
+    was updated, starting once all topics have an entry. Cells without an entry are NaN"""
+    arrays = db_serv.query_latest_many([orm_model for orm_model, _ in BMS_CELL_TOPICS], n_entries)
+    model_idx, timestamps = arrays["model_idx"], arrays["timestamp"]
+
+    # the timestamps of all topics, from the oldest entry of the most recent topic on
+    first = [timestamps[model_idx == i].min() for i in range(len(BMS_CELL_TOPICS)) if (model_idx == i).any()]
+    grid = np.unique(timestamps)
+    if first:
+        grid = grid[grid >= max(first)]
+
+    volts = np.full((len(grid), len(BMS_CELL_LABELS)), np.nan)
+    col = 0
+    for i, (orm_model, cells) in enumerate(BMS_CELL_TOPICS):
+        mask = model_idx == i
+        order = np.argsort(timestamps[mask], kind="stable")
+
+        # latest entry of the topic at or before each row
+        rows = np.searchsorted(timestamps[mask][order], grid, side="right") - 1
+        valid = rows >= 0
+        block = np.column_stack([arrays[cell][mask][order] for cell in cells]) * 1e-3  # convert from mV to V
+        volts[valid, col:col + len(cells)] = block[rows[valid]]
+        col += len(cells)
+
+    return grid, volts
+
+def bms_cell_stats(volts: np.ndarray) -> Tuple[DataFrame, np.ndarray]:
+    """min, max and mean of each cell over time, its imbalance (mean deviation from the mean cell of the pack) and its
+    latest voltage, plus the spread of the pack (max - min cell) at each time"""
+    if volts.shape[0] == 0:
+        empty = np.full(volts.shape[1], np.nan)
+        return DataFrame({"cell": BMS_CELL_LABELS, "min": empty, "max": empty, "mean": empty, "imbalance": empty,
+                          "latest": empty}), np.empty(0)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # cells or rows without any voltage are NaN
+        pack_mean = np.nanmean(volts, axis=1, keepdims=True)
+        stats = DataFrame({
+            "cell": BMS_CELL_LABELS,
+            "min": np.nanmin(volts, axis=0),
+            "max": np.nanmax(volts, axis=0),
+            "mean": np.nanmean(volts, axis=0),
+            "imbalance": np.nanmean(volts - pack_mean, axis=0),
+            "latest": volts[-1],
+        })
+        spread = np.nanmax(volts, axis=1) - np.nanmin(volts, axis=1)
+
+    return stats, spread
 
 
 ### Preprocessing ######################################################################################################
 
+def rescale(df: DataFrame, col: str, factor: float) -> None:
+    """multiply a column by a factor, including its bucket aggregates if the data was downsampled"""
+    df[col] = df[col] * float(factor)  # the column may hold small integers (see 'np_t' in utils/type_lookup.py)
+
+    for aggregate in AGGREGATES:
+        if col + '_' + aggregate in df:
+            df[col + '_' + aggregate] *= factor
+
+    # a negative factor turns the minimum into the maximum
+    if factor < 0 and col + '_min' in df:
+        df[[col + '_min', col + '_max']] = df[[col + '_max', col + '_min']].values
+
 def preprocess_generic(df: DataFrame) -> DataFrame:
 
     df['timestamp_dt'] = pd.to_datetime(
@@ -145,7 +279,7 @@ def preprocess_generic(df: DataFrame) -> DataFrame:
 def preprocess_speed(df: DataFrame) -> DataFrame:
     """prepare data frame for plotting"""
     # rescale to km/h
-    df['speed'] *= 3.6
+    rescale(df, 'speed', 3.6)
 
     return preprocess_generic(df)
 
@@ -162,10 +296,10 @@ def preprocess_driverResponse(df: DataFrame) -> DataFrame:
 def preprocess_mppt_power(df: DataFrame) -> DataFrame:
     """prepare data frame for plotting"""
     # rescale voltages and currents according to communication protocol!
-    df['v_out'] *= 1e-2 # [V]
-    df['i_out'] *= 0.5 # [mA]
-    df['v_in'] *= 1e-2 # [V]
-    df['i_in'] *= 0.5 # [mA]
+    rescale(df, 'v_out', 1e-2) # [V]
+    rescale(df, 'i_out', 0.5) # [mA]
+    rescale(df, 'v_in', 1e-2) # [V]
+    rescale(df, 'i_in', 0.5) # [mA]
 
     # P = UI
     df['p_out'] = df['v_out'] * df['i_out'] * 1e-3
@@ -174,16 +308,16 @@ def preprocess_mppt_power(df: DataFrame) -> DataFrame:
     return preprocess_generic(df)
 
 def preprocess_bms_cell_temp(df: DataFrame) -> DataFrame:
-    df['max_cell_temp'] *= 0.1 # [°C]
-    df['min_cell_temp'] *= 0.1 # [°C]
+    rescale(df, 'max_cell_temp', 0.1) # [°C]
+    rescale(df, 'min_cell_temp', 0.1) # [°C]
 
     return preprocess_generic(df)
 
 def preprocess_bms_pack_data(df: DataFrame) -> DataFrame:
 
     """prepare data frame for plotting"""
-    df['battery_voltage'] *= 1e-3    # Rescale
-    df['battery_current'] *= -1
+    rescale(df, 'battery_voltage', 1e-3)    # Rescale
+    rescale(df, 'battery_current', -1)
 
     # P = UI (current is given in mV -> multiply with 1e-3 to get W)
     df['battery_power'] = df['battery_voltage'] * df['battery_current'] * 1e-3
@@ -192,6 +326,27 @@ def preprocess_bms_pack_data(df: DataFrame) -> DataFrame:
 
 def preprocess_bms_soc_data(df: DataFrame) -> DataFrame:
 
-    df['soc_percent'] = df['soc_percent'] * 100  # Correct scaling
+    rescale(df, 'soc_percent', 100)  # Correct scaling
+
+    return preprocess_generic(df)
 
-    return preprocess_generic(df)
\ No newline at end of file
+# Preprocessing of the entries of each topic, for values that are not loaded by the functions above. Append here.
+topic_preprocess = {
+    IcuHeartbeat.__tablename__: preprocess_speed,
+    StwheelHeartbeat.__tablename__: preprocess_driverResponse,
+    MpptPowerMeas0.__tablename__: preprocess_mppt_power,
+    MpptPowerMeas1.__tablename__: preprocess_mppt_power,
+    MpptPowerMeas2.__tablename__: preprocess_mppt_power,
+    MpptPowerMeas3.__tablename__: preprocess_mppt_power,
+    BmsMinMaxCellTemp.__tablename__: preprocess_bms_cell_temp,
+    BmsPackVoltageCurrent.__tablename__: preprocess_bms_pack_data,
+    BmsPackSoc.__tablename__: preprocess_bms_soc_data,
+}
+
+def preprocess_values(topic: str, timestamp: float, values: dict) -> dict:
+    """rescale the values of one entry of a topic, e.g. a live frame (see db/live.py), like the loaded entries"""
+    df = DataFrame([values])
+    df['timestamp'] = timestamp
+    df = topic_preprocess.get(topic, preprocess_generic)(df)
+
+    return df.drop(columns=['timestamp', 'timestamp_dt']).to_dict('records')[0]
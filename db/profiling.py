@@ -0,0 +1,178 @@
+"""
+Timing of all SQL statements run by the engines of DbService, grouped by statement and caller (the dashboard callback
+and the function of db/load_data.py that issued it). Shown on the 'Profiling' page of the dashboard.
+"""
+import bisect
+import contextvars
+import functools
+import os
+import re
+import sys
+import threading
+import time
+
+from sqlalchemy import Engine, event
+from typing import Dict, List, Optional, Tuple
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+ENABLED = True  # Costs a few microseconds per statement, which is negligible compared to the statement itself
+HISTOGRAM_EDGES = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)  # [ms] Upper bounds of the histogram bins
+MAX_STATEMENT_LENGTH = 300  # Statements are shortened to this length for display
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_LOAD_DATA = os.path.join(_ROOT, "db", "load_data.py")
+_PAGES = os.path.join(_ROOT, "frontend", "pages")
+
+_page: contextvars.ContextVar = contextvars.ContextVar("profiled_page", default=None)  # See 'set_page'
+
+
+class StatementStats:
+    """ Aggregated timing of one statement issued by one caller"""
+
+    def __init__(self, statement: str, caller: str):
+        self.statement = statement
+        self.caller = caller
+        self.count: int = 0
+        self.total_time: float = 0.0  # [s]
+        self.max_time: float = 0.0  # [s]
+        self.rows: int = 0  # Rows fetched into DataFrames or arrays, see db/fetch.py
+        self.histogram: List[int] = [0] * (len(HISTOGRAM_EDGES) + 1)  # The last bin holds all slower statements
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time / self.count if self.count else 0.0
+
+    def as_dict(self) -> dict:
+        return {"Caller": self.caller,
+                "Statement": self.statement,
+                "Count": self.count,
+                "Mean [ms]": round(self.mean_time * 1e3, 2),
+                "Max [ms]": round(self.max_time * 1e3, 2),
+                "Total [s]": round(self.total_time, 3),
+                "Rows": self.rows}
+
+
+class QueryProfiler:
+    """ Collects the statistics of all statements. Thread safe, since the dashboard runs callbacks in parallel."""
+
+    def __init__(self):
+        self.stats: Dict[Tuple[str, str], StatementStats] = {}
+        self.since: float = time.time()
+        self._lock = threading.Lock()
+        self._last = threading.local()  # Stats of the latest statement of each thread, to add the fetched rows
+
+    def record(self, statement: str, caller: str, duration: float) -> None:
+        key = (statement, caller)
+
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = StatementStats(statement, caller)
+
+            stats.count += 1
+            stats.total_time += duration
+            stats.max_time = max(stats.max_time, duration)
+            stats.histogram[bisect.bisect_left(HISTOGRAM_EDGES, duration * 1e3)] += 1
+
+        self._last.stats = stats
+
+    def add_rows(self, n_rows: int) -> None:
+        """ Add fetched rows to the latest statement of the calling thread"""
+        stats: Optional[StatementStats] = getattr(self._last, "stats", None)
+        if stats is not None:
+            with self._lock:
+                stats.rows += n_rows
+
+    def top(self, n: int, by: str) -> List[StatementStats]:
+        """ Returns the n statements with the highest value of an attribute, e.g. 'mean_time', 'total_time', 'count'"""
+        with self._lock:
+            return sorted(self.stats.values(), key=lambda stats: getattr(stats, by), reverse=True)[:n]
+
+    def histogram(self) -> List[int]:
+        """ Returns the histogram of all statements"""
+        with self._lock:
+            return [sum(bins) for bins in zip(*[stats.histogram for stats in self.stats.values()])] or \
+                   [0] * (len(HISTOGRAM_EDGES) + 1)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.stats.clear()
+            self.since = time.time()
+
+
+profiler = QueryProfiler()
+
+
+def _find_callers(frame) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """ Walks up the stack and returns the dashboard page function, the load function and the script function found"""
+    page_function = load_function = script_function = None
+
+    while frame is not None and page_function is None:
+        path = frame.f_code.co_filename
+
+        if load_function is None and path == _LOAD_DATA:
+            load_function = frame.f_code.co_name
+        elif path.startswith(_PAGES):
+            page_function = os.path.splitext(os.path.basename(path))[0] + "." + frame.f_code.co_name
+        elif script_function is None and os.path.dirname(path) == _ROOT:
+            script_function = os.path.basename(path) + ":" + frame.f_code.co_name
+
+        frame = frame.f_back
+
+    return page_function, load_function, script_function
+
+
+def caller_page() -> Optional[str]:
+    """ Returns the dashboard page function that called the current function, None outside of the dashboard"""
+    return _find_callers(sys._getframe(1))[0]
+
+
+def set_page(page: Optional[str]) -> contextvars.Token:
+    """ Attribute the statements of the current context to a page, e.g. before its loads are passed to worker threads
+        (asyncio.to_thread copies the context). Reset the returned token afterwards."""
+    return _page.set(page)
+
+
+def reset_page(token: contextvars.Token) -> None:
+    _page.reset(token)
+
+
+def _caller() -> str:
+    """ Returns the dashboard page function and the load function that issued the current statement, e.g.
+        'overview.update_data > append_speed_data'. Other callers (e.g. the logger) are named by their script"""
+    page_function, load_function, script_function = _find_callers(sys._getframe(2))
+
+    names = [name for name in (page_function or _page.get() or script_function, load_function) if name is not None]
+    return " > ".join(names) if names else "unknown"
+
+
+@functools.lru_cache(maxsize=1024)  # The same statements are issued over and over again
+def _normalize(statement: str) -> str:
+    statement = re.sub(r"\s+", " ", statement).strip()
+    return statement if len(statement) <= MAX_STATEMENT_LENGTH else statement[:MAX_STATEMENT_LENGTH] + "..."
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    duration = time.perf_counter() - conn.info["query_start_time"].pop()
+    profiler.record(_normalize(statement), _caller(), duration)
+
+
+def _handle_error(context) -> None:
+    # Failed statements are not recorded
+    if context.connection is not None and context.connection.info.get("query_start_time"):
+        context.connection.info["query_start_time"].pop()
+
+
+def instrument(engine: Engine) -> None:
+    """ Record the statements of an engine, if profiling is enabled"""
+    if ENABLED:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
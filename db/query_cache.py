@@ -0,0 +1,122 @@
+"""Process-wide cache of query results, shared by all DbService instances (i.e. by all dashboard pages and tabs)"""
+import sys
+import threading
+import time
+
+from collections import OrderedDict
+from pandas import DataFrame
+from typing import Callable, Dict, Hashable, Tuple
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+LIVE_TTL = 1.0  # [s] Lifetime of results that change with new data, e.g. the latest entries. Below the reload interval
+RANGE_TTL = 300.0  # [s] Lifetime of results of time ranges that lie in the past
+RANGE_SETTLE_TIME = 60.0  # [s] Ranges ending later than this before now are treated as live
+MAX_BYTES = 256 * 2 ** 20  # Memory cap of the cache. Least recently used results are evicted first
+
+
+def _size_of(value) -> int:
+    """Approximate memory used by a cached value in bytes"""
+    if isinstance(value, DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_size_of(v) for v in value.values())
+    return sys.getsizeof(value) + sys.getsizeof(getattr(value, "__dict__", None))
+
+
+def _copy(value):
+    """Callers modify returned DataFrames in place (e.g. rescaling), so they never get the cached object itself"""
+    if isinstance(value, DataFrame):
+        return value.copy()
+    if isinstance(value, dict):
+        return dict(value)
+    return value
+
+
+class QueryCache:
+    """ LRU cache with a time to live per entry and a memory cap. The first element of each key is a tuple of the
+        table names the result depends on, which allows to invalidate all results of a table after new data was
+        inserted. Concurrent requests for the same key are merged, so only one of them queries the DB."""
+
+    def __init__(self, max_bytes: int = MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size: int = 0  # [bytes]
+        self.hits: int = 0
+        self.misses: int = 0
+
+        self._entries: OrderedDict = OrderedDict()  # key -> (expiry time, size, value), least recently used first
+        self._loading: Dict[Hashable, threading.Lock] = {}  # key -> lock held while the result is loaded
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple) -> Tuple[bool, any]:
+        """Returns (True, value) if the key is cached and not expired, (False, None) otherwise"""
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None or entry[0] < time.monotonic():
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, _copy(entry[2])
+
+    def put(self, key: Tuple, value, ttl: float) -> None:
+        size = _size_of(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, size, _copy(value))
+            self.size += size
+
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def get_or_load(self, key: Tuple, ttl: float, load: Callable[[], any]):
+        """Returns the cached value of the key, or calls 'load' and caches its result"""
+        found, value = self.get(key)
+        if found:
+            return value
+
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread may have loaded the value in the meantime
+            found, value = self.get(key)
+            if found:
+                return value
+
+            with self._lock:
+                self.misses += 1
+
+            try:
+                value = load()
+                self.put(key, value, ttl)
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+
+        return value
+
+    def invalidate(self, table_name: str) -> None:
+        """Remove all results that depend on a table"""
+        with self._lock:
+            for key in [key for key in self._entries if table_name in key[0]]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key: Tuple) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+
+query_cache = QueryCache()
@@ -0,0 +1,266 @@
+"""
+Aggregates of the raw data in buckets of 1 s, 10 s and 1 min ('rollups'), maintained incrementally as data is inserted.
+Downsampled queries read the coarsest rollup that still meets the requested resolution instead of the raw rows.
+"""
+import datetime
+import math
+import time
+
+import numpy as np
+
+from sqlalchemy import Column, Connection, Double, Integer, BigInteger, Select, String, Table, delete, func, select, \
+    update
+from sqlalchemy.orm import declarative_base
+from typing import Dict, List, Optional, Tuple
+
+from db.models import Base, ddl_models
+from db.downsampling import AGGREGATES, bucket_frame, bucket_statement, data_columns, raw_timestamp
+from db.fetch import column_dtypes, read_frame
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+RESOLUTIONS = (1, 10, 60)  # [s] Bucket durations, ascending. Each rollup is computed from the previous one
+RAW_RETENTION: Optional[datetime.timedelta] = None  # Raw rows older than this are deleted, once they are rolled up.
+                                                    # None keeps all raw rows
+
+
+def _define_rollup_table(orm_model: declarative_base, resolution: int) -> Table:
+    """ Rollup table of a topic. Each row holds one bucket in the same format as the rows returned by
+        'bucket_statement', i.e. the last entry of the bucket plus its count, min, max and mean per data column"""
+    fields = [c.name for c in data_columns(orm_model)]
+
+    return Table(
+        "%s_%ss" % (orm_model.__tablename__, resolution), Base.metadata,
+        Column("bucket", Double(), primary_key=True, autoincrement=False),  # Start of the bucket as unix timestamp
+        Column("id", BigInteger()),  # Id of the last raw entry in the bucket
+        Column("timestamp", orm_model.__table__.c.timestamp.type),  # Timestamp of the last raw entry
+        *[Column(field, Double()) for field in fields],  # Values of the last raw entry
+        Column("count", Integer()),
+        *[Column(field + "_" + aggregate, Double()) for field in fields for aggregate in AGGREGATES],
+        info={"fields": fields, "resolution": resolution},
+    )
+
+
+# Rollup tables of all topics, keyed by model and resolution. Created together with the tables of the models
+rollup_tables: Dict[declarative_base, Dict[int, Table]] = {
+    orm_model: {resolution: _define_rollup_table(orm_model, resolution) for resolution in RESOLUTIONS}
+    for orm_model in ddl_models.values()
+}
+
+
+# Progress of the rollups of each topic
+rollup_state = Table(
+    "rollup_state", Base.metadata,
+    Column("table_name", String(64), primary_key=True),
+    Column("rolled_id", BigInteger()),  # Raw entries up to this id are rolled up
+    Column("pruned_until", Double()),  # Raw entries before this timestamp may have been deleted, see 'mark_pruned'
+)
+
+
+def pick_rollup(orm_model: declarative_base, bucket_width: float) -> Optional[Table]:
+    """ Returns the coarsest rollup table whose resolution is at least as fine as the bucket width, None if the raw
+        table has to be used"""
+    rollups = rollup_tables.get(orm_model, {})
+    resolutions = [resolution for resolution in rollups if resolution <= bucket_width]
+    return rollups[max(resolutions)] if resolutions else None
+
+
+def rollup_bucket_statement(rollup: Table, start_ts: float, end_ts: Optional[float], bucket_width: float,
+                            origin_ts: Optional[float] = None, with_bucket: bool = False) -> Select:
+    """ Same as 'bucket_statement' in db/downsampling.py, but aggregates the buckets of a rollup table into coarser
+        buckets. The range selects the rollup buckets by their start."""
+    fields = rollup.info["fields"]
+    origin_ts = start_ts if origin_ts is None else origin_ts
+
+    bucket = func.floor((rollup.c.bucket - origin_ts) / bucket_width).label("bucket")
+    total = func.sum(rollup.c["count"])
+
+    aggregates = [total.label("count"),
+                  func.max(rollup.c.bucket).label("last_bucket")]
+    for field in fields:
+        aggregates += [func.min(rollup.c[field + "_min"]).label(field + "_min"),
+                       func.max(rollup.c[field + "_max"]).label(field + "_max"),
+                       (func.sum(rollup.c[field + "_mean"] * rollup.c["count"]) / total).label(field + "_mean")]
+
+    in_range = [rollup.c.bucket >= start_ts]
+    if end_ts is not None:
+        in_range.append(rollup.c.bucket <= end_ts)
+
+    buckets = (select(bucket, *aggregates)
+               .where(*in_range)
+               .group_by(bucket)
+               .subquery())
+
+    # Join the last rollup bucket of each bucket to get its timestamp and values
+    return (select(rollup.c.id, rollup.c.timestamp, *[rollup.c[field] for field in fields],
+                   *[c for c in buckets.c if c.name not in ("bucket", "last_bucket")],
+                   *([buckets.c.bucket] if with_bucket else []))
+            .join_from(buckets, rollup, rollup.c.bucket == buckets.c.last_bucket)
+            .order_by(rollup.c.timestamp.desc()))
+
+
+def last_bucket(conn: Connection, rollup: Table) -> Optional[float]:
+    """ Start of the newest bucket of a rollup, None if the rollup is empty. This bucket may be incomplete."""
+    return conn.execute(select(func.max(rollup.c.bucket))).scalar()
+
+
+def first_bucket(conn: Connection, rollup: Table) -> Optional[float]:
+    """ Start of the oldest bucket of a rollup, None if the rollup is empty. Raw entries before it are not rolled up"""
+    return conn.execute(select(func.min(rollup.c.bucket))).scalar()
+
+
+def _state(conn: Connection, orm_model: declarative_base) -> Tuple[Optional[int], Optional[float]]:
+    # Returns (rolled_id, pruned_until) of a topic
+    row = conn.execute(select(rollup_state.c.rolled_id, rollup_state.c.pruned_until)
+                       .where(rollup_state.c.table_name == orm_model.__tablename__)).first()
+    return (row.rolled_id, row.pruned_until) if row is not None else (None, None)
+
+
+def _set_state(conn: Connection, orm_model: declarative_base, **values) -> None:
+    updated = conn.execute(update(rollup_state)
+                           .where(rollup_state.c.table_name == orm_model.__tablename__)
+                           .values(**values))
+    if updated.rowcount == 0:
+        conn.execute(rollup_state.insert().values(table_name=orm_model.__tablename__, **values))
+
+
+def mark_pruned(conn: Connection, orm_model: declarative_base, until_ts: float) -> None:
+    """ Record that raw entries of a topic before a timestamp may have been deleted (retention or archive). The
+        buckets of this range are never rebuilt from the raw table again, new entries are merged into them instead."""
+    _, pruned_until = _state(conn, orm_model)
+    _set_state(conn, orm_model, pruned_until=max(until_ts, pruned_until or until_ts))
+
+
+def _dirty_ranges(conn: Connection, orm_model: declarative_base, rolled_id: Optional[int],
+                  max_id: int) -> List[Tuple[float, float]]:
+    # Ranges [start, end) of whole buckets of the coarsest rollup that received entries after rolled_id
+    width = RESOLUTIONS[-1]
+    timestamp, scale = raw_timestamp(orm_model)
+    new = [orm_model.id <= max_id] + ([orm_model.id > rolled_id] if rolled_id is not None else [])
+
+    starts = sorted(row[0] * width for row in
+                    conn.execute(select(func.floor(timestamp / (width * scale))).where(*new).distinct()))
+
+    ranges: List[Tuple[float, float]] = []
+    for start in starts:
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], start + width)
+        else:
+            ranges.append((start, start + width))
+    return ranges
+
+
+def _rebuild(conn: Connection, orm_model: declarative_base, resolution: int, rollup: Table, source: Optional[Table],
+             start_ts: float, end_ts: float) -> None:
+    # Recompute the buckets of a rollup within [start_ts, end_ts) from the raw table (source None) or a finer rollup
+    last_ts = float(np.nextafter(end_ts, -np.inf))
+    if source is None:
+        buckets = bucket_statement(orm_model, start_ts, last_ts, resolution, origin_ts=0, with_bucket=True)
+    else:
+        buckets = rollup_bucket_statement(source, start_ts, last_ts, resolution, origin_ts=0, with_bucket=True)
+    buckets = buckets.subquery()
+    columns = [c for c in buckets.c if c.name != "bucket"]
+
+    conn.execute(delete(rollup).where(rollup.c.bucket >= start_ts, rollup.c.bucket < end_ts))
+    conn.execute(rollup.insert().from_select(["bucket"] + [c.name for c in columns],
+                                             select(buckets.c.bucket * resolution, *columns)))
+
+
+def _merge(conn: Connection, orm_model: declarative_base, resolution: int, rollup: Table, start_ts: float,
+           end_ts: float, rolled_id: Optional[int], max_id: int) -> None:
+    # Merge the entries after rolled_id within [start_ts, end_ts) into the existing buckets of the finest rollup. Used
+    # where the raw entries of the buckets may have been deleted, so they can't be rebuilt
+    fields = rollup.info["fields"]
+    new = [orm_model.id <= max_id] + ([orm_model.id > rolled_id] if rolled_id is not None else [])
+    entries = read_frame(conn, select(orm_model).where(orm_model.timestamp >= start_ts, orm_model.timestamp < end_ts,
+                                                       *new),
+                         column_dtypes(orm_model))
+    if entries.empty:
+        return
+
+    added = bucket_frame(entries, fields, 0, resolution)
+    added["bucket"] = np.floor(added["timestamp"] / resolution) * resolution  # The last entry lies in its bucket
+    existing = read_frame(conn, select(rollup).where(rollup.c.bucket.in_(added["bucket"].tolist())), {})
+    existing = existing.set_index("bucket").reindex(added["bucket"])
+
+    merged = added.set_index("bucket")
+    has_existing = existing["count"].notna().to_numpy()
+    if has_existing.any():
+        old, add = existing[has_existing], merged[has_existing]
+        count = old["count"] + add["count"]
+        combined = add.copy()
+        for field in fields:
+            combined[field + "_min"] = np.fmin(old[field + "_min"], add[field + "_min"])
+            combined[field + "_max"] = np.fmax(old[field + "_max"], add[field + "_max"])
+            combined[field + "_mean"] = (old[field + "_mean"] * old["count"] + add[field + "_mean"] * add["count"]) / count
+        combined["count"] = count
+
+        # The last entry of a bucket is the newer one of both
+        keep_old = (old["timestamp"] > add["timestamp"]).to_numpy()
+        combined.loc[keep_old, ["id", "timestamp"] + fields] = old.loc[keep_old, ["id", "timestamp"] + fields]
+        merged.loc[has_existing] = combined
+
+    conn.execute(delete(rollup).where(rollup.c.bucket.in_(merged.index.tolist())))
+    conn.execute(rollup.insert(), merged.reset_index()[[c.name for c in rollup.c]].to_dict("records"))
+
+
+def update_rollups(conn: Connection, orm_model: declarative_base) -> None:
+    """ Aggregate the raw entries of a topic that were added since the last update into the rollups. Only the buckets
+        that received entries are recomputed, e.g. after decoding an old logfile. On the first update all raw entries
+        are aggregated. Buckets whose raw entries may have been deleted (see 'mark_pruned') are not recomputed, the
+        new entries are merged into them.
+
+        Inputs:
+            conn (Connection): Connection with an open transaction
+            orm_model (declarative_base): The ORM model of the topic"""
+    rolled_id, pruned_until = _state(conn, orm_model)
+    max_id = conn.execute(select(func.max(orm_model.id))).scalar()
+    if rolled_id is not None and max_id is not None and max_id < rolled_id:
+        # The ids restarted after the table was emptied (SQLite tables created before the ids were made non-reusable,
+        # see templates/models.py.j2). All remaining entries are either new or not pruned, so all of them are rolled up
+        rolled_id = None
+    if max_id is None or (rolled_id is not None and max_id <= rolled_id):
+        return
+
+    # Buckets of the coarsest rollup that are partly pruned count as pruned
+    width = RESOLUTIONS[-1]
+    pruned_until = -math.inf if pruned_until is None else math.ceil(pruned_until / width) * width
+
+    rollups = rollup_tables[orm_model]
+    for start_ts, end_ts in _dirty_ranges(conn, orm_model, rolled_id, max_id):
+        for range_start, range_end, pruned in ((start_ts, min(end_ts, pruned_until), True),
+                                               (max(start_ts, pruned_until), end_ts, False)):
+            if range_start >= range_end:
+                continue
+
+            source: Optional[Table] = None  # The raw table for the finest rollup, afterwards the previous rollup
+            for resolution, rollup in rollups.items():
+                if pruned and source is None:
+                    _merge(conn, orm_model, resolution, rollup, range_start, range_end, rolled_id, max_id)
+                else:
+                    _rebuild(conn, orm_model, resolution, rollup, source, range_start, range_end)
+                source = rollup
+
+    _set_state(conn, orm_model, rolled_id=max_id)
+
+
+def apply_retention(conn: Connection, orm_model: declarative_base, retention: datetime.timedelta) -> int:
+    """ Delete the raw entries of a topic that are older than the retention time and already rolled up
+
+        Inputs:
+            conn (Connection): Connection with an open transaction
+            orm_model (declarative_base): The ORM model of the topic
+            retention (datetime.timedelta): Minimum age of deleted entries
+
+        Returns:
+            int: Number of deleted entries"""
+    covered_until = last_bucket(conn, rollup_tables[orm_model][RESOLUTIONS[0]])
+    rolled_id, _ = _state(conn, orm_model)
+    if covered_until is None or rolled_id is None:
+        return 0
+
+    cutoff = min(time.time() - retention.total_seconds(), covered_until)
+    mark_pruned(conn, orm_model, cutoff)
+    return conn.execute(delete(orm_model).where(orm_model.timestamp < cutoff, orm_model.id <= rolled_id)).rowcount
@@ -0,0 +1,87 @@
+"""
+Versions of the tables, used to invalidate the caches of other processes. The caches of a process (see
+db/query_cache.py and db/interval_cache.py) are only invalidated by its own inserts, but the logger and the dashboard
+are separate processes. Entries of live data don't need a signal, the cached results that reach up to now expire after
+LIVE_TTL anyway. Entries inserted into ranges that lie in the past (e.g. by decoding an old logfile) change results
+that are cached for RANGE_TTL, so the writing process bumps the version of their tables. Each process reads the versions
+at most once per CHECK_INTERVAL and invalidates the tables whose version changed.
+"""
+import threading
+import time
+
+from sqlalchemy import BigInteger, Column, Connection, Engine, String, Table, select, update
+from typing import Callable, Dict, Iterable
+
+from db.models import Base
+from db.query_cache import LIVE_TTL
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+CHECK_INTERVAL = LIVE_TTL  # [s] Time between two reads of the versions
+
+# Version of each table with entries inserted into the past. Created together with the tables of the models
+versions_table = Table(
+    "table_versions", Base.metadata,
+    Column("table_name", String(64), primary_key=True),
+    Column("version", BigInteger()),
+)
+
+
+def bump(conn: Connection, table_names: Iterable[str]) -> None:
+    """ Increment the versions of tables
+
+        Inputs:
+            conn (Connection): Connection with an open transaction
+            table_names (Iterable[str]): Names of the changed tables"""
+    for table_name in table_names:
+        bumped = conn.execute(update(versions_table)
+                              .where(versions_table.c.table_name == table_name)
+                              .values(version=versions_table.c.version + 1))
+        if bumped.rowcount == 0:
+            conn.execute(versions_table.insert().values(table_name=table_name, version=1))
+
+
+def read(conn: Connection) -> Dict[str, int]:
+    """ Returns the versions of all tables that were bumped at least once"""
+    return {row.table_name: row.version for row in conn.execute(select(versions_table))}
+
+
+class VersionWatcher:
+    """ Versions of the tables last read by this process, per DB. Thread safe."""
+
+    def __init__(self, check_interval: float = CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self.versions: Dict[str, Dict[str, int]] = {}  # Connection string -> versions
+        self.next_check: Dict[str, float] = {}  # Connection string -> monotonic time of the next read
+        self._lock = threading.Lock()
+
+    def sync(self, engine: Engine, invalidate: Callable[[str], None]) -> None:
+        """ Read the versions, if the last read is older than the check interval, and invalidate the changed tables.
+            Call this before reading a cache
+
+            Inputs:
+                engine (Engine): Engine of the DB
+                invalidate (Callable[[str], None]): Invalidates the cached results of a table"""
+        key = str(engine.url)
+        with self._lock:
+            if time.monotonic() < self.next_check.get(key, 0.0):
+                return
+            self.next_check[key] = time.monotonic() + self.check_interval
+
+        with engine.connect() as conn:
+            versions = read(conn)
+
+        with self._lock:
+            previous = self.versions.get(key)
+            self.versions[key] = versions
+
+        # Nothing is cached before the first read
+        if previous is not None:
+            for table_name, version in versions.items():
+                if previous.get(table_name) != version:
+                    invalidate(table_name)
+
+
+watcher = VersionWatcher()
@@ -1,7 +1,11 @@
 import argparse
+import datetime
 
 import db_seeder
 from db.db_service import DbService
+from db import liveness
+from db.archive import ARCHIVE_AFTER
+from db.rollups import RAW_RETENTION
 
 
 def _create_base_argument_parser(parser: argparse.ArgumentParser) -> None:
@@ -14,6 +18,46 @@ def _create_base_argument_parser(parser: argparse.ArgumentParser) -> None:
         action="store_true",
     )
 
+    parser.add_argument(
+        "-i",
+        "--index",
+        help=r"Add missing indexes to existing DB tables",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-u",
+        "--rollup",
+        help=r"Aggregate all tables into the rollup tables and delete raw data older than the retention time",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--retention",
+        help=r"Retention time of raw data in days for --rollup (default: RAW_RETENTION in db/rollups.py)",
+        type=float,
+    )
+
+    parser.add_argument(
+        "-a",
+        "--archive",
+        help=r"Move old entries into Parquet files (default age: ARCHIVE_AFTER in db/archive.py)",
+        nargs="?",
+        const=-1,
+        type=float,
+        metavar="DAYS",
+    )
+
+    parser.add_argument(
+        "-l",
+        "--liveness",
+        help=r"Print the uptime and the outages of the modules within the last hours (default: 24)",
+        nargs="?",
+        const=24,
+        type=float,
+        metavar="HOURS",
+    )
+
     parser.add_argument(
         "-s",
         "--seed",
@@ -31,5 +75,31 @@ if __name__ == "__main__":
     if results.refresh:
         db: DbService = DbService()
         db.refresh()
+    elif results.index:
+        db: DbService = DbService()
+        db.create_indexes()
+    elif results.rollup:
+        db: DbService = DbService()
+        db.update_rollups(all_models=True)
+
+        retention = RAW_RETENTION if results.retention is None else datetime.timedelta(days=results.retention)
+        if retention is not None:
+            print("Deleted %d raw entries" % db.apply_retention(retention))
+    elif results.archive is not None:
+        older_than = ARCHIVE_AFTER if results.archive < 0 else datetime.timedelta(days=results.archive)
+        if older_than is None:
+            print("No archive age given and ARCHIVE_AFTER is disabled")
+        else:
+            db: DbService = DbService()
+            print("Archived %d entries" % db.move_to_archive(older_than))
+    elif results.liveness is not None:
+        db: DbService = DbService()
+        end_time = datetime.datetime.now()
+        start_time = end_time - datetime.timedelta(hours=results.liveness)
+
+        events = db.query_liveness_events(start_time, end_time)
+        print(liveness.uptime_report(events, start_time.timestamp(), end_time.timestamp()).to_string(index=False))
+        print()
+        print(liveness.outages(events, start_time.timestamp(), end_time.timestamp()).to_string(index=False))
     elif results.seed:
         db_seeder.main()
\ No newline at end of file
@@ -1,41 +1,18 @@
 # This file contains the layout for the data visualisation used in 'overview' and 'analyzer'
+import io
+import zipfile
+
+import numpy as np
+
+from typing import List
 
 from db.load_data import *
+from db.alignment import combine_streams
+from db.async_db_service import load_many
 from frontend import Table
 from frontend.Table import DataRow
 
 
-def get_nearest_index(df: DataFrame, current_idx: int, target_timestamp: float) -> int:
-    ### returns the index of the given dataframe with the nearest timestamp to the target timestamp. This function
-    # assumes that the entries in the dataframe are ordered by timestamp (newest to oldest)###
-    idx_max = len(df.index)
-    current_timestamp = df['timestamp'].values[current_idx]
-
-    # Move to next timestamp, if it is closer
-    while current_timestamp > target_timestamp and current_idx < idx_max - 1:
-
-        new_timestamp = df['timestamp'].values[current_idx + 1]
-
-        if abs(new_timestamp - target_timestamp) < (current_timestamp - target_timestamp):
-            current_idx += 1
-            current_timestamp = new_timestamp
-        else:
-            break
-
-    return current_idx
-
-
-def getMinMaxMeanLast(df: Union[DataFrame, None], col: str, numberFormat: str) -> Tuple[str, str, str, str]:
-    # Returns the minimum, maximum, mean and last entry of a given column in a Pandas.DataFrame as a string
-    if df is None or df.empty:
-        return 'No Data', 'No Data', 'No Data', 'No Data'
-    else:
-        return (('{:' + numberFormat + '}').format(df[col].min()),
-                ('{:' + numberFormat + '}').format(df[col].max()),
-                ('{:' + numberFormat + '}').format(df[col].mean()),
-                ('{:' + numberFormat + '}').format(df[col][0]))
-
-
 class DataSection:
     max_time_offset: datetime.timedelta  # Maximum time offset between two measurements that are added together
     timespan_loaded: datetime.timedelta  # (maximum) Time between the first and last displayed entry.
@@ -47,31 +24,44 @@ class DataSection:
         self.max_time_offset = max_time_offset
 
         self.table_data = {
-            'df_speed': Table.TableDataFrame(append_from_db=append_speed_data, load_from_db=load_speed_data),
+            'df_speed': Table.TableDataFrame(append_from_db=append_speed_data, load_from_db=load_speed_data,
+                                             stream_from_db=stream_speed_data),
             'df_motorPow': Table.TableDataFrame(refresh=refresh_motorPow),
             'df_mpptPow': Table.TableDataFrame(),
             'df_mpptPow0': Table.TableDataFrame(append_from_db=append_mppt_power0_data,
-                                                load_from_db=load_mppt_power0_data),
+                                                load_from_db=load_mppt_power0_data,
+                                                stream_from_db=stream_mppt_power0_data),
             'df_mpptPow1': Table.TableDataFrame(append_from_db=append_mppt_power1_data,
-                                                load_from_db=load_mppt_power1_data),
+                                                load_from_db=load_mppt_power1_data,
+                                                stream_from_db=stream_mppt_power1_data),
             'df_mpptPow2': Table.TableDataFrame(append_from_db=append_mppt_power2_data,
-                                                load_from_db=load_mppt_power2_data),
+                                                load_from_db=load_mppt_power2_data,
+                                                stream_from_db=stream_mppt_power2_data),
             'df_mpptPow3': Table.TableDataFrame(append_from_db=append_mppt_power3_data,
-                                                load_from_db=load_mppt_power3_data),
+                                                load_from_db=load_mppt_power3_data,
+                                                stream_from_db=stream_mppt_power3_data),
             'df_mpptStat0': Table.TableDataFrame(append_from_db=append_mppt_status0_data,
-                                                 load_from_db=load_mppt_status0_data),
+                                                 load_from_db=load_mppt_status0_data,
+                                                 stream_from_db=stream_mppt_status0_data),
             'df_mpptStat1': Table.TableDataFrame(append_from_db=append_mppt_status1_data,
-                                                 load_from_db=load_mppt_status1_data),
+                                                 load_from_db=load_mppt_status1_data,
+                                                 stream_from_db=stream_mppt_status1_data),
             'df_mpptStat2': Table.TableDataFrame(append_from_db=append_mppt_status2_data,
-                                                 load_from_db=load_mppt_status2_data),
+                                                 load_from_db=load_mppt_status2_data,
+                                                 stream_from_db=stream_mppt_status2_data),
             'df_mpptStat3': Table.TableDataFrame(append_from_db=append_mppt_status3_data,
-                                                 load_from_db=load_mppt_status3_data),
-            'df_bat_pack': Table.TableDataFrame(append_from_db=append_bms_pack_data, load_from_db=load_bms_pack_data),
-            'df_soc': Table.TableDataFrame(append_from_db=append_bms_soc_data, load_from_db=load_bms_soc_data),
+                                                 load_from_db=load_mppt_status3_data,
+                                                 stream_from_db=stream_mppt_status3_data),
+            'df_bat_pack': Table.TableDataFrame(append_from_db=append_bms_pack_data, load_from_db=load_bms_pack_data,
+                                                stream_from_db=stream_bms_pack_data),
+            'df_soc': Table.TableDataFrame(append_from_db=append_bms_soc_data, load_from_db=load_bms_soc_data,
+                                           stream_from_db=stream_bms_soc_data),
             'df_cellVolt': Table.TableDataFrame(append_from_db=append_bms_cell_voltage_data,
-                                                load_from_db=load_bms_cell_voltage_data),
+                                                load_from_db=load_bms_cell_voltage_data,
+                                                stream_from_db=stream_bms_cell_voltage_data),
             'df_cellTemp': Table.TableDataFrame(append_from_db=append_bms_cell_temp_data,
-                                                load_from_db=load_bms_cell_temp_data)}
+                                                load_from_db=load_bms_cell_temp_data,
+                                                stream_from_db=stream_bms_cell_temp_data)}
 
         self.table_layout = [
             Table.DataRow(title='Speed [km/h]', df_name='df_speed', df_col='speed', numberFormat='3.1f'),
@@ -123,12 +113,14 @@ class DataSection:
             Table.DataRow(title='MPPT String 3 Heatsink Temperature [°C]', df_name='df_mpptStat3',
                           df_col='heatsink_temp')]
 
-    def refresh(self, db_serv: DbService, timestamp_start: datetime.datetime, timestamp_end: datetime.datetime, loading_interval: int):
+    def refresh(self, timestamp_start: datetime.datetime, timestamp_end: datetime.datetime, n_points: int):
         ### Load new data into dataframes and update the view correspondingly ###
 
-        # Load data that just can be pulled from the database
-        for key in self.table_data:
-            self.table_data[key].load_from_db(db_serv, timestamp_start, timestamp_end, loading_interval)
+        # Load data that just can be pulled from the database. All tables are queried concurrently
+        loaded = load_many({key: table.loader(timestamp_start, timestamp_end, n_points)
+                            for key, table in self.table_data.items()})
+        for key, df in loaded.items():
+            self.table_data[key].set_loaded(df)
 
         # Load data that depends on other data. The order of those calls is important!
         self.table_data['df_mpptPow'].df = self.__get_mpptPow()  # Depends on individual mppt powers
@@ -145,17 +137,52 @@ class DataSection:
         for key in self.table_data:
             self.table_data[key].append_from_db(db_serv, n_entries, self.timespan_loaded)
 
-        # Load data that depends on other data. The order of those calls is important!
-        self.table_data['df_mpptPow'].df = self.__get_mpptPow()  # Depends on individual mppt powers
-        self.table_data[
-            'df_motorPow'].df = self.__get_motorPow()  # Depends on total mppt power and battery output power
+        # Append data that depends on other data, only for the new timestamps. The order of those calls is important!
+        self.__append_derived('df_mpptPow', [('df_mpptPow%d' % i, 'p_out') for i in range(4)],
+                              'p_out')  # Depends on individual mppt powers
+        self.__append_derived('df_motorPow', [('df_bat_pack', 'battery_power'), ('df_mpptPow', 'p_out')],
+                              'p_out')  # Depends on total mppt power and battery output power
 
         # Refresh the table layout
         self.__refresh_layout()
 
+    def export(self, db_serv: DbService, timestamp_start: datetime.datetime, timestamp_end: datetime.datetime,
+               path: str) -> None:
+        ### Write all entries of a time range into a zip file with one csv file per table and a summary with the
+        # statistics of the table rows. The entries are streamed chunk by chunk, so the memory used does not depend on
+        # the length of the time range. Tables that are computed from other tables are not exported ###
+        data_rows = [row for row in self.table_layout if type(row) is DataRow]
+        stats = {row.title: Table.RollingStats(evictable=False) for row in data_rows}
+
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as zip_file:
+            for key, table in self.table_data.items():
+                if table.stream_from_db is None:
+                    continue
+
+                rows = [row for row in data_rows if row.df_name == key]
+                with io.TextIOWrapper(zip_file.open(key[len('df_'):] + '.csv', 'w', force_zip64=True),
+                                      encoding='utf-8', newline='') as csv_file:
+                    header = True
+                    for chunk in table.stream_from_db(db_serv, timestamp_start, timestamp_end):
+                        chunk.to_csv(csv_file, header=header, index=False)
+                        header = False
+
+                        newest_first = chunk.iloc[::-1]  # The chunks are ordered by timestamp (oldest first)
+                        for row in rows:
+                            stats[row.title].add(newest_first, row.df_col)
+
+            summary = [dict(zip(['', 'Min', 'Max', 'Mean', 'Last'],
+                                (row.title, *stats[row.title].getMinMaxMeanLast(row.numberFormat))))
+                       for row in data_rows if self.table_data[row.df_name].stream_from_db is not None]
+            zip_file.writestr('summary.csv', pd.DataFrame(summary).to_csv(index=False))
+
+    def memory_usage(self) -> int:
+        ### Approximate memory used by the loaded data in bytes ###
+        return sum(int(table.df.memory_usage(index=True, deep=True).sum())
+                   for table in self.table_data.values() if table.df is not None)
+
     def __get_motorPow(self) -> Union[DataFrame, None]:
-        ### Calculate the total motor output power, based on the output power of battery and pv.
-        # This function needs the elements to be chronologically ordered with the most recent entry at index 0 ###
+        ### Calculate the total motor output power, based on the output power of battery and pv ###
 
         df_batPower = self.table_data['df_bat_pack'].df
         df_mpptPow = self.table_data['df_mpptPow'].df
@@ -164,77 +191,55 @@ class DataSection:
             print("Couldn't load motor output power")
             return self.table_data['df_motorPow'].df
 
-        df_motorPow = pd.DataFrame(columns=['timestamp', 'p_out'])
-        df_motorPow['timestamp'] = df_batPower['timestamp']
-
-        bat_index = mppt_index = 0
-
-        for i in range(len(df_motorPow.index)):
-            timestamp = df_motorPow['timestamp'][i]
-
-            # get index of the nearest timestamp to the one in the output dataframe
-            bat_index = get_nearest_index(df_batPower, bat_index, timestamp)
-            mppt_index = get_nearest_index(df_mpptPow, mppt_index, timestamp)
-
-            timestamp_bat = df_batPower['timestamp'][bat_index]
-            timestamp_mppt = df_mpptPow['timestamp'][mppt_index]
-
-            # Calculate motor power if timestamps are close enough together
-            if abs(timestamp - timestamp_bat) < self.max_time_offset.total_seconds() and abs(
-                    timestamp - timestamp_mppt) < self.max_time_offset.total_seconds():
-                df_motorPow.at[i, 'p_out'] = df_batPower['battery_power'][bat_index] + df_mpptPow['p_out'][mppt_index]
-
-        return preprocess_generic(df_motorPow)
-
+        return preprocess_generic(combine_streams([(df_batPower, 'battery_power'), (df_mpptPow, 'p_out')],
+                                                  self.max_time_offset.total_seconds(), 'p_out'))
 
     def __get_mpptPow(self) -> Union[DataFrame, None]:
-        ### Calculate the total power of the MPPTs, based on the individual measurements of the MPPTs
-        # This function needs the elements to be chronologically ordered with the most recent entry at index 0 ###
+        ### Calculate the total power of the MPPTs, based on the individual measurements of the MPPTs ###
 
-        df_mppt0 = self.table_data['df_mpptPow0'].df
-        df_mppt1 = self.table_data['df_mpptPow1'].df
-        df_mppt2 = self.table_data['df_mpptPow2'].df
-        df_mppt3 = self.table_data['df_mpptPow3'].df
+        dfs_mppt = [self.table_data['df_mpptPow%d' % i].df for i in range(4)]
 
-        if df_mppt0 is None or df_mppt0.empty or df_mppt1 is None or df_mppt1.empty or df_mppt2 is None or df_mppt2.empty or df_mppt3 is None or df_mppt3.empty:
+        if any(df is None or df.empty for df in dfs_mppt):
             print("Couldn't load total power of MPPTs")
             return self.table_data['df_mpptPow'].df
 
-        df_mpptPow = pd.DataFrame(columns=['timestamp', 'p_out'])
-        df_mpptPow['timestamp'] = df_mppt0['timestamp']
-
-        mppt0_index = mppt1_index = mppt2_index = mppt3_index = 0
-
-        for i in range(len(df_mpptPow.index)):
-            timestamp = df_mpptPow['timestamp'].values[i]
-
-            # get index of the nearest timestamp to the one in the output dataframe
-            mppt0_index = get_nearest_index(df_mppt0, mppt0_index, timestamp)
-            mppt1_index = get_nearest_index(df_mppt1, mppt1_index, timestamp)
-            mppt2_index = get_nearest_index(df_mppt2, mppt2_index, timestamp)
-            mppt3_index = get_nearest_index(df_mppt3, mppt3_index, timestamp)
-
-            timestamp_mppt0 = df_mppt0['timestamp'].values[mppt0_index]
-            timestamp_mppt1 = df_mppt1['timestamp'].values[mppt1_index]
-            timestamp_mppt2 = df_mppt2['timestamp'].values[mppt2_index]
-            timestamp_mppt3 = df_mppt3['timestamp'].values[mppt3_index]
-
-            # Calculate Power, if timestamps are close enough together
-            if abs(timestamp_mppt0 - timestamp) < self.max_time_offset.total_seconds() and abs(
-                    timestamp_mppt1 - timestamp) < self.max_time_offset.total_seconds() and abs(
-                timestamp_mppt2 - timestamp) < self.max_time_offset.total_seconds() and abs(
-                timestamp_mppt3 - timestamp) < self.max_time_offset.total_seconds():
-                df_mpptPow.at[i, 'p_out'] = df_mppt0['p_out'].values[mppt0_index] + df_mppt1['p_out'].values[
-                    mppt1_index] + \
-                                            df_mppt2['p_out'].values[mppt2_index] + df_mppt3['p_out'].values[
-                                                mppt3_index]
-
-        return preprocess_generic(df_mpptPow)
+        return preprocess_generic(combine_streams([(df, 'p_out') for df in dfs_mppt],
+                                                  self.max_time_offset.total_seconds(), 'p_out'))
+
+    def __append_derived(self, key: str, streams: List[Tuple[str, str]], name: str) -> None:
+        ### Append the rows of a table that is computed from other tables (given as (table, column)) for the timestamps
+        # of the first table that are newer than the table, so the cost doesn't depend on the loaded timespan. A row is
+        # only computed once every other table has an entry at or after its timestamp, its value is final then ###
+        table = self.table_data[key]
+        sources = [self.table_data[df_name].values('timestamp') for df_name, _ in streams]
+        if any(timestamps is None or len(timestamps) == 0 for timestamps in sources):
+            return
+
+        newest = table.values('timestamp')
+        since = newest[0] if newest is not None and len(newest) > 0 else -np.inf
+        settled_until = min(timestamps[0] for timestamps in sources[1:])
+
+        # The values are ordered by timestamp (newest first), reversed they are sorted and can be searched
+        ascending = sources[0][::-1]
+        first, last = np.searchsorted(ascending, [since, settled_until], side='right')
+        if first >= last:
+            return
+
+        (first_name, first_col), rest = streams[0], streams[1:]
+        new_rows = DataFrame({'timestamp': ascending[first:last][::-1],
+                              first_col: self.table_data[first_name].values(first_col)[::-1][first:last][::-1]})
+        others = [(DataFrame({'timestamp': timestamps, col: self.table_data[df_name].values(col)}, copy=False), col)
+                  for (df_name, col), timestamps in zip(rest, sources[1:])]
+
+        table.append(preprocess_generic(combine_streams([(new_rows, first_col)] + others,
+                                                        self.max_time_offset.total_seconds(), name)),
+                     self.timespan_loaded)
 
     def __refresh_layout(self):
         ### Update the table layout upon possible changes in the underlying data ###
         for row in self.table_layout:
             if type(row) is DataRow:
                 row.timespan = self.timespan_loaded
-                row.min, row.max, row.mean, row.last = getMinMaxMeanLast(self.table_data[row.df_name].df, row.df_col,
-                                                                         row.numberFormat)
+                # Only the appended and evicted rows are processed, see 'Table.RollingStats'
+                stats = self.table_data[row.df_name].get_stats(row.df_col)
+                row.min, row.max, row.mean, row.last = stats.getMinMaxMeanLast(row.numberFormat)
@@ -1,9 +1,18 @@
 import datetime
-from typing import Union
+from collections import deque
+from typing import Callable, Dict, Tuple, Union
 from pandas import DataFrame
+import numpy as np
 import pandas as pd
 from db.db_service import DbService
 
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+RING_CAPACITY = 20000  # Rows of a table kept by 'append_from_db'. Older rows are evicted even if they are within the
+                       # timespan of the table
+
 
 class Row:
     title: str = ''
@@ -35,8 +44,211 @@ class DataRow(Row):
         self.selected = selected
 
 
+class RollingStats:
+    # Minimum, maximum, mean and last value of a column of a TableDataFrame. Rows are added in chronological order and
+    # evicted from the oldest on, so minimum and maximum are kept in monotonic deques and the mean as a running sum.
+    # An update costs O(number of added and evicted rows) instead of O(number of rows in the window). Candidates are
+    # identified by the position of their row, so rows with equal timestamps are evicted correctly. Downsampled rows
+    # are added with their bucket aggregates. Without eviction (e.g. streaming a range chunk by chunk for an export)
+    # only the current minimum and maximum are kept, so the memory used does not depend on the number of rows.
+
+    def __init__(self, evictable: bool = True):
+        self.evictable = evictable
+        self._min = deque()  # (position, value) of the minimum candidates, values strictly increasing
+        self._max = deque()  # (position, value) of the maximum candidates, values strictly decreasing
+        self._added: int = 0  # Rows added so far, i.e. the position of the next added row
+        self._evicted: int = 0  # Rows evicted so far, i.e. the position of the oldest row
+        self.sum: float = 0.0
+        self.count: int = 0
+        self.last = None
+        self._formatted: Dict[str, Tuple[str, str, str, str]] = {}  # Formatted values by number format
+
+    @staticmethod
+    def _rows(df: DataFrame, col: str, first: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # Returns positions, minimums, maximums, sums and counts of the rows in chronological order, without NaNs. The
+        # oldest row has the position first
+        df = df.iloc[::-1]
+        positions = np.arange(first, first + len(df.index), dtype=np.int64)
+
+        if col + '_min' in df:
+            counts = df['count'].to_numpy(dtype=np.int64)
+            mins, maxs = df[col + '_min'].to_numpy(dtype=np.float64), df[col + '_max'].to_numpy(dtype=np.float64)
+            sums = df[col + '_mean'].to_numpy(dtype=np.float64) * counts
+        else:
+            mins = maxs = sums = df[col].to_numpy(dtype=np.float64)
+            counts = np.ones(len(mins), dtype=np.int64)
+
+        valid = ~np.isnan(sums)
+        return positions[valid], mins[valid], maxs[valid], sums[valid], counts[valid]
+
+    @staticmethod
+    def _push(candidates: deque, positions: np.ndarray, values: np.ndarray, is_min: bool) -> None:
+        # Append new values to the candidates, keeping only values that are better than all values after them
+        if len(values) == 0:
+            return
+        better = np.less if is_min else np.greater
+
+        # Best of the values after each value, the last value has none
+        best_after = np.empty_like(values)
+        best_after[-1] = np.inf if is_min else -np.inf
+        best_after[:-1] = (np.minimum if is_min else np.maximum).accumulate(values[:0:-1])[::-1]
+
+        best_new = values.min() if is_min else values.max()
+        while candidates and not better(candidates[-1][1], best_new):
+            candidates.pop()
+
+        keep = better(values, best_after)
+        candidates.extend(zip(positions[keep].tolist(), values[keep].tolist()))
+
+    def add(self, df: DataFrame, col: str) -> None:
+        # Add the rows of a DataFrame, ordered by timestamp (newest first), that are newer than all added rows
+        if df is None or df.empty:
+            return
+
+        positions, mins, maxs, sums, counts = self._rows(df, col, self._added)
+        self._added += len(df.index)
+        self._push(self._min, positions, mins, is_min=True)
+        self._push(self._max, positions, maxs, is_min=False)
+        if not self.evictable:
+            for candidates in (self._min, self._max):
+                while len(candidates) > 1:
+                    candidates.pop()
+        self.sum += sums.sum()
+        self.count += int(counts.sum())
+        self.last = df[col].iloc[0]
+        self._formatted.clear()
+
+    def evict(self, df: DataFrame, col: str) -> None:
+        # Remove the oldest rows, given as DataFrame ordered by timestamp (newest first)
+        if df is None or df.empty:
+            return
+
+        _, _, _, sums, counts = self._rows(df, col, self._evicted)
+        self._evicted += len(df.index)
+        for candidates in (self._min, self._max):
+            while candidates and candidates[0][0] < self._evicted:
+                candidates.popleft()
+
+        self.sum -= sums.sum()
+        self.count -= int(counts.sum())
+        self._formatted.clear()
+
+    def getMinMaxMeanLast(self, numberFormat: str) -> Tuple[str, str, str, str]:
+        # Returns the minimum, maximum, mean and last value as strings. Only formatted again after a change
+        if self.count == 0 or not self._min:
+            return 'No Data', 'No Data', 'No Data', 'No Data'
+
+        if numberFormat not in self._formatted:
+            self._formatted[numberFormat] = tuple(('{:' + numberFormat + '}').format(value) for value in (
+                self._min[0][1], self._max[0][1], self.sum / self.count, self.last))
+        return self._formatted[numberFormat]
+
+
+class RingBuffer:
+    # Fixed capacity, column oriented store of the rows of a table. Every value is written twice, at its position and
+    # capacity positions after it, so the rows are always a contiguous slice of each array: appending costs O(number of
+    # new rows), evicting the oldest rows O(1), and reading the rows returns views instead of copies.
+
+    def __init__(self, capacity: int = RING_CAPACITY):
+        self.capacity = capacity
+        self.columns: Dict[str, np.ndarray] = {}
+        self.timezones: Dict[str, pd.DatetimeTZDtype] = {}  # Types of timezone aware columns, stored as datetime64
+        self.head: int = 0  # Position of the next row
+        self.size: int = 0
+
+    @staticmethod
+    def _values(series: pd.Series) -> np.ndarray:
+        if isinstance(series.dtype, pd.DatetimeTZDtype):
+            return series.dt.tz_convert(None).to_numpy()
+        return series.to_numpy()
+
+    def _create_columns(self, df: DataFrame) -> None:
+        # The types are the ones of the loaded DataFrame, i.e. the types of the models (see db/fetch.py)
+        for col in df.columns:
+            if isinstance(df[col].dtype, pd.DatetimeTZDtype):
+                self.timezones[col] = df[col].dtype
+            values = self._values(df[col])
+            self.columns[col] = np.empty(2 * self.capacity, dtype=values.dtype)
+
+    def matches(self, df: DataFrame) -> bool:
+        # Whether rows of a DataFrame can be appended
+        return set(df.columns) == set(self.columns)
+
+    def append(self, df: DataFrame) -> None:
+        # Append the rows of a DataFrame ordered by timestamp (newest first). Rows that don't fit are dropped, starting
+        # with the oldest ones. Call 'evict' first for the rows of the buffer that are overwritten
+        if not self.columns:
+            self._create_columns(df)
+
+        df = df.iloc[:self.capacity].iloc[::-1]
+        positions = (self.head + np.arange(len(df.index))) % self.capacity
+
+        for col, buffer in self.columns.items():
+            values = self._values(df[col])
+            if not np.can_cast(values.dtype, buffer.dtype, casting='safe'):
+                # E.g. floats with NaNs in an integer column. Happens rarely, so the copy is fine
+                buffer = self.columns[col] = buffer.astype(np.result_type(buffer.dtype, values.dtype))
+            buffer[positions] = values
+            buffer[positions + self.capacity] = values
+
+        self.head = (self.head + len(df.index)) % self.capacity
+        self.size = min(self.size + len(df.index), self.capacity)
+
+    def evict(self, n_rows: int) -> None:
+        # Remove the oldest rows
+        self.size -= min(n_rows, self.size)
+
+    def view(self, col: str, start: int = 0, stop: Union[int, None] = None) -> np.ndarray:
+        # Returns the rows start to stop of a column in chronological order (oldest first) as view into the buffer
+        first = (self.head - self.size) % self.capacity
+        stop = self.size if stop is None else stop
+        return self.columns[col][first + start:first + stop]
+
+    def frame(self, start: int = 0, stop: Union[int, None] = None) -> DataFrame:
+        # Returns the rows start to stop (in chronological order) as DataFrame ordered by timestamp (newest first). The
+        # columns are views into the buffer, only timezone aware columns are copied
+        data = {}
+        for col in self.columns:
+            values = self.view(col, start, stop)[::-1]
+            data[col] = pd.Series(values, copy=False).dt.tz_localize('UTC').dt.tz_convert(self.timezones[col].tz) \
+                if col in self.timezones else values
+        return DataFrame(data, copy=False)
+
+
 class TableDataFrame:
-    df: Union[DataFrame, None] = None
+    _df: Union[DataFrame, None] = None
+    cursor: Union[Tuple[float, int], None] = None  # (timestamp, id) of the newest entry loaded by 'append_from_db'
+
+    _ring: Union[RingBuffer, None] = None  # Rows appended by 'append_from_db'
+
+    @property
+    def df(self) -> Union[DataFrame, None]:
+        # Rows appended by 'append_from_db' are read from the ring buffer. The DataFrame is built once per append and
+        # its columns are views into the buffer, so it is only valid until the next append
+        if self._df is None and self._ring is not None and self._ring.size > 0:
+            self._df = self._ring.frame()
+        return self._df
+
+    @df.setter
+    def df(self, df: Union[DataFrame, None]) -> None:
+        # The statistics are computed again on the next call of 'get_stats'
+        self._df = df
+        self._ring = None
+        self.stats = {}
+
+    def values(self, col: str) -> Union[np.ndarray, None]:
+        # Returns a column ordered by timestamp (newest first), as view into the ring buffer if the rows were appended
+        if self._ring is not None and self._ring.size > 0:
+            return self._ring.view(col)[::-1]
+        return None if self.df is None else self.df[col].to_numpy()
+
+    def get_stats(self, col: str) -> RollingStats:
+        # Statistics of a column over all rows of the DataFrame, updated by 'append_from_db'
+        if col not in self.stats:
+            self.stats[col] = RollingStats()
+            if self.df is not None and col in self.df:
+                self.stats[col].add(self.df, col)
+        return self.stats[col]
 
     def _refresh(self) -> Union[DataFrame, None]:
         return None
@@ -49,38 +261,76 @@ class TableDataFrame:
         if new_df is not None:
             self.df = new_df
 
-    def _load_from_db(db_service: DbService, start_time: datetime.datetime, end_time: datetime.datetime, loading_interval: int) -> Union[
+    def _load_from_db(db_service: DbService, start_time: datetime.datetime, end_time: datetime.datetime, n_points: int) -> Union[
         DataFrame, None]:
         print("Unexpected: function '_load_from_db' of 'TableDataFrame' is not implemented by the user")
         return None
 
-    def load_from_db(self, db_service: DbService, start_time: datetime.datetime, end_time: datetime.datetime, loading_interval: int = 1) -> None:
-        self.df = self._load_from_db(db_service, start_time, end_time, loading_interval)
+    def load_from_db(self, db_service: DbService, start_time: datetime.datetime, end_time: datetime.datetime, n_points: int = 1000) -> None:
+        self.set_loaded(self.loader(start_time, end_time, n_points)(db_service))
+
+    def loader(self, start_time: datetime.datetime, end_time: datetime.datetime, n_points: int = 1000) -> Callable[
+        [DbService], Union[DataFrame, None]]:
+        # Returns the load of 'load_from_db' without running it, e.g. to run the loads of several tables concurrently
+        # (see db/async_db_service.py). Pass the result to 'set_loaded'
+        return lambda db_service: self._load_from_db(db_service, start_time, end_time, n_points)
+
+    def set_loaded(self, df: Union[DataFrame, None]) -> None:
+        self.df = df
+        self.cursor = None
 
-    def _append_from_db(db_service: DbService, n_entries: int) -> Union[DataFrame, None]:
+    def _append_from_db(db_service: DbService, n_entries: int, cursor: Union[Tuple[float, int], None]) -> Union[
+        DataFrame, None]:
         print("Unexpected: function '_append_from_db' of 'TableDataFrame' is not implemented by the user")
         return None
 
     def append_from_db(self, db_service: DbService, n_entries: int, max_timespan: datetime.timedelta) -> None:
-        new_entries = self._append_from_db(db_service, n_entries)
+        # The first call loads the latest n_entries, afterwards only the entries newer than the cursor are loaded
+        new_entries = self._append_from_db(db_service, n_entries, self.cursor)
+
+        if new_entries is None or new_entries.empty:
+            return
+        self.cursor = (float(new_entries['timestamp'][0]), int(new_entries['id'][0]))
+        self.append(new_entries, max_timespan)
+
+    def append(self, new_entries: DataFrame, max_timespan: datetime.timedelta) -> None:
+        # Append rows ordered by timestamp (newest first) that are newer than all rows of the table, e.g. the entries
+        # loaded by 'append_from_db' or rows computed from other tables. Rows older than the max timespan are evicted
+        if new_entries is None or new_entries.empty:
+            return
 
-        if new_entries is not None:
-            if self.df is None or self.df.empty:
-                self.df = new_entries
-            else:
-                last_timestamp_old = self.df['timestamp_dt'][0]
-                last_timestamp_new = new_entries['timestamp_dt'][0]
+        if self._ring is None or not self._ring.matches(new_entries):
+            # Start a new ring buffer, holding the rows loaded so far
+            df = self.df
+            self.df = None
+            self._ring = RingBuffer()
+            if df is not None and not df.empty and set(df.columns) == set(new_entries.columns):
+                self._ring.append(df)
 
-                # Only append new timestamps
-                new_entries = new_entries.loc[new_entries['timestamp_dt'] > last_timestamp_old]
+        # Delete entries that are older than the max timespan or don't fit into the buffer any more. The buffer is in
+        # chronological order, so the evicted entries are the first ones
+        ring = self._ring
+        cutoff = new_entries['timestamp'][0] - max_timespan.total_seconds()
+        n_evicted = max(int(np.searchsorted(ring.view('timestamp'), cutoff, side='right')) if ring.size > 0 else 0,
+                        ring.size + min(len(new_entries.index), ring.capacity) - ring.capacity)
 
-                # Delete entries that are older than the max timespan
-                self.df = self.df.loc[self.df['timestamp_dt'] + max_timespan > last_timestamp_new]
-                self.df = pd.concat([new_entries, self.df], ignore_index=True)  # Add the latest values to the dataframe
+        for col, stats in self.stats.items():
+            stats.evict(ring.frame(0, n_evicted), col)
+            stats.add(new_entries.iloc[:ring.capacity], col)
 
-    def __init__(self, refresh=(lambda: None), load_from_db=(lambda db_service, start_time, end_time, loading_interval: None),
-                 append_from_db=(lambda db_service, n_entries: None)):
+        # Add the latest values to the buffer
+        ring.evict(n_evicted)
+        ring.append(new_entries)
+        self._df = None
+
+    def __init__(self, refresh=(lambda: None), load_from_db=(lambda db_service, start_time, end_time, n_points: None),
+                 append_from_db=(lambda db_service, n_entries, cursor: None), stream_from_db=None):
         super().__init__()
+        self.stats: Dict[str, RollingStats] = {}  # Statistics of the columns shown in the table, see 'get_stats'
         self._refresh = refresh
         self._load_from_db = load_from_db
         self._append_from_db = append_from_db
+
+        # Yields all entries of a time range chunk by chunk (db_service, start_time, end_time), e.g. for exports.
+        # None for tables that are computed from other tables
+        self.stream_from_db = stream_from_db
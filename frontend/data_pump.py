@@ -0,0 +1,119 @@
+"""
+Single background thread that polls the DB for all dashboard pages. Pages subscribe a fetch function once at import
+time, the pump runs all subscriptions once per interval and keeps their latest results. The page callbacks only read
+these results, so the load on the DB does not depend on the number of open browser tabs.
+
+    pump.subscribe("bms_pack", lambda db_serv: append_bms_pack_data(db_serv, 100))
+    ...
+    df = pump.latest("bms_pack")  # In the callback of the page
+"""
+import threading
+import time
+
+from typing import Any, Callable, Dict, Optional
+
+from db.db_service import DbService
+from frontend.settings import RELOAD_INTERVAL
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+POLL_INTERVAL = RELOAD_INTERVAL / 1000  # [s] Time between two polls of the DB
+IDLE_AFTER = 30  # [s] Subscriptions that haven't been read for this time are not polled until they are read again
+
+Fetch = Callable[[DbService], Any]
+
+
+class Subscription:
+    """ Fetch function of a page and its latest result"""
+
+    def __init__(self, name: str, fetch: Fetch):
+        self.name = name
+        self.fetch = fetch
+        self.value: Any = None
+        self.updated: Optional[float] = None  # Unix timestamp of the latest successful fetch
+        self.last_read: float = 0.0
+        self.fetched = threading.Event()  # Set after each fetch, successful or not
+
+    def idle(self, now: float) -> bool:
+        return now - self.last_read > IDLE_AFTER
+
+
+class DataPump:
+    """ Runs the fetch functions of all subscriptions on one thread and stores their results.
+
+        Fetch functions that update shared state (e.g. the DataSection of the overview) run while holding 'lock'.
+        Callbacks that read this state take the lock as well, results that are replaced by every fetch can be read
+        without it."""
+
+    def __init__(self, poll_interval: float = POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.subscriptions: Dict[str, Subscription] = {}
+        self.lock = threading.RLock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def subscribe(self, name: str, fetch: Fetch) -> None:
+        """ Poll a fetch function, which is called with a DbService, once per interval
+
+            Inputs:
+                name (str): Name of the subscription, used to read the result with 'latest'
+                fetch (Fetch): The fetch function"""
+        self.subscriptions[name] = Subscription(name, fetch)
+
+    def latest(self, name: str) -> Any:
+        """ Returns the latest result of a subscription, None if it couldn't be fetched yet. Starts the pump on the first
+            call, i.e. in the process that serves the dashboard (and not in the process of the reloader of dash)"""
+        subscription = self.subscriptions[name]
+        now = time.time()
+
+        was_idle = subscription.idle(now)
+        subscription.last_read = now
+        self.start()
+
+        if was_idle:
+            # The result is outdated or missing, fetch it now instead of at the next interval
+            subscription.fetched.clear()
+            self._wake.set()
+            subscription.fetched.wait(timeout=self.poll_interval)
+
+        return subscription.value
+
+    def start(self) -> None:
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="data-pump", daemon=True)
+                self._thread.start()
+
+    def poll(self) -> None:
+        """ Run the fetch functions of all subscriptions that were read recently. All of them share one DbService"""
+        now = time.time()
+        active = [subscription for subscription in list(self.subscriptions.values()) if not subscription.idle(now)]
+        if not active:
+            return
+
+        with DbService() as db_serv:
+            for subscription in active:
+                try:
+                    with self.lock:
+                        subscription.value = subscription.fetch(db_serv)
+                    subscription.updated = time.time()
+                except Exception as e:
+                    print("Err: Couldn't fetch data of '%s': %s" % (subscription.name, e))
+                subscription.fetched.set()
+
+    def _run(self) -> None:
+        while True:
+            start = time.monotonic()
+            try:
+                self.poll()
+            except Exception as e:
+                print("Err: Data pump failed: %s" % e)
+
+            self._wake.wait(max(0.0, self.poll_interval - (time.monotonic() - start)))
+            self._wake.clear()
+
+
+pump = DataPump()
@@ -0,0 +1,61 @@
+"""
+Downloads of large files, e.g. the exports of the Analyzer. Files sent by a dash callback (dcc.send_file) are encoded
+as base64 and held in memory as a whole. Instead, a callback registers its temporary file here and shows the returned
+link, the file is then streamed from disk by a Flask route and deleted afterwards.
+"""
+import os
+import threading
+import uuid
+
+from collections import OrderedDict
+from flask import Flask, abort, send_file
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+ROUTE = "/download/"
+MAX_PENDING = 20  # Files kept until they are downloaded. The oldest file is deleted first
+
+_pending: OrderedDict = OrderedDict()  # token -> (path, file name), oldest first
+_lock = threading.Lock()
+
+
+def add(path: str, filename: str) -> str:
+    """ Register a temporary file for download. The file is deleted after it was downloaded once
+
+        Inputs:
+            path (str): Path of the file
+            filename (str): Name of the downloaded file
+
+        Returns:
+            str: The URL of the download"""
+    token = uuid.uuid4().hex
+    with _lock:
+        _pending[token] = (path, filename)
+        while len(_pending) > MAX_PENDING:
+            _remove(_pending.popitem(last=False)[1][0])
+    return ROUTE + token
+
+
+def register(server: Flask) -> None:
+    """ Add the download route to the Flask server of the dashboard"""
+
+    @server.route(ROUTE + "<token>")
+    def download(token: str):
+        with _lock:
+            entry = _pending.pop(token, None)
+        if entry is None:
+            abort(404)
+
+        path, filename = entry
+        response = send_file(path, as_attachment=True, download_name=filename)
+        response.call_on_close(lambda: _remove(path))
+        return response
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
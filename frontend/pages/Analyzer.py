@@ -1,11 +1,15 @@
+import os
+import tempfile
+
 import dash
-import plotly.express as px
 
 import dash_mantine_components as dmc
 import dash_bootstrap_components as dbc
-from dash import html, dcc, Input, Output, State, dash_table, ctx
+from dash import html, dcc, Input, Output, State, MATCH, dash_table, ctx
 
 import frontend.styles as styles
+from frontend import downloads, plot_data
+from frontend.sessions import SESSION_ID, SessionStore
 from frontend.settings import RELOAD_INTERVAL
 from db.load_data import *
 from .. import Table
@@ -14,31 +18,42 @@ from ..Data_Section import DataSection
 dash.register_page(__name__, path="/analyzer", title="Analyzer")
 
 ########################################################################################################################
-# Global Variables
+# Session State
 ########################################################################################################################
 
-time_loaded_min: datetime.datetime  # Minimum displayed time in the graphs. Updated by the function 'reload_table_data'
-time_loaded_max: datetime.datetime  # Maximum displayed time in the graphs. Updated by the function 'reload_table_data'
+class AnalyzerSession:
+    # Data loaded by one browser session. Sessions analyze different ranges independently
+    def __init__(self):
+        self.dataSection = DataSection(timespan_loaded=datetime.timedelta(minutes=0),
+                                       max_time_offset=datetime.timedelta(seconds=30))
+        self.graphs = {}  # Graphs of the selected rows by title. Updated by the function 'reload_graphs'
+        # Minimum and maximum displayed time in the graphs. Updated by the function 'reload_table_data'
+        self.time_loaded_min: datetime.datetime = None
+        self.time_loaded_max: datetime.datetime = None
+
+    def memory_usage(self) -> int:
+        return self.dataSection.memory_usage()
+
+
+sessions = SessionStore(AnalyzerSession)
 
 ########################################################################################################################
 # Layout
 ########################################################################################################################
 
-dataSection = DataSection(timespan_loaded=datetime.timedelta(minutes=0), max_time_offset=datetime.timedelta(seconds=30))
-graphs = {}  # Will be filled in the function 'initialize_data'
-
 
 def initialize_data() -> tuple:
     """Produces the default data to be displayed before the page is refreshed"""
 
     # Main Table
+    timespan = datetime.timedelta(minutes=0).__str__()
     main_table = [
         {
             "": 'No Data',
-            dataSection.timespan_loaded.__str__() + ' Min': 'No Data',
-            dataSection.timespan_loaded.__str__() + ' Max': 'No Data',
-            dataSection.timespan_loaded.__str__() + ' Mean': 'No Data',
-            dataSection.timespan_loaded.__str__() + ' Last': 'No Data'
+            timespan + ' Min': 'No Data',
+            timespan + ' Max': 'No Data',
+            timespan + ' Mean': 'No Data',
+            timespan + ' Last': 'No Data'
         },
     ]
 
@@ -69,50 +84,60 @@ def sanity_check(start_date, end_date, start_time, end_time):
      State("end_date", "date"),
      State("start_time", "value"),
      State("end_time", "value"),
-     State("density_slider", "value")],
+     State("density_slider", "value"),
+     State(SESSION_ID, "data")],
     config_prevent_initial_callbacks=True
 )
 def update_displayed_data(n_clicks: int, active_cell: {}, table_data: [], start_date: str, end_date: str,
                           start_time: str, end_time: str,
-                          loading_interval: int):
+                          density: float, session_id: str):
     table = []
     graph_list = []
+    session = sessions.get(session_id)
 
     if (ctx.triggered_id == "submit_button"):
-        table, graph_list = reload_table_data(start_date, end_date, start_time, end_time,
-                                              int(10 ** loading_interval))  # Logarithmic slider for loading interval
+        table, graph_list = reload_table_data(session, start_date, end_date, start_time, end_time,
+                                              int(10 ** density))  # Logarithmic slider for the number of points
+        sessions.evict()
     elif (ctx.triggered_id == "table"):
-        graph_list, active_cell = reload_graphs(active_cell)
+        graph_list, active_cell = reload_graphs(session, active_cell)
         table = table_data
 
     return table, graph_list, active_cell  # Reset the active cell of the table
 
 
-def reload_table_data(start_date: str, end_date: str, start_time: str, end_time: str, loading_interval: int):
-    # Combine date out of date input and time out of time . Ignore Microseconds
-    print("start time: {}".format(start_time))
-    print("end time: {}".format(end_time))
-
+def get_time_range(start_date: str, end_date: str, start_time: str, end_time: str) -> Tuple[
+    datetime.datetime, datetime.datetime, datetime.datetime, datetime.datetime]:
+    # Combine date out of date input and time out of time input. Ignore Microseconds. Returns the displayed start and
+    # end time and the start and end time used for queries
     start_time = start_date[:10] + start_time[10:19]
     end_time = end_date[:10] + end_time[10:19]
 
-    # Get new timespan
-    global time_loaded_min, time_loaded_max
     format_string = "%Y-%m-%dT%H:%M:%S"
-    time_loaded_min = datetime.datetime.strptime(start_time, format_string)
-    time_loaded_max = datetime.datetime.strptime(end_time, format_string)
-    dataSection.timespan_loaded = time_loaded_max - time_loaded_min
+    displayed_start = datetime.datetime.strptime(start_time, format_string)
+    displayed_end = datetime.datetime.strptime(end_time, format_string)
 
     # get rid of timezone shift -> get timestamp as if the date was at UTC+0
-    diff = time_loaded_min - time_loaded_min.astimezone(datetime.timezone.utc).replace(tzinfo=None)
-    timestamp_start = time_loaded_min + diff
-    timestamp_end = time_loaded_max + diff
+    diff = displayed_start - displayed_start.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return displayed_start, displayed_end, displayed_start + diff, displayed_end + diff
+
+
+def reload_table_data(session: AnalyzerSession, start_date: str, end_date: str, start_time: str, end_time: str,
+                      n_points: int):
+    # Combine date out of date input and time out of time . Ignore Microseconds
+    print("start time: {}".format(start_time))
+    print("end time: {}".format(end_time))
+
+    # Get new timespan
+    session.time_loaded_min, session.time_loaded_max, timestamp_start, timestamp_end = get_time_range(
+        start_date, end_date, start_time, end_time)
+    dataSection = session.dataSection
+    dataSection.timespan_loaded = session.time_loaded_max - session.time_loaded_min
 
-    db_serv: DbService = DbService()
     table = []
 
     # Refresh table data
-    dataSection.refresh(db_serv, timestamp_start, timestamp_end, loading_interval)
+    dataSection.refresh(timestamp_start, timestamp_end, n_points)
 
     # Refresh table layout
     for row in dataSection.table_layout:
@@ -120,15 +145,45 @@ def reload_table_data(start_date: str, end_date: str, start_time: str, end_time:
         row.selected = False  # reset selected view
 
     # delete shown graphs
-    global graphs
-    graphs = {}
+    session.graphs = {}
 
     return table, None
 
 
-def reload_graphs(active_cell: {}):
+@dash.callback(
+    [Output("export_link", "href"),
+     Output("export_link", "children")],
+    Input("export_button", "n_clicks"),
+    [State("start_date", "date"),
+     State("end_date", "date"),
+     State("start_time", "value"),
+     State("end_time", "value"),
+     State(SESSION_ID, "data")],
+    config_prevent_initial_callbacks=True
+)
+def export_data(n_clicks: int, start_date: str, end_date: str, start_time: str, end_time: str, session_id: str):
+    # Export all entries of the selected time range, not only the displayed points. The export is written into a
+    # temporary file chunk by chunk, which is streamed by the download route and deleted afterwards
+    displayed_start, displayed_end, timestamp_start, timestamp_end = get_time_range(start_date, end_date,
+                                                                                    start_time, end_time)
+
+    filename = "analyzer_%s_%s.zip" % (displayed_start.strftime("%Y%m%d-%H%M%S"),
+                                       displayed_end.strftime("%Y%m%d-%H%M%S"))
+    fd, path = tempfile.mkstemp(suffix=".zip")
+    os.close(fd)
+    try:
+        with DbService() as db_serv:
+            sessions.get(session_id).dataSection.export(db_serv, timestamp_start, timestamp_end, path)
+    except Exception:
+        os.remove(path)
+        raise
+    return downloads.add(path, filename), "Download " + filename
+
+
+def reload_graphs(session: AnalyzerSession, active_cell: {}):
     # Toggles the 'selected' variable of a given Table.DataRow, if the user selected it. 'Consumes' the reference to the
     # active cell, in the sense that it is set to None
+    dataSection, graphs = session.dataSection, session.graphs
     if active_cell is not None:
         row = dataSection.table_layout[active_cell['row']]
 
@@ -141,9 +196,9 @@ def reload_graphs(active_cell: {}):
                 df = dataSection.table_data[row.df_name].df
                 if df is not None and not df.empty:
                     graphs[row.title] = dcc.Graph(
-                        figure=px.line(df, title=row.title, template='plotly_white',
-                                       x='timestamp_dt', y=row.df_col,
-                                       range_x=[time_loaded_min, time_loaded_max]))
+                        id={'type': 'analyzer_graph', 'index': active_cell['row']},
+                        figure=plot_data.line_figure(df, row.title, row.df_col,
+                                                     range_x=[session.time_loaded_min, session.time_loaded_max]))
                 else:
                     graphs[row.title] = [html.Br(), html.Br(),
                                          html.H3('No Data available for "%s"' % row.title, style=styles.H3)]
@@ -161,6 +216,36 @@ def reload_graphs(active_cell: {}):
     return graphs_list, None
 
 
+@dash.callback(
+    Output({'type': 'analyzer_graph', 'index': MATCH}, 'figure'),
+    Input({'type': 'analyzer_graph', 'index': MATCH}, 'relayoutData'),
+    State({'type': 'analyzer_graph', 'index': MATCH}, 'id'),
+    State(SESSION_ID, 'data'),
+    config_prevent_initial_callbacks=True
+)
+def zoom_graph(relayout_data: {}, graph_id: {}, session_id: str):
+    # The graphs show at most 'plot_data.MAX_POINTS' points of the loaded range. Zooming in loads the visible window
+    # in full detail, resetting the zoom shows the loaded range again
+    window = plot_data.visible_range(relayout_data)
+    if window is None:
+        return dash.no_update
+
+    session = sessions.get(session_id)
+    row = session.dataSection.table_layout[graph_id['index']]
+    table = session.dataSection.table_data[row.df_name]
+
+    if window == plot_data.AUTORANGE:
+        if table.df is None:
+            return dash.no_update  # The data of the session was dropped to free memory, it is reloaded by 'Submit'
+        return plot_data.line_figure(table.df, row.title, row.df_col,
+                                     range_x=[session.time_loaded_min, session.time_loaded_max])
+
+    df = plot_data.load_window(table, *window)
+    if df is None or df.empty:
+        return dash.no_update
+    return plot_data.line_figure(df, row.title, row.df_col, range_x=list(window))
+
+
 def layout() -> html.Div:
     """Defines the layout of the page and returns it as a div
 
@@ -197,9 +282,9 @@ def layout() -> html.Div:
                     ),
                     dbc.Row(
                         [
-                            dbc.Col(html.P("Loading Interval"), width="1", align="right"),
-                            dbc.Col(dcc.Slider(0, 4, 0.01, id='density_slider',
-                                               marks={i: '{}'.format(10 ** i) for i in range(5)}, value=0),
+                            dbc.Col(html.P("Points per Signal"), width="1", align="right"),
+                            dbc.Col(dcc.Slider(2, 5, 0.01, id='density_slider',
+                                               marks={i: '{}'.format(10 ** i) for i in range(2, 6)}, value=3),
                                     width="11", align="left"),
                         ],
                         align="center"
@@ -207,6 +292,9 @@ def layout() -> html.Div:
                     dbc.Row(
                         [
                             dbc.Col(dmc.Button("Submit", id="submit_button"), width="auto", align="left"),
+                            dbc.Col(dmc.Button("Export CSV", id="export_button", variant="outline"), width="auto",
+                                    align="left"),
+                            dbc.Col(html.A(id="export_link", download=""), width="auto", align="left"),
                         ],
                         align="center"
                     )
@@ -1,111 +1,127 @@
 import dash
-import plotly.express as px
+import numpy as np
 import pandas as pd
-import plotly.graph_objs as go
 
-from typing import Tuple
-from dash import html, dcc, Input, Output
+from dash import html, dcc, Input, Output, State, dash_table
 
 from db.models import *
 from db.db_service import DbService
 from pandas import DataFrame
+from frontend import plot_data
 from frontend.styles import H1, H2
 from frontend.settings import RELOAD_INTERVAL
+from frontend.data_pump import pump
+from db.load_data import BMS_CELL_LABELS, bms_cell_stats, load_bms_cell_matrix
 
 dash.register_page(__name__, path="/bms_cells", title="BMS Cells")
 
-# for cell graph
-def load_cmu_data(db_serv: DbService(), cmu_stat, cmu_class1, cmu_class2, n_entries):
-    (df1, df2) = preprocess_cmu(
-        db_serv.query_latest(cmu_class1, n_entries),
-        db_serv.query_latest(cmu_class2, n_entries)
-    )
-    return db_serv.latest(cmu_stat), df1, df2
-
-
-def preprocess_cmu(df1: DataFrame, df2: DataFrame) -> Tuple[DataFrame,DataFrame]:
-    # convert from mV to V
-    df1['cell_0_volt'] *= 1e-3
-    df1['cell_1_volt'] *= 1e-3
-    df1['cell_2_volt'] *= 1e-3
-    df1['cell_3_volt'] *= 1e-3
-
-    df2['cell_4_volt'] *= 1e-3
-    df2['cell_5_volt'] *= 1e-3
-    df2['cell_6_volt'] *= 1e-3
-    df2['cell_7_volt'] *= 1e-3
-
-    # parse timestamps
-    df1['timestamp_dt'] = pd.to_datetime(
-        df1['timestamp'], unit='s', origin="unix", utc=True)
-    df2['timestamp_dt'] = pd.to_datetime(
-        df2['timestamp'], unit='s', origin="unix", utc=True)
-    return (df1, df2)
-
-
-
-def cell_volt_graph(df1: DataFrame, df2: DataFrame):
-    # create plot using first dataframe (cells 0 - 3)
-    fig: go.Figure = px.line(df1,
-                             title="Cell Voltages",
-                             template="plotly_white",
-                             x="timestamp_dt",
-                             y=["cell_0_volt", "cell_1_volt",
-                                "cell_2_volt", "cell_3_volt"],
-                             )
-    # then add the remaining cells in second dataframe. cell_7_volt is always -32768
-    fig.add_trace(
-        go.Scatter(x=df2["timestamp_dt"], y=df2['cell_4_volt'], name="cell_4_volt")).add_trace(
-        go.Scatter(x=df2["timestamp_dt"], y=df2['cell_5_volt'], name="cell_5_volt")).add_trace(
-        go.Scatter(x=df2["timestamp_dt"], y=df2['cell_6_volt'], name="cell_6_volt"))
-    return fig
-
-
-def disp_cmu(cmu_stat, df1: DataFrame, df2: DataFrame):
+MATRIX_ENTRIES = 50  # Latest entries per cell topic shown in the heatmap and the graphs
+HEATMAP_DECIMALS = 3  # Precision of the voltages sent to the heatmap [V]
+
+CMUS = [1, 2, 3, 4, 5]
+CMU_STATS = [BmsCmu1Stat, BmsCmu2Stat, BmsCmu3Stat, BmsCmu4Stat, BmsCmu5Stat]
+CELLS = ["cell_0_volt", "cell_1_volt", "cell_2_volt", "cell_3_volt", "cell_4_volt", "cell_5_volt", "cell_6_volt"]
+STATS_COLUMNS = ["cell", "min", "max", "mean", "imbalance", "latest"]
+
+
+def fetch_cmu_data(db_serv: DbService):
+    # All cell topics of the pack are loaded in one round trip, the stats of the CMUs in another
+    timestamps, volts = load_bms_cell_matrix(db_serv, MATRIX_ENTRIES)
+    stats, spread = bms_cell_stats(volts)
+    return timestamps, volts, stats, spread, db_serv.latest_many(CMU_STATS)
+
+
+pump.subscribe('bms_cells', fetch_cmu_data)
+
+
+def cmu_frame(timestamps: np.ndarray, volts: np.ndarray, cmu: int) -> DataFrame:
+    # Cell voltages of a CMU from the matrix of the pack, ordered by timestamp (newest first) as in the other tables
+    df = DataFrame(volts[::-1, (cmu - 1) * len(CELLS):cmu * len(CELLS)], columns=CELLS)
+    df['timestamp'] = timestamps[::-1]
+    df['timestamp_dt'] = pd.to_datetime(df['timestamp'], unit='s', origin="unix", utc=True)
+    return df
+
+
+def cell_volt_graph(cmu: int):
+    return dcc.Graph(id="bms-cells-volt-%d" % cmu, figure=plot_data.live_figure("Cell Voltages", CELLS))
+
+
+def disp_cmu(cmu: int):
+    # The layout is sent once, the callback only updates the temperatures and extends the graph
     return html.Div([
-        html.P("PCB temp [°C]: " + str(cmu_stat.pcb_temp / 10)),
-        html.P("Cell temp [°C]: " + str(cmu_stat.cell_temp / 10)),
-        dcc.Graph(figure=cell_volt_graph(df1, df2)),
+        html.P(id="bms-cells-pcb-temp-%d" % cmu),
+        html.P(id="bms-cells-cell-temp-%d" % cmu),
+        cell_volt_graph(cmu),
     ])
 
 
-@dash.callback(Output('live-update-div-bms-cells', 'children'), Input('interval-component', 'n_intervals'))
-def refresh_data(n):
+def disp_pack():
+    return html.Div([
+        html.P(id="bms-cells-spread"),
+        # The layout is sent once, the callback only replaces the data of the heatmap
+        dcc.Graph(id="bms-cells-heatmap", figure=plot_data.heatmap_figure([], BMS_CELL_LABELS, [], "Cell Voltages [V]",
+                                                                          xaxis_title='Timestamp', height=800)),
+        dash_table.DataTable(
+            id="bms-cells-stats",
+            columns=[{"name": col, "id": col} for col in STATS_COLUMNS],
+            style_as_list_view=True,
+            style_cell={'text-align': 'center'}),
+    ])
 
-    try:
-        db_serv: DbService = DbService()
-        (cmu1_stat, cmu1_cell_df1, cmu1_cell_df2) = load_cmu_data(db_serv, BmsCmu1Stat, BmsCmu1Cells1, BmsCmu1Cells2,  100)
-        (cmu2_stat, cmu2_cell_df1, cmu2_cell_df2) = load_cmu_data(db_serv, BmsCmu2Stat, BmsCmu2Cells1, BmsCmu2Cells2,  100)
-        (cmu3_stat, cmu3_cell_df1, cmu3_cell_df2) = load_cmu_data(db_serv, BmsCmu3Stat, BmsCmu3Cells1, BmsCmu3Cells2,  100)
-        (cmu4_stat, cmu4_cell_df1, cmu4_cell_df2) = load_cmu_data(db_serv, BmsCmu4Stat, BmsCmu4Cells1, BmsCmu4Cells2,  100)
-        (cmu5_stat, cmu5_cell_df1, cmu5_cell_df2) = load_cmu_data(db_serv, BmsCmu5Stat, BmsCmu5Cells1, BmsCmu5Cells2,  100)
-        # print()
-        return html.Div([
-            html.H1("BMS", style=H1, className="text-center"),
-            html.H2("CMU 1 Cells", style=H2),
-            disp_cmu(cmu1_stat, cmu1_cell_df1, cmu1_cell_df2),
 
-            html.H2("CMU 2 Cells", style=H2),
-            disp_cmu(cmu2_stat, cmu2_cell_df1, cmu2_cell_df2),
+@dash.callback(
+    [Output("bms-cells-spread", "children"),
+     Output("bms-cells-heatmap", "figure"),
+     Output("bms-cells-stats", "data")] +
+    [Output("bms-cells-pcb-temp-%d" % cmu, "children") for cmu in CMUS] +
+    [Output("bms-cells-cell-temp-%d" % cmu, "children") for cmu in CMUS] +
+    [Output("bms-cells-volt-%d" % cmu, "extendData") for cmu in CMUS] +
+    [Output("bms-cells-cursors", "data")],
+    Input('interval-component', 'n_intervals'),
+    State("bms-cells-cursors", "data"))
+def refresh_data(n, cursors):
+    data = pump.latest('bms_cells')
+    if data is None:
+        print("Err: Couldn't load BMS Tables")
+        return [dash.no_update] * (3 + 3 * len(CMUS) + 1)
 
-            html.H2("CMU 3 Cells", style=H2),
-            disp_cmu(cmu3_stat, cmu3_cell_df1, cmu3_cell_df2),
+    timestamps, volts, stats, spread, cmu_stats = data
+    cursors = cursors or {}
 
-            html.H2("CMU 4 Cells", style=H2),
-            disp_cmu(cmu4_stat, cmu4_cell_df1, cmu4_cell_df2),
+    # Pack
+    spread_text = "Spread [V]: " + ('%.3f' % spread[-1] if len(spread) and not np.isnan(spread[-1]) else 'n/a')
+    stats_table = stats.round(3).to_dict('records')
 
-            html.H2("CMU 5 Cells", style=H2),
-            disp_cmu(cmu5_stat, cmu5_cell_df1, cmu5_cell_df2),
-        ])
-    except:
-        print("Err: Couldn't load BMS Tables")
+    # The heatmap is only sent again after new entries arrived
+    heatmap = dash.no_update
+    if len(timestamps) and float(timestamps[-1]) != cursors.get('heatmap'):
+        heatmap = dash.Patch()
+        heatmap['data'][0]['x'] = pd.to_datetime(timestamps, unit='s', origin="unix", utc=True)
+        heatmap['data'][0]['z'] = volts.T.round(HEATMAP_DECIMALS)
+        cursors['heatmap'] = float(timestamps[-1])
+
+    # CMUs
+    pcb_temps, cell_temps, cmu_volts = [], [], []
+    for cmu, cmu_stat in zip(CMUS, cmu_stats.values()):
+        pcb_temps.append("PCB temp [°C]: " + (str(cmu_stat.pcb_temp / 10) if cmu_stat is not None else 'n/a'))
+        cell_temps.append("Cell temp [°C]: " + (str(cmu_stat.cell_temp / 10) if cmu_stat is not None else 'n/a'))
 
-        return html.Div(html.H2("Data load failed", className="text-center"))
+        extend, (cursors[str(cmu)],) = plot_data.extend_traces([(cmu_frame(timestamps, volts, cmu), CELLS)],
+                                                               [cursors.get(str(cmu))])
+        cmu_volts.append(extend)
+
+    return [spread_text, heatmap, stats_table] + pcb_temps + cell_temps + cmu_volts + [cursors]
 
 
 def layout():
+    children = [html.H1("BMS", style=H1, className="text-center"),
+                html.H2("Pack Cells", style=H2), disp_pack()]
+    for cmu in CMUS:
+        children += [html.H2("CMU %d Cells" % cmu, style=H2), disp_cmu(cmu)]
+
     return html.Div([
-        html.Div(id='live-update-div-bms-cells'),
+        html.Div(id='live-update-div-bms-cells', children=children),
+        dcc.Store(id="bms-cells-cursors"),  # Newest timestamps sent to each graph and the heatmap of this page
         dcc.Interval(
             id='interval-component',
             interval=RELOAD_INTERVAL,
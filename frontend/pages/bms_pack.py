@@ -1,56 +1,44 @@
 import dash
-import plotly.express as px
 import dash_bootstrap_components as dbc
-import plotly.graph_objs as go
 
-from dash import html, dcc, Input, Output
+from dash import html, dcc, Input, Output, State
 
-from db.db_service import DbService
 from pandas import DataFrame
+from frontend import plot_data
 from frontend.styles import H1, H2
 from frontend.settings import RELOAD_INTERVAL
+from frontend.data_pump import pump
 from db.load_data import append_bms_pack_data
 
 dash.register_page(__name__, path="/bms_pack", title="BMS Pack")
 
+pump.subscribe("bms_pack", lambda db_serv: append_bms_pack_data(db_serv, 100))
 
-def bms_v_graph(df: DataFrame):
-    fig: go.Figure = px.line(
-        df,
-        title="Pack Voltage",
-        template="plotly_white",
-        x="timestamp_dt",
-        y=["battery_voltage"],
-    ).update_yaxes(range=[df['battery_voltage'].min()- 10, df['battery_voltage'].max()+ 10])
-    fig.update_layout(xaxis_title='Timestamp')
-    return fig
 
+def bms_v_graph():
+    return dcc.Graph(id="bms-pack-voltage",
+                     figure=plot_data.live_figure("Pack Voltage", ["battery_voltage"]))
 
-def bms_i_graph(df: DataFrame):
-    fig: go.Figure = px.line(
-        df,
-        title="Pack Current",
-        template="plotly_white",
-        x="timestamp_dt",
-        y=["battery_current"],
-    ).update_yaxes(range=[df['battery_current'].min()- 5, df['battery_current'].max()+ 5])
-    fig.update_layout(xaxis_title='Timestamp')
-    return fig
 
+def bms_i_graph():
+    return dcc.Graph(id="bms-pack-current",
+                     figure=plot_data.live_figure("Pack Current", ["battery_current"]))
 
-def disp_bms(df: DataFrame):
+
+def disp_bms():
+    # The layout is sent once, the callback only extends the graphs
     return dbc.Row(
         [
             dbc.Col(
                 [
                     html.H2("Pack Voltage", style=H2, className="text-center"),
-                    dcc.Graph(figure=bms_v_graph(df)),
+                    bms_v_graph(),
                 ]
             ),
             dbc.Col(
                 [
                     html.H2("Pack Current", style=H2, className="text-center"),
-                    dcc.Graph(figure=bms_i_graph(df)),
+                    bms_i_graph(),
                 ]
             ),
         ]
@@ -58,30 +46,32 @@ def disp_bms(df: DataFrame):
 
 
 @dash.callback(
-    Output("live-update-div-bms-pack", "children"),
+    Output("bms-pack-voltage", "extendData"),
+    Output("bms-pack-current", "extendData"),
+    Output("bms-pack-cursors", "data"),
     Input("interval-component", "n_intervals"),
+    State("bms-pack-cursors", "data"),
 )
-def refresh_data(n):
-    db_serv: DbService = DbService()
-    df: DataFrame = append_bms_pack_data(db_serv, 100)
-
-    try:
-        return html.Div(
-            [
-                html.H1("BMS", style=H1, className="text-center"),
-                disp_bms(df),
-            ]
-        )
-    except:
+def refresh_data(n, cursors):
+    df: DataFrame = pump.latest("bms_pack")
+    if df is None:
         print("Err: Couldn't load BMS Tables")
+        return dash.no_update, dash.no_update, dash.no_update
 
-        return html.Div(html.H2("Data load failed", className="text-center"))
+    cursors = cursors or [None, None]
+    voltage, (cursors[0],) = plot_data.extend_traces([(df, ["battery_voltage"])], [cursors[0]])
+    current, (cursors[1],) = plot_data.extend_traces([(df, ["battery_current"])], [cursors[1]])
+    return voltage, current, cursors
 
 
 def layout():
     return html.Div(
         [
-            html.Div(id="live-update-div-bms-pack"),
+            html.Div(id="live-update-div-bms-pack", children=[
+                html.H1("BMS", style=H1, className="text-center"),
+                disp_bms(),
+            ]),
+            dcc.Store(id="bms-pack-cursors"),  # Newest timestamp sent to each graph of this page
             dcc.Interval(
                 id="interval-component", interval=RELOAD_INTERVAL, n_intervals=0
             ),
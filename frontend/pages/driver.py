@@ -8,31 +8,24 @@ from db.db_service import DbService
 from db.load_data import append_driverResponse
 from frontend import styles
 from frontend.settings import RELOAD_INTERVAL
+from frontend.data_pump import pump
 
 dash.register_page(__name__, path="/driver", title="Driver")
 
 
 # Global variable
-timestamp_lastResponse = 0
+cursor_lastResponse = None  # (timestamp, id) of the latest processed driver response
 button_yes_prev = False
 button_no_prev = False
 button_unclear_prev = False
 table_data = [{'Timestamp': '', 'Response': '', 'Delta': ''}]
 
 
-@dash.callback(
-    Output('driver_table', 'data'),
-    Input('interval-component', 'n_intervals'))
-def refresh(n_intervals: int) -> []:
-
-    global timestamp_lastResponse, table_data, button_yes_prev, button_no_prev, button_unclear_prev
-    db_service = DbService()
-
+def fetch_responses(db_service: DbService) -> []:
+    # Runs on the thread of the data pump, so all pages share the processed responses
+    global cursor_lastResponse, table_data, button_yes_prev, button_no_prev, button_unclear_prev
     # Querry driver responsees
-    df = append_driverResponse(db_service, 100)
-
-    # Extract new entries
-    new_entries : DataFrame = df.loc[df['timestamp'] > timestamp_lastResponse]
+    new_entries: DataFrame = append_driverResponse(db_service, 100, cursor_lastResponse)
 
     # Append entries to output list
     for idx, row in new_entries.iterrows():
@@ -52,16 +45,30 @@ def refresh(n_intervals: int) -> []:
         elif not row['button_unclear']:
             button_unclear_prev = False
 
-    # Update Delta Time
-    for row in table_data:
-        if row['Timestamp'] != '':
-            row['Delta'] = str((datetime.datetime.now() - datetime.datetime.strptime(row['Timestamp'],'%y/%m/%d, %H:%M:%S')))
-
-    # the latest timestamp is at position 0
-    timestamp_lastResponse = df['timestamp'][0]
+    # the latest entry is at position 0
+    if not new_entries.empty:
+        cursor_lastResponse = (float(new_entries['timestamp'][0]), int(new_entries['id'][0]))
 
     return table_data
 
+
+pump.subscribe('driver', fetch_responses)
+
+
+@dash.callback(
+    Output('driver_table', 'data'),
+    Input('interval-component', 'n_intervals'))
+def refresh(n_intervals: int) -> []:
+    pump.latest('driver')
+
+    # Update Delta Time
+    with pump.lock:
+        for row in table_data:
+            if row['Timestamp'] != '':
+                row['Delta'] = str((datetime.datetime.now() - datetime.datetime.strptime(row['Timestamp'],'%y/%m/%d, %H:%M:%S')))
+
+        return [dict(row) for row in table_data]
+
 def layout():
 
     return html.Div(
@@ -8,12 +8,15 @@ from db.db_service import DbService
 from pandas import DataFrame
 from frontend.styles import H1
 from frontend.settings import RELOAD_INTERVAL
+from frontend.data_pump import pump
 from db.load_data import append_error_data
 from utils.helpers import flatten_tree
 import datetime as dt
 
 dash.register_page(__name__, path="/errors", title="Errors")
 
+MAX_ERRORS = 500  # Latest errors shown on the page, older ones are dropped
+
 # List of tracked modules and their heartbeats. Append here.
 module_errors = {
     "vcu": VcuError,
@@ -24,7 +27,14 @@ module_errors = {
     "dsensors": DsensorsError,
 }
 
+# Message of each error code
 _, error_types, _ = flatten_tree(path = "error-tree.yaml")
+error_messages = {error_type["id"]: error_type["message"] for error_type in error_types}
+
+# Global variable
+cursors = {}  # (timestamp, id) of the latest loaded error of each module
+errors = DataFrame()  # Latest errors of all modules (newest first), at most MAX_ERRORS
+error_data = []  # Rows of the error table, built from 'errors'
 
 
 def initialize_data() -> tuple:
@@ -34,30 +44,57 @@ def initialize_data() -> tuple:
     return error_data
 
 
+def error_rows(errors: DataFrame) -> []:
+    # Rows of the error table, in the order of the errors
+    local_tz = dt.datetime.now().astimezone().tzinfo
+    additional_data = errors["additional_data"]
+    rows = DataFrame({
+        "module": errors["module"],
+        "error message": errors["err_code"].map(error_messages).fillna("Unknown error code"),
+        "time": errors["timestamp_dt"].dt.tz_convert(local_tz).dt.strftime("%Y-%m-%d %H:%M:%S"),
+        "additional data": additional_data.astype(str).where(additional_data != 0, ''),
+    })
+    return rows.to_dict('records')
+
+
+def fetch_errors(db_serv: DbService) -> []:
+    # Runs on the thread of the data pump. Only the errors logged since the previous fetch are loaded
+    global errors, error_data
+    new_errors = []
+    for key, value in module_errors.items():
+        cursor = cursors.get(key)
+        df = append_error_data(db_serv, value, MAX_ERRORS, cursor, limit=MAX_ERRORS)
+        if cursor is not None and len(df.index) == MAX_ERRORS:
+            # More errors were logged since the last fetch than are shown, skip to the latest ones
+            df = append_error_data(db_serv, value, MAX_ERRORS)
+        if df.empty:
+            continue
+
+        # the latest entry is at position 0
+        cursors[key] = (float(df['timestamp'][0]), int(df['id'][0]))
+        df.insert(1, 'module', key)
+        new_errors.append(df)
+
+    if new_errors:
+        errors = (pd.concat([errors] + new_errors, ignore_index=True)
+                  .sort_values(by='timestamp', ascending=False, kind='stable')
+                  .head(MAX_ERRORS)
+                  .reset_index(drop=True))
+        error_data = error_rows(errors)
+
+    return error_data
+
+
+pump.subscribe('errors', fetch_errors)
+
+
 @dash.callback(
-    Output('error-table', 'data'), 
+    Output('error-table', 'data'),
     Input('interval-component', 'n_intervals'),
     )
 def refresh_data(n):
-    db_serv: DbService = DbService()
-    errors = DataFrame()
-    error_data = []
-    for key, value in module_errors.items():
-        df = append_error_data(db_serv, value, 100)
-        df.insert(1,'module',key)
-        errors = pd.concat([df, errors], ignore_index = True)
-
-    errors.sort_values(by='timestamp', ascending = False, inplace =True)
-    #errors = pd.DataFrame.to_dict(errors)
-    #print(errors)
-
-    for index, error in errors.iterrows():
-        #print(error)
-        error_data.append({"module": error["module"], 
-                           "error message": next(error_type["message"] for error_type in error_types if error_type["id"] == error["err_code"]),
-                           "time": dt.datetime.fromtimestamp(error["timestamp"]).strftime("%Y-%m-%d %H:%M:%S"), 
-                           "additional data": ['', error["additional_data"]][error["additional_data"]!=0],})
-    return error_data
+    # The table rows are built by the data pump whenever new errors arrive
+    return pump.latest('errors') or initialize_data()
 
 
 def layout():
@@ -0,0 +1,61 @@
+import time
+
+import dash
+from dash import html, dcc, dash_table, Output, Input
+
+from db.live import store, subscriber
+from db.load_data import preprocess_values
+from frontend import styles
+from frontend.settings import LIVE_INTERVAL
+
+dash.register_page(__name__, path="/live", title="Live")
+
+########################################################################################################################
+# Latest values published by the logger, see db/live.py. Read from memory only, the DB is not queried. The values are
+# rescaled per topic like the entries loaded from the DB, see db/load_data.py
+########################################################################################################################
+
+
+@dash.callback(
+    [Output('live_topics', 'options'),
+     Output('live_table', 'data')],
+    [Input('live-interval-component', 'n_intervals'),
+     Input('live_topics', 'value')])
+def refresh(n_intervals: int, topics: []):
+    subscriber.start()  # Receive in the process that serves the dashboard
+
+    now = time.time()
+    rows = []
+    for topic in topics or []:
+        frame = store.latest(topic)
+        if frame is None:
+            continue
+
+        timestamp, values = frame
+        for field, value in preprocess_values(topic, timestamp, values).items():  # Same units as the other pages
+            rows.append({'Topic': topic,
+                         'Field': field,
+                         'Value': value,
+                         'Age [ms]': '%d' % ((now - timestamp) * 1e3)})
+
+    return store.topics(), rows
+
+
+def layout():
+
+    return html.Div(
+        children=[
+            html.H1('Live', style=styles.H1, className='text-center'),
+            dcc.Dropdown(id='live_topics', options=[], value=[], multi=True, placeholder='Select topics'),
+            html.Br(),
+            dash_table.DataTable(
+                id='live_table',
+                data=[],
+                style_table=styles.TABLE,
+                style_cell=styles.TABLE_CELL,
+                style_as_list_view=True),
+            dcc.Interval(
+                id='live-interval-component',
+                interval=LIVE_INTERVAL,
+            )
+    ])
@@ -1,42 +1,45 @@
 import dash
-import plotly.express as px
 import dash_bootstrap_components as dbc
 
-from dash import html, dcc, Input, Output
+from dash import html, dcc, Input, Output, State
 
 from db.db_service import DbService
-from pandas import DataFrame
+from frontend import plot_data
 from frontend.styles import H1, H2
 from frontend.settings import RELOAD_INTERVAL
-import plotly.graph_objs as go
+from frontend.data_pump import pump
 
-import db.load_data
+from db.load_data import append_mppt_power0_data, append_mppt_power1_data, append_mppt_power2_data, \
+    load_mppt_status_data_latest
 
 dash.register_page(__name__, path="/mppt", title="MPPT")
 
+MPPTS = [0, 1, 2]  # Displayed MPPTs
+STATUS_FIELDS = {"Mode:": "mode", "Fault:": "fault", "Enabled:": "enabled", "Ambient Temp.:": "ambient_temp",
+                 "Heatsink Temp.:": "heatsink_temp"}
 
-def v_i_graph(df: DataFrame):
-    fig: go.Figure  = px.line(df,
-                            title="Voltage & Current",
-                            template="plotly_white",
-                            x="timestamp_dt",
-                            y=["v_in", "i_in", "v_out", "i_out"],
-                            ).update_yaxes(range=[0, 15])
-    fig.update_layout(xaxis_title='Timestamp')
-    return fig
-
-
-def power_graph(df: DataFrame):
-    fig: go.Figure = px.line(df,
-                        title="Power",
-                        template="plotly_white",
-                        x="timestamp_dt",
-                        y=["p_in", "p_out"]
-                        ).update_yaxes(range=[0, 15])
-    fig.update_layout(xaxis_title='Timestamp')
-    return fig
-
-def disp_mppt(power_df: DataFrame, stat) -> html.Div:
+
+def fetch_mppt_data(db_serv: DbService):
+    power = (append_mppt_power0_data(db_serv, 100), append_mppt_power1_data(db_serv, 100),
+             append_mppt_power2_data(db_serv, 100))
+    return power, load_mppt_status_data_latest(db_serv)
+
+
+pump.subscribe('mppt', fetch_mppt_data)
+
+
+def v_i_graph(mppt: int):
+    return dcc.Graph(id="mppt-v-i-%d" % mppt, figure=plot_data.live_figure(
+        "Voltage & Current", ["v_in", "i_in", "v_out", "i_out"], yaxis_range=[0, 15]))
+
+
+def power_graph(mppt: int):
+    return dcc.Graph(id="mppt-power-%d" % mppt, figure=plot_data.live_figure(
+        "Power", ["p_in", "p_out"], yaxis_range=[0, 15]))
+
+
+def disp_mppt(mppt: int) -> html.Div:
+    # The layout is sent once, the callback only updates the status values and extends the graphs
     return html.Div([
         dbc.Row([
             dbc.Col([html.H3("Status")], className="col-3"),
@@ -45,34 +48,17 @@ def disp_mppt(power_df: DataFrame, stat) -> html.Div:
         dbc.Row([
             dbc.Col([
                 dbc.Row([
-                    dbc.Col(html.P("Mode:")),
-                    dbc.Col(html.P(stat.mode))
-                ]),
-                dbc.Row([
-                    dbc.Col(html.P("Fault:")),
-                    dbc.Col(html.P(stat.fault))
-                ]),
-                dbc.Row([
-                    dbc.Col(html.P("Enabled:")),
-                    dbc.Col(html.P(stat.enabled))
-                ]),
-                dbc.Row([
-                    dbc.Col(html.P("Ambient Temp.:")),
-                    dbc.Col(html.P(stat.ambient_temp))
-                ]),
-                dbc.Row([
-                    dbc.Col(html.P("Heatsink Temp.:")),
-                    dbc.Col(html.P(stat.heatsink_temp))
-                ])
+                    dbc.Col(html.P(label)),
+                    dbc.Col(html.P(id="mppt-%s-%d" % (field, mppt)))
+                ]) for label, field in STATUS_FIELDS.items()
             ], className="col-3"),
             dbc.Col([
                 dbc.Row([
                     dbc.Col([
-                        dcc.Graph(figure=v_i_graph(power_df)),
+                        v_i_graph(mppt),
                     ]),
                     dbc.Col([
-                        dcc.Graph(figure=power_graph(power_df),
-                                  )
+                        power_graph(mppt),
                     ])
                 ])
             ]),
@@ -80,34 +66,50 @@ def disp_mppt(power_df: DataFrame, stat) -> html.Div:
     ])
 
 
-@dash.callback(Output('live-update-div-mppt', 'children'), Input('interval-component', 'n_intervals'))
-def refresh_data(n):
-    db_serv: DbService = DbService()
-
-    try:
-        (power_df0, power_df1, power_df2) = load_mppt_power(db_serv, 100)
-        (stat0, stat1, stat2) = load_mppt_status_data(db_serv)
-
-        return html.Div([
-            html.H1(["MPPT"], style=H1, className="text-center"),
-            html.H2(["MPPT 0"], style=H2, className="text-center"),
-            disp_mppt(power_df0, stat0),
-            html.Hr(),
-            html.H2(["MPPT 1"], style=H2, className="text-center"),
-            disp_mppt(power_df1, stat1),
-            html.Hr(),
-            html.H2(["MPPT 2"], style=H2, className="text-center"),
-            disp_mppt(power_df2, stat2),
-        ])
-    except:
+@dash.callback(
+    [Output("mppt-%s-%d" % (field, mppt), "children") for mppt in MPPTS for field in STATUS_FIELDS.values()] +
+    [Output("mppt-v-i-%d" % mppt, "extendData") for mppt in MPPTS] +
+    [Output("mppt-power-%d" % mppt, "extendData") for mppt in MPPTS] +
+    [Output("mppt-cursors", "data")],
+    Input('interval-component', 'n_intervals'),
+    State("mppt-cursors", "data"))
+def refresh_data(n, cursors):
+    data = pump.latest('mppt')
+    if data is None:
         print("Err: Couldn't load MPPT Tables")
+        return [dash.no_update] * (len(MPPTS) * (len(STATUS_FIELDS) + 2) + 1)
+
+    power_dfs, stats = data
+    cursors = cursors or {}
 
-        return html.Div(html.H2("Data load failed", className="text-center"))
+    status = []
+    for mppt in MPPTS:
+        stat = stats[mppt]
+        status += [getattr(stat, field) if stat is not None else 'n/a' for field in STATUS_FIELDS.values()]
+
+    v_i, power = [], []
+    for mppt in MPPTS:
+        extend, (cursors["v_i_%d" % mppt],) = plot_data.extend_traces(
+            [(power_dfs[mppt], ["v_in", "i_in", "v_out", "i_out"])], [cursors.get("v_i_%d" % mppt)])
+        v_i.append(extend)
+
+        extend, (cursors["power_%d" % mppt],) = plot_data.extend_traces(
+            [(power_dfs[mppt], ["p_in", "p_out"])], [cursors.get("power_%d" % mppt)])
+        power.append(extend)
+
+    return status + v_i + power + [cursors]
 
 
 def layout():
+    children = [html.H1(["MPPT"], style=H1, className="text-center")]
+    for mppt in MPPTS:
+        if mppt != MPPTS[0]:
+            children.append(html.Hr())
+        children += [html.H2(["MPPT %d" % mppt], style=H2, className="text-center"), disp_mppt(mppt)]
+
     return html.Div([
-        html.Div(id='live-update-div-mppt'),
+        html.Div(id='live-update-div-mppt', children=children),
+        dcc.Store(id="mppt-cursors"),  # Newest timestamp sent to each graph of this page
         dcc.Interval(
             id='interval-component',
             interval=RELOAD_INTERVAL,
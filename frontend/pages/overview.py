@@ -1,11 +1,14 @@
 import time
 import dash
-from dash import html, dcc, Input, Output, dash_table
-import plotly.express as px
+from dash import html, dcc, Input, Output, State, ALL, dash_table
 
 import frontend.styles as styles
+from frontend import plot_data
 from frontend.settings import RELOAD_INTERVAL
+from frontend.data_pump import pump
 from db.load_data import *
+from db.live import liveness, store, subscriber
+from db.liveness import MODULES
 from .. import Table
 from ..Data_Section import DataSection
 
@@ -15,29 +18,29 @@ dash.register_page(__name__, path="/", title="Overview")
 # Activity monitoring
 ########################################################################################################################
 
-max_idle_time = datetime.timedelta(seconds=2)  # Time allowed until a module is flagged as inactive. In seconds
-
-# List of tracked modules and their heartbeats. Append / update here.
-module_heartbeats = {
-    "vcu": VcuHeartbeat,
-    "icu": IcuHeartbeat,
-    "mppt0": MpptStatus0,
-    "mppt1": MpptStatus1,
-    "mppt2": MpptStatus2,
-    "mppt3": MpptStatus3,
-    "bms": BmsHeartbeat,
-    "stwheel": StwheelHeartbeat,
-    "tele": TeleSolarHeartbeat,
-    "sensors": DsensorsHeartbeat,
-    "logger": LoggerHeartbeat,
-}
+# The liveness of the modules is tracked from the live messages of the logger, see db/liveness.py. The tracked modules
+# are listed in 'MODULES' of db/liveness.py
 
 ########################################################################################################################
 # Layout
 ########################################################################################################################
-graphs = []  # Will be filled in the function 'initialize_data' and updated by 'refresh_page'
 dataSection = DataSection(timespan_loaded=datetime.timedelta(minutes=5), max_time_offset=datetime.timedelta(minutes=1))
 
+
+def fetch_data(db_serv: DbService) -> None:
+    # Runs on the thread of the data pump, which holds 'pump.lock' while the data section is updated
+    dataSection.refresh_append(db_serv, 100)
+
+    if not subscriber.receiving or not store.topics():
+        # No live messages (e.g. the logger doesn't publish them), track the latest heartbeats in the DB instead
+        for model, entry in db_serv.latest_many(list(MODULES.values())).items():
+            if entry is not None:
+                liveness.seen(model.__tablename__, entry.timestamp)
+    liveness.check(time.time())
+
+
+pump.subscribe('overview', fetch_data)
+
 def initialize_data() -> tuple:
     """Produces the default data to be displayed before the page is refreshed"""
 
@@ -53,79 +56,112 @@ def initialize_data() -> tuple:
     ]
 
     # Module Table
-    module_table = [{'': 'Status'}]
-    for m in module_heartbeats:
+    module_table = [{'': 'Status'}, {'': 'Rate [Hz]'}]
+    for m in MODULES:
         module_table[0].update({m: 'No Data'})
+        module_table[1].update({m: ''})
 
     return main_table, module_table, None
 
 
 @dash.callback(
     Output("main_table", "active_cell"),
-    Input("main_table", "active_cell")
+    Output("overview_selected", "data"),
+    Input("main_table", "active_cell"),
+    State("overview_selected", "data")
 )
-def update_selected_rows(active_cell: {}):
-    # Toggles the 'selected' variable of a given Table.DataRow, if the user selected it. 'Consumes' the reference to the
-    # active cell, in the sense that it is set to None
+def update_selected_rows(active_cell: {}, selected: []):
+    # Toggles the selection of a given Table.DataRow, if the user selected it. 'Consumes' the reference to the active
+    # cell, in the sense that it is set to None. The selection is stored in the browser, since the data section is
+    # shared by all sessions
+    selected = selected or []
     if active_cell is not None:
         row = dataSection.table_layout[active_cell['row']]
         if type(row) == Table.DataRow:
-            row.selected ^= True  # Toggle row Selected
+            # Toggle row Selected
+            if active_cell['row'] in selected:
+                selected = [index for index in selected if index != active_cell['row']]
+            else:
+                selected = selected + [active_cell['row']]
+
+    return None, selected  # Reset the active cell
+
+
+@dash.callback(
+    Output('graphs', 'children'),
+    Input('overview_selected', 'data'))
+def draw_graphs(selected: []):
+    # Draws the graphs of the selected rows with the loaded data. 'refresh_page' then only extends them by new points
+    graphs_out = []
+
+    with pump.lock:
+        for index in selected or []:
+            row = dataSection.table_layout[index]
+            df = dataSection.table_data[row.df_name].df
+            if df is not None and not df.empty:
+                figure = plot_data.line_figure(df, row.title, row.df_col)
+                cursor = float(df['timestamp'].iloc[0])
+            else:
+                figure = plot_data.live_figure(row.title, [row.df_col], x_title='timestamp_dt')
+                cursor = None
 
-    refresh_page(0)  # Refresh view
+            graphs_out.append(dcc.Graph(id={'type': 'overview_graph', 'index': index}, figure=figure))
+            # Newest timestamp sent to the graph
+            graphs_out.append(dcc.Store(id={'type': 'overview_cursor', 'index': index}, data=cursor))
 
-    return None  # Reset the active cell
+    return graphs_out
 
 
 @dash.callback(
     Output('main_table', 'data'),
     Output('module-table', 'data'),
-    Output('graphs', 'children'),
-    Input('interval-component', 'n_intervals'))  # Triggers after the time interval is over
-def refresh_page(n_intervals: int):
-    """Refreshes the data in the tables & graph
+    Output({'type': 'overview_graph', 'index': ALL}, 'extendData'),
+    Output({'type': 'overview_cursor', 'index': ALL}, 'data'),
+    Input('interval-component', 'n_intervals'),  # Triggers after the time interval is over
+    State({'type': 'overview_cursor', 'index': ALL}, 'data'),
+    State({'type': 'overview_cursor', 'index': ALL}, 'id'))
+def refresh_page(n_intervals: int, cursors: [], cursor_ids: []):
+    """Refreshes the data in the tables & extends the graphs
     Args:
         n (int): unused
+        cursors (list): Newest timestamp sent to each graph
+        cursor_ids (list): Ids of the cursors, their index is the row of the graph in the main table
 
     Returns:
         tuple: Updated data
     """
 
-    db_serv: DbService = DbService()
     main_table = []
-    graphs_out = []
+    extend_out = []
+    cursors_out = []
 
-    # Refresh table data
-    dataSection.refresh_append(db_serv, 100)
+    # The table data is refreshed by the data pump, shared by all open pages
+    subscriber.start()  # Receive the live messages in the process that serves the dashboard
+    pump.latest('overview')
 
     # Refresh table layout
-    for row in dataSection.table_layout:
-        main_table.append(row.get_row())
+    with pump.lock:
+        for row in dataSection.table_layout:
+            main_table.append(row.get_row())
 
-        # Draw graphs of selected rows
-        if type(row) == Table.DataRow and row.selected:
+        # Extend the graphs of selected rows by the rows loaded since the last interval
+        for cursor, cursor_id in zip(cursors, cursor_ids):
+            row = dataSection.table_layout[cursor_id['index']]
             df = dataSection.table_data[row.df_name].df
-            if df is not None and not df.empty:
-                graphs_out.append(dcc.Graph(
-                    figure=px.line(df, title=row.title, template='plotly_white', x='timestamp_dt', y=row.df_col)))
-            else:
-                graphs_out.append(html.Br())
-                graphs_out.append(html.Br())
-                graphs_out.append(html.H3('No Data available for "%s"' % row.title, style=styles.H3))
+            extend, (cursor,) = plot_data.extend_traces([(df, [row.df_col])], [cursor],
+                                                        max_points=plot_data.MAX_POINTS)
+            extend_out.append(extend)
+            cursors_out.append(cursor)
 
     # Refresh module table
-    module_table = [{'': 'Status'}]
-    for m in module_heartbeats:
-        module_table[0].update({m: 'n/a'})
-
-        entry = db_serv.latest(module_heartbeats[m])
-
-        if entry is not None:
-            # check if the last data entry is more than max_idle_time ago
-            if (int(time.time()) - entry.timestamp) < max_idle_time.total_seconds():
-                module_table[0].update({m: 'ACTIVE'})
+    now = time.time()
+    module_table = [{'': 'Status'}, {'': 'Rate [Hz]'}]
+    for m in MODULES:
+        active = liveness.is_active(m, now)
+        module_table[0].update({m: 'ACTIVE' if active else 'n/a'})
+        module_table[1].update({m: '%.1f' % liveness.modules[m].rate() if active else ''})
 
-    return main_table, module_table, graphs_out
+    return main_table, module_table, extend_out, cursors_out
 
 
 def layout() -> html.Div:
@@ -160,6 +196,7 @@ def layout() -> html.Div:
                 style_as_list_view=True,
                 style_data_conditional=styles.TABLE_DATA_CONDITIONAL),
             html.Div(id='graphs', children=graphs),
+            dcc.Store(id='overview_selected', storage_type='session', data=[]),
             dcc.Interval(
                 id='interval-component', interval=RELOAD_INTERVAL, n_intervals=0
             ),
@@ -0,0 +1,84 @@
+import datetime
+
+import dash
+import plotly.graph_objects as go
+import dash_mantine_components as dmc
+from dash import html, dcc, dash_table, Output, Input
+
+from db.profiling import profiler, HISTOGRAM_EDGES
+from frontend import styles
+from frontend.settings import RELOAD_INTERVAL
+
+dash.register_page(__name__, path="/profiling", title="Profiling")
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+TOP_N = 10  # Number of statements shown per table
+
+STATEMENT_CELL = [
+    {'if': {'column_id': 'Statement'},
+     'width': '45%', 'textAlign': 'left', 'whiteSpace': 'normal', 'font-family': 'monospace', 'font-size': '11px'},
+    {'if': {'column_id': 'Caller'},
+     'width': '20%', 'textAlign': 'left'},
+]
+
+
+def get_histogram() -> go.Figure:
+    # Bar chart of the statement durations of all callers
+    labels = ['< %d ms' % edge for edge in HISTOGRAM_EDGES] + ['> %d ms' % HISTOGRAM_EDGES[-1]]
+    figure = go.Figure(go.Bar(x=labels, y=profiler.histogram(), marker_color=styles.COLOR_SELECTED))
+    figure.update_layout(template='plotly_white', title='Statement Durations', yaxis_title='Statements')
+    return figure
+
+
+def get_table(by: str) -> []:
+    return [stats.as_dict() for stats in profiler.top(TOP_N, by)]
+
+
+@dash.callback(
+    [Output('profiling_since', 'children'),
+     Output('profiling_histogram', 'figure'),
+     Output('profiling_slowest', 'data'),
+     Output('profiling_total', 'data'),
+     Output('profiling_frequent', 'data')],
+    [Input('interval-component', 'n_intervals'),
+     Input('profiling_reset', 'n_clicks')])
+def refresh(n_intervals: int, n_clicks: int):
+    if dash.ctx.triggered_id == 'profiling_reset':
+        profiler.reset()
+
+    since = 'Recorded since %s' % datetime.datetime.fromtimestamp(profiler.since).strftime('%y/%m/%d, %H:%M:%S')
+    return since, get_histogram(), get_table('mean_time'), get_table('total_time'), get_table('count')
+
+
+def statement_table(table_id: str) -> dash_table.DataTable:
+    return dash_table.DataTable(
+        id=table_id,
+        data=[],
+        style_table=styles.TABLE,
+        style_cell=styles.TABLE_CELL,
+        style_cell_conditional=STATEMENT_CELL,
+        style_as_list_view=True)
+
+
+def layout():
+
+    return html.Div(
+        children=[
+            html.H1('Profiling', style=styles.H1, className='text-center'),
+            html.P(id='profiling_since'),
+            dmc.Button('Reset', id='profiling_reset', variant='outline'),
+            dcc.Graph(id='profiling_histogram'),
+            html.H2('Slowest Statements (Mean)', style=styles.H2),
+            statement_table('profiling_slowest'),
+            html.H2('Most Time Spent (Total)', style=styles.H2),
+            statement_table('profiling_total'),
+            html.H2('Most Frequent Statements', style=styles.H2),
+            statement_table('profiling_frequent'),
+            dcc.Interval(
+                id='interval-component',
+                interval=RELOAD_INTERVAL,
+            )
+    ])
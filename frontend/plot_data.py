@@ -0,0 +1,126 @@
+"""
+Data layer of the graphs: series are reduced to about twice the width of a graph in pixels before they are sent to the
+browser, so graphs stay responsive for any range. Zooming into a graph re-fetches the visible window in full detail,
+see 'visible_range' and 'load_window'.
+
+Live graphs are sent once without data ('live_figure') and then only extended by the new points of each interval
+('extend_traces'), instead of sending the whole figure again.
+"""
+import datetime
+
+import dash
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objs as go
+
+from pandas import DataFrame
+from typing import List, Optional, Sequence, Tuple, Union
+
+from db.db_service import DbService
+from db.downsampling import lttb_indices, minmax_indices
+from frontend.Table import TableDataFrame
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+MAX_POINTS = 2000  # Points per series sent to the browser, about twice the width of a graph in pixels
+DECIMATION = 'minmax'  # 'minmax' keeps the extremes of each bucket (spikes), 'lttb' the visual shape of the series
+LIVE_POINTS = 300  # Points per trace kept by the live graphs, older points are dropped by the browser
+
+AUTORANGE = 'autorange'  # Returned by 'visible_range' if the user reset the zoom
+
+
+def decimate(df: DataFrame, y: str, n_points: int = MAX_POINTS, method: str = DECIMATION) -> DataFrame:
+    # Returns at most n_points rows of a DataFrame ordered by timestamp, selected by min/max or LTTB decimation of y
+    if df is None or len(df.index) <= n_points:
+        return df
+    if method not in ('minmax', 'lttb'):
+        raise ValueError("Unknown decimation '%s', expected 'minmax' or 'lttb'" % method)
+
+    select = minmax_indices if method == 'minmax' else lttb_indices
+    return df.iloc[select(df['timestamp'].values, df[y].values, n_points)]
+
+
+def line_figure(df: DataFrame, title: str, y: str, n_points: int = MAX_POINTS, **kwargs) -> go.Figure:
+    # Line graph of a column over 'timestamp_dt', decimated to n_points. Further arguments are passed to px.line
+    figure = px.line(decimate(df, y, n_points), title=title, template='plotly_white', x='timestamp_dt', y=y, **kwargs)
+    figure.update_layout(uirevision=title)  # Keep the zoom of the user when the figure is replaced
+    return figure
+
+
+def visible_range(relayout_data: Union[dict, None]) -> Union[Tuple[str, str], str, None]:
+    # Returns the visible x range ('start', 'end') after the user zoomed or panned a graph, AUTORANGE if the user reset
+    # the zoom and None for all other changes of the layout
+    if not relayout_data:
+        return None
+    if relayout_data.get('xaxis.autorange'):
+        return AUTORANGE
+    if 'xaxis.range[0]' in relayout_data:
+        return relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']
+    if 'xaxis.range' in relayout_data:
+        return tuple(relayout_data['xaxis.range'])
+    return None
+
+
+def _to_datetime(value: str) -> datetime.datetime:
+    # The graphs show 'timestamp_dt' in UTC. The load functions expect naive datetimes in local time
+    return datetime.datetime.fromtimestamp(pd.Timestamp(value).tz_localize(None).tz_localize('UTC').timestamp())
+
+
+def load_window(table: TableDataFrame, start: str, end: str, n_points: int = MAX_POINTS) -> Optional[DataFrame]:
+    # Loads a zoomed window of a table in full detail (up to n_points rows). Tables that are computed from other tables
+    # can't be loaded, their loaded rows within the window are returned instead
+    start_time, end_time = _to_datetime(start), _to_datetime(end)
+
+    with DbService() as db_serv:
+        df = table.loader(start_time, end_time, n_points)(db_serv)
+
+    if (df is None or df.empty) and table.df is not None:
+        in_window = table.df['timestamp'].between(start_time.timestamp(), end_time.timestamp())
+        df = table.df[in_window]
+    return df
+
+
+def heatmap_figure(x, y: Sequence[str], z, title: str, **layout) -> go.Figure:
+    # Heatmap of a matrix z with one row per label of y and one column per value of x. Further arguments update the
+    # layout
+    figure = go.Figure(go.Heatmap(x=x, y=y, z=z, colorscale='Viridis'))
+    figure.update_layout(title=title, template='plotly_white', uirevision=title, **layout)
+    return figure
+
+
+def live_figure(title: str, names: Sequence[str], x_title: str = 'Timestamp', **layout) -> go.Figure:
+    # Empty line graph with one trace per name, filled by 'extend_traces'. Further arguments update the layout
+    figure = go.Figure([go.Scatter(x=[], y=[], mode='lines', name=name) for name in names])
+    figure.update_layout(title=title, template='plotly_white', xaxis_title=x_title, uirevision=title, **layout)
+    return figure
+
+
+def extend_traces(groups: Sequence[Tuple[Optional[DataFrame], Sequence[str]]], cursors: Optional[List[float]],
+                  max_points: int = LIVE_POINTS) -> Tuple[any, List[Optional[float]]]:
+    # Returns the 'extendData' of a live graph and the new cursors. The traces of the graph are the columns of the
+    # groups in order, each group is a DataFrame ordered by timestamp (newest first) with the columns to plot. Only the
+    # rows newer than the cursor of their group (the newest timestamp sent so far) are sent
+    cursors = cursors or [None] * len(groups)
+    xs, ys, traces = [], [], []
+    new_cursors = []
+
+    trace = 0
+    for (df, cols), cursor in zip(groups, cursors):
+        if df is not None and not df.empty:
+            new_rows = (df if cursor is None else df[df['timestamp'] > cursor]).iloc[::-1]
+            if not new_rows.empty:
+                cursor = float(new_rows['timestamp'].iloc[-1])
+                x = new_rows['timestamp_dt'].tolist()
+                for offset, col in enumerate(cols):
+                    xs.append(x)
+                    ys.append(new_rows[col].tolist())
+                    traces.append(trace + offset)
+
+        trace += len(cols)
+        new_cursors.append(cursor)
+
+    if not traces:
+        return dash.no_update, new_cursors
+    return (dict(x=xs, y=ys), traces, max_points), new_cursors
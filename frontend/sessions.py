@@ -0,0 +1,62 @@
+"""
+State of the dashboard per browser session, e.g. the data loaded into the Analyzer. Each session is identified by the
+random id in the store 'session_id' of the app layout (see dashboard.py), which lives as long as the browser tab.
+
+All sessions of a page share one memory budget. If it is exceeded, the data of the least recently used sessions is
+dropped; such a session starts empty again. Loading the same range in several sessions queries the DB only once, since
+the queries are cached process-wide (see db/query_cache.py and db/interval_cache.py).
+"""
+import threading
+import uuid
+
+from collections import OrderedDict
+from typing import Callable, Generic, Optional, TypeVar
+
+########################################################################################################################
+# Configuration Parameters
+########################################################################################################################
+
+MAX_BYTES = 512 * 2 ** 20  # Memory budget of the sessions of a page
+MAX_SESSIONS = 50  # Sessions kept per page, regardless of their memory
+
+SESSION_ID = 'session_id'  # Id of the store holding the session id
+
+State = TypeVar('State')
+
+
+def new_session_id() -> str:
+    return str(uuid.uuid4())
+
+
+class SessionStore(Generic[State]):
+    """ State of each session of a page, created on first use. The state must provide 'memory_usage()' in bytes."""
+
+    def __init__(self, create: Callable[[], State], max_bytes: int = MAX_BYTES, max_sessions: int = MAX_SESSIONS):
+        self.create = create
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+
+        self._states: OrderedDict = OrderedDict()  # session id -> state, least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, session_id: Optional[str]) -> State:
+        """ Returns the state of a session. Sessions without an id (e.g. the store is not initialized yet) share one
+            state"""
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                state = self._states[session_id] = self.create()
+            self._states.move_to_end(session_id)
+            return state
+
+    def evict(self) -> None:
+        """ Drop the least recently used sessions until the sessions fit into the budget. Call this after loading data
+            into a session. The most recently used session is always kept."""
+        with self._lock:
+            sizes = {session_id: state.memory_usage() for session_id, state in self._states.items()}
+            total = sum(sizes.values())
+
+            while len(self._states) > 1 and (total > self.max_bytes or len(self._states) > self.max_sessions):
+                session_id, _ = self._states.popitem(last=False)
+                total -= sizes[session_id]
+                print("Dropped the data of dashboard session %s to free memory" % session_id)
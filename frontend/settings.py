@@ -1 +1,2 @@
 RELOAD_INTERVAL = 2*1000
+LIVE_INTERVAL = 100  # [ms] Refresh interval of the live page, which reads from memory only
@@ -9,6 +9,9 @@ def sidebar():
                 # home
                 dbc.NavLink(html.I(className="bi bi-house fs-4"), id="home-tt",
                             href="/", active="exact"),
+                # Live
+                dbc.NavLink(html.I(className="bi bi-broadcast fs-4"), id="live-tt",
+                            href="/live", active="exact"),
                 # Driver
                 dbc.NavLink(html.I(className="bi bi-chat-right-dots"), id="driver-tt",
                         href="/driver", active="exact"),
@@ -26,7 +29,10 @@ def sidebar():
                             href="/errors", active="exact"),
                 # Analyzer
                 dbc.NavLink(html.I(className="bi bi-graph-up"), id="analyzer-tt",
-                            href="/analyzer", active="exact")
+                            href="/analyzer", active="exact"),
+                # Profiling
+                dbc.NavLink(html.I(className="bi bi-speedometer2"), id="profiling-tt",
+                            href="/profiling", active="exact")
                 ],
                 vertical=True,
                 pills=True,
@@ -35,6 +41,10 @@ def sidebar():
             "Overview",
             target="home-tt",
         ),
+        dbc.Tooltip(
+            "Live Values",
+            target="live-tt",
+        ),
        dbc.Tooltip(
            "Driver Responses",
            target="driver-tt",
@@ -58,5 +68,9 @@ def sidebar():
         dbc.Tooltip(
             "Analyzer",
             target="analyzer-tt",
+        ),
+        dbc.Tooltip(
+            "DB Query Profiling",
+            target="profiling-tt",
         )
     ], style=SIDEBAR_STYLE,)
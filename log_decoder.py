@@ -159,6 +159,8 @@ class LogFileParser(LogParser):
 
         print("Committing to database, may take a moment...")
         self.db.commit_session()
+        print("Updating rollups...")
+        self.db.update_rollups()
         print("done")
 
 
@@ -205,6 +207,8 @@ class LogEventHandler(FileSystemEventHandler, LogParser):
                         self.db.commit_session()
                         self.old_line_number += 1
 
+                self.db.update_rollups()
+
 
 if __name__ == "__main__":
     arg_parser = argparse.ArgumentParser(description="Manage database connection")
@@ -4,6 +4,7 @@ and do not exceed CAN message size.
 """
 
 import os
+import argparse
 import fnmatch
 
 from utils import helpers
@@ -119,7 +120,7 @@ def validate_tree() -> bool:
     return True
 
 
-def write_tree_to_fs():
+def write_tree_to_fs(timestamp_us: bool = False):
     env = Environment(loader=FileSystemLoader("templates/"))
     env.globals["helpers"] = helpers
     ids, topics, topics_dict = helpers.flatten_tree()
@@ -167,6 +168,7 @@ def write_tree_to_fs():
         content = template.render(
             topics=topics,
             type_lookup=type_lookup,
+            timestamp_us=timestamp_us,
         )
 
         with open("db/models.py", mode="w", encoding="utf-8") as results:
@@ -177,9 +179,22 @@ def write_tree_to_fs():
     generate_model_file()
 
 
+def _create_base_argument_parser(parser: argparse.ArgumentParser) -> None:
+    """Adds common options to an argument parser."""
+    parser.add_argument(
+        "--timestamp-us",
+        help=r"Store timestamps as integer microseconds instead of floating point seconds",
+        action="store_true",
+    )
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Source the message tree to the file system")
+    _create_base_argument_parser(parser)
+    results, unknown_args = parser.parse_known_args()
+
     if validate_tree():
-        write_tree_to_fs()
+        write_tree_to_fs(timestamp_us=results.timestamp_us)
     else:
         print("Done, ERROR state, invalid tree")
 
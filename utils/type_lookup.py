@@ -3,49 +3,56 @@ type_lookup = {
         "size": 32,
         "c_type": "float",
         "py_struct_t": "f",
-        "pysql_t": "Float",
+        "pysql_t": "Float32",
+        "np_t": "float32",
         "py_t": "float",
     },
     "data_u8": {
         "size": 8,
         "c_type": "uint8_t",
         "py_struct_t": "B",
-        "pysql_t": "Integer",
+        "pysql_t": "UInt8",
+        "np_t": "uint8",
         "py_t": "int",
     },
     "data_8": {
         "size": 8,
         "c_type": "int8_t",
         "py_struct_t": "b",
-        "pysql_t": "Integer",
+        "pysql_t": "Int8",
+        "np_t": "int8",
         "py_t": "int",
     },
     "data_u16": {
         "size": 16,
         "c_type": "uint16_t",
         "py_struct_t": "H",
-        "pysql_t": "Integer",
+        "pysql_t": "UInt16",
+        "np_t": "uint16",
         "py_t": "int",
     },
     "data_16": {
         "size": 16,
         "c_type": "int16_t",
         "py_struct_t": "h",
-        "pysql_t": "Integer",
+        "pysql_t": "Int16",
+        "np_t": "int16",
         "py_t": "int",
     },
     "data_u32": {
         "size": 32,
         "c_type": "uint32_t",
         "py_struct_t": "L",
-        "pysql_t": "Integer",
+        "pysql_t": "UInt32",
+        "np_t": "uint32",
         "py_t": "int",
     },
     "data_32": {
         "size": 32,
         "c_type": "int32_t",
         "py_struct_t": "l",
-        "pysql_t": "Integer",
+        "pysql_t": "Int32",
+        "np_t": "int32",
         "py_t": "int",
     },
 }